@@ -1,37 +1,40 @@
-from typing import List, Dict, Optional
+import os
+from typing import List, Dict, Optional, Sequence, Tuple
 from fastapi import HTTPException, status
+from sqlalchemy import delete, select, tuple_
 from sqlalchemy.orm import Session
 
-from models import Roles, BusinessElements, AccessRolesRules
-from business import get_role_ids_for_user, get_element_id, get_rules
+from models import Roles, RoleParents, BusinessElements, ElementGroups, AccessRolesRules
+from business import get_permission_mask
+from permissions import ancestors, FLAGS, READ_ALL, UPDATE_ALL
+from invalidation import rules_changed
 
+RULES_BULK_MAX = int(os.getenv("RULES_BULK_MAX", "5000"))
+# строк в одном INSERT ... ON CONFLICT (у Postgres лимит 65535 параметров)
+RULES_BULK_CHUNK = 1000
 
-def ensure_can_read_rules(db: Session, user_id: int) -> None:
-    role_ids = get_role_ids_for_user(db, user_id)
-    element_id = get_element_id(db, "rules")
-    rules = get_rules(db, role_ids, element_id)
-    if not rules or not any(r.read_all_permission for r in rules):
+
+def require_read_rules(mask: Optional[int]) -> None:
+    if not mask or not mask & READ_ALL:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Нет прав на просмотр правил")
 
 
-def ensure_can_update_rules(db: Session, user_id: int) -> None:
-    role_ids = get_role_ids_for_user(db, user_id)
-    element_id = get_element_id(db, "rules")
-    rules = get_rules(db, role_ids, element_id)
-    if not rules or not any(r.update_all_permission for r in rules):
+def require_update_rules(mask: Optional[int]) -> None:
+    if not mask or not mask & UPDATE_ALL:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Нет прав на изменение правил")
 
 
-def list_rules(
-    db: Session,
-    current_user_id: int,
-    role_name: Optional[str] = None,
-    element_code: Optional[str] = None,
-) -> List[Dict]:
-    ensure_can_read_rules(db, current_user_id)
+def ensure_can_read_rules(db: Session, user_id: int) -> None:
+    require_read_rules(get_permission_mask(db, user_id, "rules"))
+
+
+def ensure_can_update_rules(db: Session, user_id: int) -> None:
+    require_update_rules(get_permission_mask(db, user_id, "rules"))
+
 
+def rules_query(role_name: Optional[str] = None, element_code: Optional[str] = None):
     q = (
-        db.query(
+        select(
             AccessRolesRules.id,
             Roles.name,
             BusinessElements.code,
@@ -48,26 +51,74 @@ def list_rules(
     )
 
     if role_name:
-        q = q.filter(Roles.name == role_name)
+        q = q.where(Roles.name == role_name)
     if element_code:
-        q = q.filter(BusinessElements.code == element_code)
-
-    rows = q.all()
-    result = []
-    for r in rows:
-        result.append({
-            "id": r.id,
-            "role": r.name,
-            "element": r.code,
-            "read": r.read_permission,
-            "read_all": r.read_all_permission,
-            "create": r.create_permission,
-            "update": r.update_permission,
-            "update_all": r.update_all_permission,
-            "delete": r.delete_permission,
-            "delete_all": r.delete_all_permission,
-        })
-    return result
+        q = q.where(BusinessElements.code == element_code)
+    return q
+
+
+def rule_row_to_dict(r) -> Dict:
+    return {
+        "id": r.id,
+        "role": r.name,
+        "element": r.code,
+        "read": r.read_permission,
+        "read_all": r.read_all_permission,
+        "create": r.create_permission,
+        "update": r.update_permission,
+        "update_all": r.update_all_permission,
+        "delete": r.delete_permission,
+        "delete_all": r.delete_all_permission,
+    }
+
+
+def rule_to_dict(rule: AccessRolesRules, role: Roles, element: BusinessElements) -> Dict:
+    return {
+        "id": rule.id,
+        "role": role.name,
+        "element": element.code,
+        "read": rule.read_permission,
+        "read_all": rule.read_all_permission,
+        "create": rule.create_permission,
+        "update": rule.update_permission,
+        "update_all": rule.update_all_permission,
+        "delete": rule.delete_permission,
+        "delete_all": rule.delete_all_permission,
+    }
+
+
+def role_not_found(role_name: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Role '{role_name}' not found")
+
+
+def element_not_found(element_code: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Element '{element_code}' not found")
+
+
+def apply_flags(rule: Optional[AccessRolesRules], role_id: int, element_id: int, flags: Dict[str, Optional[bool]]) -> AccessRolesRules:
+    if rule is None:
+        # не переданные флаги остаются на server_default (false)
+        return AccessRolesRules(
+            role_id=role_id,
+            element_id=element_id,
+            **{f"{k}_permission": v for k, v in flags.items() if v is not None}
+        )
+    for k, v in flags.items():
+        if hasattr(rule, f"{k}_permission") and v is not None:
+            setattr(rule, f"{k}_permission", v)
+    return rule
+
+
+def list_rules(
+    db: Session,
+    current_user_id: int,
+    role_name: Optional[str] = None,
+    element_code: Optional[str] = None,
+) -> List[Dict]:
+    ensure_can_read_rules(db, current_user_id)
+
+    rows = db.execute(rules_query(role_name, element_code)).all()
+    return [rule_row_to_dict(r) for r in rows]
 
 
 def upsert_rule(
@@ -81,41 +132,170 @@ def upsert_rule(
 
     role = db.query(Roles).filter(Roles.name == role_name).first()
     if not role:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Role '{role_name}' not found")
+        raise role_not_found(role_name)
 
     element = db.query(BusinessElements).filter(BusinessElements.code == element_code).first()
     if not element:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Element '{element_code}' not found")
+        raise element_not_found(element_code)
 
     rule = db.query(AccessRolesRules).filter(
         AccessRolesRules.role_id == role.id,
         AccessRolesRules.element_id == element.id
     ).first()
 
-    if rule is None:
-        rule = AccessRolesRules(
-            role_id=role.id,
-            element_id=element.id,
-            **flags
-        )
+    new_rule = rule is None
+    rule = apply_flags(rule, role.id, element.id, flags)
+    if new_rule:
         db.add(rule)
-    else:
-        for k, v in flags.items():
-            if hasattr(rule, f"{k}_permission") and v is not None:
-                setattr(rule, f"{k}_permission", v)
 
     db.commit()
+    rules_changed()
     db.refresh(rule)
 
-    return {
-        "id": rule.id,
-        "role": role.name,
-        "element": element.code,
-        "read": rule.read_permission,
-        "read_all": rule.read_all_permission,
-        "create": rule.create_permission,
-        "update": rule.update_permission,
-        "update_all": rule.update_all_permission,
-        "delete": rule.delete_permission,
-        "delete_all": rule.delete_all_permission,
-    }
+    return rule_to_dict(rule, role, element)
+
+
+def _upsert_statement(dialect: str, rows: List[Dict], columns: Tuple[str, ...]):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        conflict = {"constraint": "uq_role_element"}
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        conflict = {"index_elements": ["role_id", "element_id"]}
+    else:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=f"Bulk upsert не поддерживается для {dialect}")
+    stmt = insert(AccessRolesRules).values(rows)
+    if not columns:
+        return stmt.on_conflict_do_nothing(**conflict)
+    return stmt.on_conflict_do_update(**conflict, set_={c: stmt.excluded[c] for c in columns})
+
+
+def bulk_upsert_rules(
+    db: Session,
+    current_user_id: int,
+    items: Sequence[Tuple[str, str, Dict[str, Optional[bool]]]],
+) -> List[Dict]:
+    if len(items) > RULES_BULK_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Не больше {RULES_BULK_MAX} правил за запрос"
+        )
+    ensure_can_update_rules(db, current_user_id)
+
+    role_names = {role for role, _, _ in items}
+    element_codes = {element for _, element, _ in items}
+    roles = dict(db.execute(select(Roles.name, Roles.id).where(Roles.name.in_(role_names))).all()) if items else {}
+    elements = dict(db.execute(
+        select(BusinessElements.code, BusinessElements.id).where(BusinessElements.code.in_(element_codes))
+    ).all()) if items else {}
+
+    results: List[Optional[Dict]] = [None] * len(items)
+    keys: List[Optional[Tuple[int, int]]] = [None] * len(items)
+    # повторы одной пары (роль, элемент) сливаются, побеждает последний флаг:
+    # ON CONFLICT не может обновить одну строку дважды в одном запросе
+    merged: Dict[Tuple[int, int], Dict[str, bool]] = {}
+    for i, (role_name, element_code, flags) in enumerate(items):
+        if role_name not in roles:
+            results[i] = {"role": role_name, "element": element_code, "status": "error", "detail": role_not_found(role_name).detail}
+            continue
+        if element_code not in elements:
+            results[i] = {"role": role_name, "element": element_code, "status": "error", "detail": element_not_found(element_code).detail}
+            continue
+        key = (roles[role_name], elements[element_code])
+        keys[i] = key
+        provided = merged.setdefault(key, {})
+        provided.update({f"{k}_permission": v for k, v in flags.items() if k in FLAGS and v is not None})
+
+    # в многострочном INSERT у всех строк одинаковый набор колонок, поэтому
+    # группируем по набору переданных флагов; остальные берут server_default
+    groups: Dict[Tuple[str, ...], List[Dict]] = {}
+    for (role_id, element_id), provided in merged.items():
+        columns = tuple(sorted(provided))
+        groups.setdefault(columns, []).append({"role_id": role_id, "element_id": element_id, **provided})
+
+    dialect = db.get_bind().dialect.name
+    for columns, rows in groups.items():
+        for start in range(0, len(rows), RULES_BULK_CHUNK):
+            db.execute(_upsert_statement(dialect, rows[start:start + RULES_BULK_CHUNK], columns))
+    db.commit()
+    if merged:
+        rules_changed()
+
+    saved = {}
+    if merged:
+        q = rules_query().where(tuple_(AccessRolesRules.role_id, AccessRolesRules.element_id).in_(list(merged)))
+        q = q.add_columns(AccessRolesRules.role_id, AccessRolesRules.element_id)
+        for r in db.execute(q).all():
+            saved[(r.role_id, r.element_id)] = rule_row_to_dict(r)
+
+    for i, key in enumerate(keys):
+        if key is not None:
+            results[i] = {"role": items[i][0], "element": items[i][1], "status": "ok", "rule": saved.get(key)}
+    return results
+
+
+def _set_parents(db: Session, link, child_col, parent_col, child_id: int, parent_ids: List[int], detail: str) -> None:
+    # связи узла заменяются целиком; ребро, замыкающее цикл, не принимаем
+    edges = [(c, p) for c, p in db.execute(select(child_col, parent_col)).all() if c != child_id]
+    for parent_id in parent_ids:
+        if child_id in ancestors(edges, parent_id):
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=detail)
+    db.execute(delete(link).where(child_col == child_id))
+    for parent_id in parent_ids:
+        db.add(link(**{child_col.key: child_id, parent_col.key: parent_id}))
+
+
+def upsert_role(db: Session, current_user_id: int, name: str, parents: Optional[List[str]]) -> Dict:
+    ensure_can_update_rules(db, current_user_id)
+
+    role = db.query(Roles).filter(Roles.name == name).first()
+    if role is None:
+        role = Roles(name=name)
+        db.add(role)
+        db.flush()
+
+    if parents is not None:
+        found = dict(db.execute(select(Roles.name, Roles.id).where(Roles.name.in_(parents))).all())
+        for parent in parents:
+            if parent not in found:
+                raise role_not_found(parent)
+        _set_parents(
+            db, RoleParents, RoleParents.role_id, RoleParents.parent_id, role.id,
+            sorted(set(found.values())), f"Наследование роли '{name}' образует цикл",
+        )
+
+    db.commit()
+    rules_changed()
+    names = db.execute(
+        select(Roles.name).join(RoleParents, RoleParents.parent_id == Roles.id).where(RoleParents.role_id == role.id)
+    ).scalars().all()
+    return {"id": role.id, "role": role.name, "parents": sorted(names)}
+
+
+def upsert_element(db: Session, current_user_id: int, code: str, groups: Optional[List[str]]) -> Dict:
+    ensure_can_update_rules(db, current_user_id)
+
+    element = db.query(BusinessElements).filter(BusinessElements.code == code).first()
+    if element is None:
+        element = BusinessElements(code=code)
+        db.add(element)
+        db.flush()
+
+    if groups is not None:
+        found = dict(db.execute(select(BusinessElements.code, BusinessElements.id).where(BusinessElements.code.in_(groups))).all())
+        for group in groups:
+            if group not in found:
+                raise element_not_found(group)
+        _set_parents(
+            db, ElementGroups, ElementGroups.element_id, ElementGroups.group_id, element.id,
+            sorted(set(found.values())), f"Группы элемента '{code}' образуют цикл",
+        )
+
+    db.commit()
+    rules_changed()
+    codes = db.execute(
+        select(BusinessElements.code)
+        .join(ElementGroups, ElementGroups.group_id == BusinessElements.id)
+        .where(ElementGroups.element_id == element.id)
+    ).scalars().all()
+    return {"id": element.id, "element": element.code, "groups": sorted(codes)}
@@ -0,0 +1,71 @@
+from typing import List, Dict, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Roles, BusinessElements, AccessRolesRules
+from admin import (
+    require_read_rules,
+    require_update_rules,
+    rules_query,
+    rule_row_to_dict,
+    rule_to_dict,
+    role_not_found,
+    element_not_found,
+    apply_flags,
+)
+from business_async import get_permission_mask
+from invalidation import rules_changed_async
+
+
+async def ensure_can_read_rules(db: AsyncSession, user_id: int) -> None:
+    require_read_rules(await get_permission_mask(db, user_id, "rules"))
+
+
+async def ensure_can_update_rules(db: AsyncSession, user_id: int) -> None:
+    require_update_rules(await get_permission_mask(db, user_id, "rules"))
+
+
+async def list_rules(
+    db: AsyncSession,
+    current_user_id: int,
+    role_name: Optional[str] = None,
+    element_code: Optional[str] = None,
+) -> List[Dict]:
+    await ensure_can_read_rules(db, current_user_id)
+
+    rows = (await db.execute(rules_query(role_name, element_code))).all()
+    return [rule_row_to_dict(r) for r in rows]
+
+
+async def upsert_rule(
+    db: AsyncSession,
+    current_user_id: int,
+    role_name: str,
+    element_code: str,
+    flags: Dict[str, Optional[bool]],
+) -> Dict:
+    await ensure_can_update_rules(db, current_user_id)
+
+    role = await db.scalar(select(Roles).where(Roles.name == role_name))
+    if not role:
+        raise role_not_found(role_name)
+
+    element = await db.scalar(select(BusinessElements).where(BusinessElements.code == element_code))
+    if not element:
+        raise element_not_found(element_code)
+
+    rule = await db.scalar(select(AccessRolesRules).where(
+        AccessRolesRules.role_id == role.id,
+        AccessRolesRules.element_id == element.id
+    ))
+
+    new_rule = rule is None
+    rule = apply_flags(rule, role.id, element.id, flags)
+    if new_rule:
+        db.add(rule)
+
+    await db.commit()
+    await rules_changed_async()
+    await db.refresh(rule)
+
+    return rule_to_dict(rule, role, element)
@@ -1,16 +1,29 @@
-from typing import Optional
+from typing import List, Optional
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 
-from shemas import UpsertRuleIn
+from shemas import UpsertRuleIn, UpsertRoleIn, UpsertElementIn
 from db import get_db
 from authen import get_current_user
-from admin import list_rules, upsert_rule
+from admin import (
+    list_rules,
+    upsert_rule,
+    bulk_upsert_rules,
+    upsert_role,
+    upsert_element,
+    ensure_can_read_rules,
+    rules_query,
+    rule_row_to_dict,
+)
+from models import AccessRolesRules
+from streaming import ndjson_response
+from profiling import query_budget
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
 
 @router.get("/rules")
+@query_budget(7)
 def get_rules(
     role: Optional[str] = Query(default=None, description="Имя роли (опционально)"),
     element: Optional[str] = Query(default=None, description="Код элемента (опционально)"),
@@ -22,7 +35,21 @@ def get_rules(
     return {"items": data, "count": len(data)}
 
 
+@router.get("/rules/export")
+@query_budget(7)
+def export_rules(
+    role: Optional[str] = Query(default=None, description="Имя роли (опционально)"),
+    element: Optional[str] = Query(default=None, description="Код элемента (опционально)"),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user),
+):
+    ensure_can_read_rules(db, current_user.id)
+    q = rules_query(role_name=role, element_code=element).order_by(AccessRolesRules.id)
+    return ndjson_response(q, rule_row_to_dict)
+
+
 @router.put("/rules")
+@query_budget(12)
 def put_rule(
     payload: UpsertRuleIn,
     db: Session = Depends(get_db),
@@ -37,3 +64,35 @@ def put_rule(
         flags=payload.flags.model_dump(),
     )
     return result
+
+
+@router.put("/rules:bulk")
+def put_rules_bulk(
+    payload: List[UpsertRuleIn],
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user),
+):
+    results = bulk_upsert_rules(
+        db,
+        current_user_id=current_user.id,
+        items=[(p.role, p.element, p.flags.model_dump()) for p in payload],
+    )
+    return {"items": results, "count": len(results)}
+
+
+@router.put("/roles")
+def put_role(
+    payload: UpsertRoleIn,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user),
+):
+    return upsert_role(db, current_user_id=current_user.id, name=payload.name, parents=payload.parents)
+
+
+@router.put("/elements")
+def put_element(
+    payload: UpsertElementIn,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user),
+):
+    return upsert_element(db, current_user_id=current_user.id, code=payload.code, groups=payload.groups)
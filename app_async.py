@@ -0,0 +1,181 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, status, Body, Depends, Query, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from shemas import UserCreate, UserOut, UserLogin, UpsertRuleIn, UserUpdate
+from db import get_async_db
+from authen import issue_access_token_async, get_current_user_async
+from models import BusinessObject
+from user_cache import CachedUser, get_cached_user_async
+from tokens import (
+    issue_refresh_token_async,
+    take_refresh_token_async,
+    revoke_refresh_token_async,
+    revoke_all_refresh_tokens_async,
+)
+import users_async
+import admin_async
+import business_async
+from business import parse_object_fields, objects_page_query, objects_page, OBJECTS_PAGE_MAX
+from profiling import query_budget
+import audit
+import ratelimit
+
+# Те же эндпоинты, что в app_user/app_admin/app_business, но на AsyncSession.
+# При DB_ASYNC=1 main.py подменяет ими синхронные маршруты.
+
+user_router = APIRouter(prefix="/users", tags=["users"])
+admin_router = APIRouter(prefix="/admin", tags=["admin"])
+objects_router = APIRouter(prefix="/objects", tags=["objects"])
+
+
+@user_router.post("/register", response_model=UserOut, status_code=status.HTTP_201_CREATED)
+async def register_user(payload: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    user = await users_async.create_user(db, payload)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Email уже есть в системе",
+        )
+    return user
+
+
+@user_router.post("/login")
+@query_budget(4)
+async def login_user(payload: UserLogin, request: Request, db: AsyncSession = Depends(get_async_db)):
+    ip = audit.client_ip(request)
+    # лимит проверяется до базы и bcrypt: перебор не должен стоить CPU
+    await ratelimit.check_login_async(ip, payload.email)
+    user = await users_async.authenticate_user(db, payload)
+    if user is None:
+        await ratelimit.login_failed_async(ip, payload.email)
+        audit.record("login_failed", email=payload.email.lower(), ip=ip)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Неверный логин или пароль")
+    await ratelimit.login_succeeded_async(ip, payload.email)
+
+    access_token = await issue_access_token_async(db, user.id)
+    refresh_str = await issue_refresh_token_async(db, user.id)
+    audit.record("login", user_id=user.id, ip=ip)
+
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_str,
+        "token_type": "bearer"
+    }
+
+
+@user_router.post("/refresh")
+@query_budget(3)
+async def refresh_token(request: Request, refresh_token: str = Body(..., embed=True), db: AsyncSession = Depends(get_async_db)):
+    user_id = await take_refresh_token_async(db, refresh_token)
+    if user_id is None:
+        audit.record("refresh_failed", ip=audit.client_ip(request))
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Неверный refresh token")
+
+    user = await get_cached_user_async(db, user_id)
+    if not user or not user.is_active:
+        await revoke_all_refresh_tokens_async(db, user_id)
+        audit.record("refresh_failed", user_id=user_id, ip=audit.client_ip(request))
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Пользователь не найден")
+
+    new_refresh = await issue_refresh_token_async(db, user_id)
+    audit.record("refresh", user_id=user_id, ip=audit.client_ip(request))
+    access_token = await issue_access_token_async(db, user_id)
+    return {"access_token": access_token, "refresh_token": new_refresh, "token_type": "bearer"}
+
+
+@user_router.post("/logout")
+@query_budget(2)
+async def logout(
+    refresh_token: str = Body(..., embed=True),
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user_async),
+):
+    await revoke_refresh_token_async(db, refresh_token, current_user.id)
+    audit.record("logout", user_id=current_user.id)
+    return {"ok": True}
+
+
+@user_router.post("/logout_all")
+@query_budget(2)
+async def logout_all(db: AsyncSession = Depends(get_async_db), current_user = Depends(get_current_user_async)):
+    await revoke_all_refresh_tokens_async(db, current_user.id)
+    audit.record("logout_all", user_id=current_user.id)
+    return {"ok": True}
+
+
+@user_router.put("/me", response_model=UserOut)
+async def update_me(data: UserUpdate, db: AsyncSession = Depends(get_async_db), current_user = Depends(get_current_user_async)):
+    updated_user = await users_async.update_user(db, current_user.id, data)
+    if updated_user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Пользователь не найден")
+    return updated_user
+
+
+@user_router.delete("/me", response_model=UserOut)
+async def delete_me(db: AsyncSession = Depends(get_async_db), current_user = Depends(get_current_user_async)):
+    deleted_user = await users_async.delete_user(db, current_user.id)
+    if deleted_user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Пользователь не найден")
+    return deleted_user
+
+
+@admin_router.get("/rules")
+@query_budget(7)
+async def get_rules(
+    role: Optional[str] = Query(default=None, description="Имя роли (опционально)"),
+    element: Optional[str] = Query(default=None, description="Код элемента (опционально)"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user_async),
+):
+    data = await admin_async.list_rules(db, current_user_id=current_user.id, role_name=role, element_code=element)
+    return {"items": data, "count": len(data)}
+
+
+@admin_router.put("/rules")
+@query_budget(12)
+async def put_rule(
+    payload: UpsertRuleIn,
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_current_user_async),
+):
+    return await admin_async.upsert_rule(
+        db,
+        current_user_id=current_user.id,
+        role_name=payload.role,
+        element_code=payload.element,
+        flags=payload.flags.model_dump(),
+    )
+
+
+@objects_router.get("")
+@query_budget(7)
+async def list_objects(
+    after_id: Optional[int] = Query(default=None, description="Курсор: id последнего объекта предыдущей страницы"),
+    limit: int = Query(default=50, ge=1, le=OBJECTS_PAGE_MAX),
+    title_prefix: Optional[str] = Query(default=None, description="Начало названия"),
+    owner_id: Optional[int] = Query(default=None, description="Владелец"),
+    fields: Optional[str] = Query(default=None, description="Поля через запятую: id,title,description,owner_id"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CachedUser = Depends(get_current_user_async),
+):
+    columns = parse_object_fields(fields)
+    acl = await business_async.objects_scope(db, current_user.id)
+    q = objects_page_query(columns, acl, limit, after_id, title_prefix, owner_id)
+    return objects_page((await db.execute(q)).all(), limit)
+
+
+@objects_router.get("/{object_id}")
+@query_budget(8)
+async def get_object(
+    object_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: CachedUser = Depends(get_current_user_async),
+):
+    obj = await db.scalar(select(BusinessObject).where(BusinessObject.id == object_id))
+    if not obj:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Объект не найден")
+
+    await business_async.check_object_read_allowed(db, current_user.id, obj)
+    return obj
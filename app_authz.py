@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+
+from shemas import AuthorizeManyIn
+from db import get_db
+from authen import get_current_user
+from business import authorize_many
+from profiling import query_budget
+
+router = APIRouter(prefix="/authz", tags=["authz"])
+
+
+@router.post("/batch")
+@query_budget(9)
+def authorize_batch(
+    payload: AuthorizeManyIn,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user),
+):
+    decisions = authorize_many(
+        db,
+        current_user.id,
+        [(c.element, c.action, c.owner_id) for c in payload.checks],
+    )
+    return {"decisions": decisions}
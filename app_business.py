@@ -1,41 +1,106 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 
 from db import get_db
 from authen import get_current_user
-from models import BusinessObject, User
-from business import check_read_allowed
+from user_cache import CachedUser
+from streaming import ndjson_response
+from shemas import ObjectGrantIn
+from business import (
+    check_object_read_allowed,
+    objects_scope,
+    get_object_or_404,
+    list_grants,
+    add_grant,
+    remove_grant,
+    parse_object_fields,
+    objects_query,
+    objects_page_query,
+    objects_page,
+    OBJECTS_PAGE_MAX,
+)
+from profiling import query_budget
 
 router = APIRouter(prefix="/objects", tags=["objects"])
 
 
 @router.get("")
+@query_budget(7)
 def list_objects(
+    after_id: Optional[int] = Query(default=None, description="Курсор: id последнего объекта предыдущей страницы"),
+    limit: int = Query(default=50, ge=1, le=OBJECTS_PAGE_MAX),
+    title_prefix: Optional[str] = Query(default=None, description="Начало названия"),
+    owner_id: Optional[int] = Query(default=None, description="Владелец"),
+    fields: Optional[str] = Query(default=None, description="Поля через запятую: id,title,description,owner_id"),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: CachedUser = Depends(get_current_user),
 ):
-    user_id = current_user.id
-    # проверяем доступ
-    try:
-        check_read_allowed(db, user_id=user_id, element_code="objects")
-        return db.query(BusinessObject).all()
-    except HTTPException as e:
-        if e.status_code == status.HTTP_403_FORBIDDEN:
-            return db.query(BusinessObject).filter(BusinessObject.owner_id == user_id).all()
-        raise
+    columns = parse_object_fields(fields)
+    acl = objects_scope(db, current_user.id)
+    q = objects_page_query(columns, acl, limit, after_id, title_prefix, owner_id)
+    return objects_page(db.execute(q).all(), limit)
+
+
+@router.get("/export")
+@query_budget(7)
+def export_objects(
+    after_id: Optional[int] = Query(default=None, description="Продолжить выгрузку после этого id"),
+    title_prefix: Optional[str] = Query(default=None, description="Начало названия"),
+    owner_id: Optional[int] = Query(default=None, description="Владелец"),
+    fields: Optional[str] = Query(default=None, description="Поля через запятую: id,title,description,owner_id"),
+    db: Session = Depends(get_db),
+    current_user: CachedUser = Depends(get_current_user),
+):
+    columns = parse_object_fields(fields)
+    acl = objects_scope(db, current_user.id)
+    return ndjson_response(objects_query(columns, acl, after_id, title_prefix, owner_id))
 
 
 @router.get("/{object_id}")
+@query_budget(8)
 def get_object(
     object_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: CachedUser = Depends(get_current_user),
 ):
-    user_id = current_user.id
-
-    obj = db.query(BusinessObject).filter(BusinessObject.id == object_id).first()
-    if not obj:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Объект не найден")
-    
-    check_read_allowed(db, user_id=user_id, element_code="objects", resource_owner_id=obj.owner_id)
+    obj = get_object_or_404(db, object_id)
+    check_object_read_allowed(db, current_user.id, obj)
     return obj
+
+
+@router.get("/{object_id}/grants")
+def get_object_grants(
+    object_id: int,
+    db: Session = Depends(get_db),
+    current_user: CachedUser = Depends(get_current_user),
+):
+    items = list_grants(db, current_user.id, object_id)
+    return {"items": items, "count": len(items)}
+
+
+@router.put("/{object_id}/grants")
+def put_object_grant(
+    object_id: int,
+    payload: ObjectGrantIn,
+    db: Session = Depends(get_db),
+    current_user: CachedUser = Depends(get_current_user),
+):
+    return add_grant(db, current_user.id, object_id, payload.user_id, payload.role)
+
+
+@router.delete("/{object_id}/grants")
+def delete_object_grant(
+    object_id: int,
+    user_id: Optional[int] = Query(default=None, description="Пользователь, у которого забрать доступ"),
+    role: Optional[str] = Query(default=None, description="Роль, у которой забрать доступ"),
+    db: Session = Depends(get_db),
+    current_user: CachedUser = Depends(get_current_user),
+):
+    if (user_id is None) == (role is None):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Нужно указать ровно один из параметров user_id и role"
+        )
+    remove_grant(db, current_user.id, object_id, user_id, role)
+    return {"ok": True}
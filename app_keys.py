@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Request, Response
+
+from authen import keyring
+from jwt_keys import JWKS_MAX_AGE_SECONDS
+
+router = APIRouter(tags=["keys"])
+
+
+@router.get("/.well-known/jwks.json")
+def get_jwks(request: Request):
+    body, etag = keyring.jwks()
+    headers = {"Cache-Control": f"public, max-age={JWKS_MAX_AGE_SECONDS}", "ETag": etag}
+    if etag and request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
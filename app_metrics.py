@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+
+from db import get_db, engine, async_engine, pool_stats, replicas, async_replicas
+from user_cache import user_cache
+from hashing import hash_pool
+from tokens import token_store, token_sweeper
+from profiling import profiler
+from authen import keyring, token_cache, get_current_user
+from admin import ensure_can_read_rules, ensure_can_update_rules
+from invalidation import bus as invalidation_bus
+from audit import audit_log
+from ratelimit import login_limiter
+
+router = APIRouter(tags=["metrics"])
+
+
+# внутренняя статистика раскрывает устройство сервиса, а сброс портит замеры:
+# только для тех, кто видит и меняет правила доступа
+def require_metrics_read(db: Session = Depends(get_db), current_user = Depends(get_current_user)) -> None:
+    ensure_can_read_rules(db, current_user.id)
+
+
+def require_metrics_reset(db: Session = Depends(get_db), current_user = Depends(get_current_user)) -> None:
+    ensure_can_update_rules(db, current_user.id)
+
+
+@router.get("/metrics", dependencies=[Depends(require_metrics_read)])
+def get_metrics():
+    return {
+        "db_pool": pool_stats(engine),
+        "db_pool_async": pool_stats(async_engine) if async_engine is not None else None,
+        "db_replicas": replicas.stats() if replicas is not None else None,
+        "db_replicas_async": async_replicas.stats() if async_replicas is not None else None,
+        "jwt_cache": token_cache.stats(),
+        "jwt_keys": keyring.stats(),
+        "user_cache": user_cache.stats(),
+        "invalidation": invalidation_bus.stats(),
+        "login_rate_limit": login_limiter.stats(),
+        "password_hashing": hash_pool.stats(),
+        "refresh_token_store": token_store.stats(),
+        "refresh_token_sweeper": token_sweeper.stats(),
+        "audit": audit_log.stats(),
+    }
+
+
+@router.get("/metrics/routes", dependencies=[Depends(require_metrics_read)])
+def get_route_metrics():
+    return profiler.stats()
+
+
+@router.delete("/metrics/routes", dependencies=[Depends(require_metrics_reset)])
+def reset_route_metrics():
+    profiler.reset()
+    return {"ok": True}
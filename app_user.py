@@ -1,18 +1,23 @@
-from fastapi import APIRouter, HTTPException, status, Body, Depends
-from datetime import datetime, timedelta
-import secrets
+from fastapi import APIRouter, HTTPException, status, Body, Depends, Request
 from sqlalchemy.orm import Session
 
 from shemas import UserCreate, UserOut, UserLogin, UserUpdate
 from users import create_user, authenticate_user, update_user, delete_user
-from authen import create_access_token, get_current_user
+from authen import issue_access_token, get_current_user
 from db import get_db
-from models import RefreshToken, User
+from user_cache import get_cached_user
+from tokens import (
+    issue_refresh_token,
+    take_refresh_token,
+    revoke_refresh_token,
+    revoke_all_refresh_tokens,
+)
+from profiling import query_budget
+import audit
+import ratelimit
 
 router = APIRouter(prefix="/users", tags=["users"])
 
-REFRESH_TTL_DAYS = 14
-
 
 @router.post("/register", response_model=UserOut, status_code=status.HTTP_201_CREATED)
 def register_user(payload: UserCreate, db: Session = Depends(get_db)):
@@ -26,23 +31,21 @@ def register_user(payload: UserCreate, db: Session = Depends(get_db)):
 
 
 @router.post("/login")
-def login_user(payload: UserLogin, db: Session = Depends(get_db)):
+@query_budget(4)
+def login_user(payload: UserLogin, request: Request, db: Session = Depends(get_db)):
+    ip = audit.client_ip(request)
+    # лимит проверяется до базы и bcrypt: перебор не должен стоить CPU
+    ratelimit.check_login(ip, payload.email)
     user = authenticate_user(db, payload)
     if user is None:
+        ratelimit.login_failed(ip, payload.email)
+        audit.record("login_failed", email=payload.email.lower(), ip=ip)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Неверный логин или пароль")
+    ratelimit.login_succeeded(ip, payload.email)
 
-    access_token = create_access_token(user.id)
-
-    refresh_str = secrets.token_urlsafe(32)
-    rt = RefreshToken(
-        user_id=user.id,
-        token=refresh_str,
-        created_at=datetime.utcnow(),
-        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TTL_DAYS),
-        revoked=False,
-    )
-    db.add(rt)
-    db.commit()
+    access_token = issue_access_token(db, user.id)
+    refresh_str = issue_refresh_token(db, user.id)
+    audit.record("login", user_id=user.id, ip=ip)
 
     return {
         "access_token": access_token,
@@ -52,42 +55,43 @@ def login_user(payload: UserLogin, db: Session = Depends(get_db)):
 
 
 @router.post("/refresh")
-def refresh_token(refresh_token: str = Body(..., embed=True), db: Session = Depends(get_db)):
-    rec = db.query(RefreshToken).filter(RefreshToken.token == refresh_token, RefreshToken.revoked == False).first()
-    if not rec or rec.expires_at < datetime.utcnow():
+@query_budget(3)
+def refresh_token(request: Request, refresh_token: str = Body(..., embed=True), db: Session = Depends(get_db)):
+    # старый токен погашается; новый получает только активный пользователь
+    user_id = take_refresh_token(db, refresh_token)
+    if user_id is None:
+        audit.record("refresh_failed", ip=audit.client_ip(request))
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Неверный refresh token")
 
-    user = db.query(User).filter(User.id == rec.user_id, User.is_active == True).first()
-    if not user:
+    user = get_cached_user(db, user_id)
+    if not user or not user.is_active:
+        revoke_all_refresh_tokens(db, user_id)
+        audit.record("refresh_failed", user_id=user_id, ip=audit.client_ip(request))
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Пользователь не найден")
 
-    access_token = create_access_token(user.id)
-    return {"access_token": access_token, "token_type": "bearer"}
+    new_refresh = issue_refresh_token(db, user_id)
+    audit.record("refresh", user_id=user_id, ip=audit.client_ip(request))
+    access_token = issue_access_token(db, user_id)
+    return {"access_token": access_token, "refresh_token": new_refresh, "token_type": "bearer"}
 
 
 @router.post("/logout")
+@query_budget(2)
 def logout(
     refresh_token: str = Body(..., embed=True),
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user),
 ):
-    rec = db.query(RefreshToken).filter(
-        RefreshToken.token == refresh_token,
-        RefreshToken.user_id == current_user.id
-    ).first()
-    if rec:
-        rec.revoked = True
-        db.commit()
+    revoke_refresh_token(db, refresh_token, current_user.id)
+    audit.record("logout", user_id=current_user.id)
     return {"ok": True}
 
 
 @router.post("/logout_all")
+@query_budget(2)
 def logout_all(db: Session = Depends(get_db), current_user = Depends(get_current_user)):
-    db.query(RefreshToken).filter(
-        RefreshToken.user_id == current_user.id,
-        RefreshToken.revoked == False
-    ).update({"revoked": True})
-    db.commit()
+    revoke_all_refresh_tokens(db, current_user.id)
+    audit.record("logout_all", user_id=current_user.id)
     return {"ok": True}
 
 
@@ -0,0 +1,238 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, Optional, Tuple
+from sqlalchemy import DateTime, Integer, column, exists, func, insert, select, values
+
+from db import engine, DB_ASYNC
+from models import AuditEvent, User, UserLastSeen
+
+logger = logging.getLogger(__name__)
+
+AUDIT_ENABLED = os.getenv("AUDIT_ENABLED", "1") == "1"
+AUDIT_BUFFER_SIZE = int(os.getenv("AUDIT_BUFFER_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL_SECONDS = float(os.getenv("AUDIT_FLUSH_INTERVAL_SECONDS", "1"))
+# что делать с событием, когда буфер полон:
+# drop_oldest — вытеснить самое старое, drop_newest — отбросить новое,
+# block — ждать место до AUDIT_BLOCK_TIMEOUT_MS, потом отбросить новое
+AUDIT_DROP_POLICY = os.getenv("AUDIT_DROP_POLICY", "drop_oldest")
+AUDIT_BLOCK_TIMEOUT_MS = float(os.getenv("AUDIT_BLOCK_TIMEOUT_MS", "5"))
+# last_seen_at пользователя пишется не чаще раза за интервал
+LAST_SEEN_INTERVAL_SECONDS = float(os.getenv("LAST_SEEN_INTERVAL_SECONDS", "60"))
+
+DROP_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+Event = Tuple[datetime, str, Optional[int], Optional[str], Optional[str]]
+
+
+def _last_seen_statement(dialect: str, rows):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+        latest = func.greatest
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as upsert
+        latest = func.max
+    else:
+        raise ValueError(f"last_seen upsert is not supported for {dialect}")
+    seen = (
+        values(column("user_id", Integer), column("last_seen_at", DateTime), name="seen")
+        .data([(r["user_id"], r["last_seen_at"]) for r in rows])
+        .cte("seen")
+    )
+    # пользователя могли удалить, пока его обращение ждало в буфере: без
+    # фильтра нарушение внешнего ключа откатило бы всю пачку
+    src = select(seen.c.user_id, seen.c.last_seen_at).where(exists().where(User.id == seen.c.user_id))
+    stmt = upsert(UserLastSeen).from_select(["user_id", "last_seen_at"], src)
+    # другой воркер мог записать более позднее время
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id"],
+        set_={"last_seen_at": latest(UserLastSeen.last_seen_at, stmt.excluded.last_seen_at)},
+    )
+
+
+class AuditLog:
+    def __init__(
+        self,
+        eng=engine,
+        size: int = AUDIT_BUFFER_SIZE,
+        batch: int = AUDIT_BATCH_SIZE,
+        interval: float = AUDIT_FLUSH_INTERVAL_SECONDS,
+        policy: str = AUDIT_DROP_POLICY,
+        block_timeout_ms: float = AUDIT_BLOCK_TIMEOUT_MS,
+        last_seen_interval: float = LAST_SEEN_INTERVAL_SECONDS,
+    ):
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"unknown audit drop policy '{policy}'")
+        if policy == "block" and DB_ASYNC:
+            # record() зовут прямо из async-обработчиков: ожидание остановило бы цикл событий
+            raise ValueError("audit drop policy 'block' is not supported with DB_ASYNC=1")
+        self.engine = eng
+        self.size = size
+        self.batch = batch
+        self.interval = interval
+        self.policy = policy
+        self.block_timeout = block_timeout_ms / 1000
+        self.last_seen_interval = last_seen_interval
+        self._buf: Deque[Event] = deque()
+        self._cond = threading.Condition()
+        # user_id -> последнее обращение; схлопывается до одной записи на пользователя
+        self._seen: Dict[int, datetime] = {}
+        self._seen_lock = threading.Lock()
+        self._seen_flushed_at = time.monotonic()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self.enqueued = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.written = 0
+        self.batches = 0
+        self.flush_errors = 0
+        self.lost = 0
+        self.last_seen_written = 0
+        self.last_flush_ms = 0.0
+
+    def record(self, event: str, user_id: Optional[int] = None, email: Optional[str] = None, ip: Optional[str] = None) -> None:
+        item = (datetime.utcnow(), event, user_id, email, ip)
+        with self._cond:
+            if len(self._buf) >= self.size:
+                if self.policy == "drop_oldest":
+                    self._buf.popleft()
+                    self.dropped += 1
+                elif self.policy == "block":
+                    self.blocked += 1
+                    if not self._cond.wait_for(lambda: len(self._buf) < self.size, self.block_timeout):
+                        self.dropped += 1
+                        return
+                else:
+                    self.dropped += 1
+                    return
+            self._buf.append(item)
+            self.enqueued += 1
+            if len(self._buf) >= self.batch:
+                self._cond.notify_all()
+
+    def touch(self, user_id: int) -> None:
+        now = datetime.utcnow()
+        with self._seen_lock:
+            self._seen[user_id] = now
+
+    def _take(self):
+        with self._cond:
+            # пишем, когда набралась пачка или вышел интервал
+            self._cond.wait_for(lambda: len(self._buf) >= self.batch or self._stopping, self.interval)
+            n = min(self.batch, len(self._buf))
+            batch = [self._buf.popleft() for _ in range(n)]
+            # место освободилось — будим тех, кто ждёт по политике block
+            self._cond.notify_all()
+        return batch
+
+    def _write(self, batch) -> None:
+        started = time.perf_counter()
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(AuditEvent), [
+                    {"created_at": ts, "event": event, "user_id": user_id, "email": email, "ip": ip}
+                    for ts, event, user_id, email, ip in batch
+                ])
+        except Exception:
+            logger.exception("audit flush failed, %d events lost", len(batch))
+            self.flush_errors += 1
+            self.lost += len(batch)
+            return
+        self.written += len(batch)
+        self.batches += 1
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+
+    def _write_last_seen(self) -> None:
+        with self._seen_lock:
+            seen, self._seen = self._seen, {}
+        self._seen_flushed_at = time.monotonic()
+        if not seen:
+            return
+        rows = [{"user_id": user_id, "last_seen_at": ts} for user_id, ts in seen.items()]
+        # пачки в отдельных транзакциях: ошибка одной не теряет остальные
+        for start in range(0, len(rows), self.batch):
+            chunk = rows[start:start + self.batch]
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(_last_seen_statement(self.engine.dialect.name, chunk))
+            except Exception:
+                logger.exception("last_seen flush failed")
+                self.flush_errors += 1
+                continue
+            self.last_seen_written += len(chunk)
+
+    def flush(self) -> None:
+        # синхронно дописать всё накопленное (остановка, тесты)
+        while True:
+            with self._cond:
+                batch = [self._buf.popleft() for _ in range(min(self.batch, len(self._buf)))]
+                self._cond.notify_all()
+            if not batch:
+                break
+            self._write(batch)
+        self._write_last_seen()
+
+    def _run(self) -> None:
+        while not self._stopping:
+            batch = self._take()
+            if batch:
+                self._write(batch)
+            if time.monotonic() - self._seen_flushed_at >= self.last_seen_interval:
+                self._write_last_seen()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="audit-flusher", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": AUDIT_ENABLED,
+            "policy": self.policy,
+            "buffered": len(self._buf),
+            "capacity": self.size,
+            "batch_size": self.batch,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "blocked": self.blocked,
+            "written": self.written,
+            "batches": self.batches,
+            "flush_errors": self.flush_errors,
+            "lost": self.lost,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "last_seen_pending": len(self._seen),
+            "last_seen_written": self.last_seen_written,
+        }
+
+
+audit_log = AuditLog()
+
+
+def client_ip(request) -> Optional[str]:
+    # за прокси здесь адрес прокси; uvicorn --proxy-headers подставит X-Forwarded-For
+    return request.client.host if request.client else None
+
+
+def record(event: str, user_id: Optional[int] = None, email: Optional[str] = None, ip: Optional[str] = None) -> None:
+    if AUDIT_ENABLED:
+        audit_log.record(event, user_id, email, ip)
+
+
+def touch(user_id: int) -> None:
+    if AUDIT_ENABLED:
+        audit_log.touch(user_id)
@@ -1,18 +1,52 @@
+import hashlib
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Iterable, Optional, Tuple
 import jwt
 from jwt import PyJWTError
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from db import get_db
-from models import User
+from db import get_db, get_async_db, set_client
+from jwt_keys import KeyRing, hmac_key
+import audit
+from user_cache import (
+    CachedUser,
+    get_cached_user,
+    get_cached_user_async,
+    change_stamp,
+    is_deactivated,
+    principal_from_claims,
+)
 
-SECRET_KEY = "moysecretik"
-ALGORITHM = "HS256"
+logger = logging.getLogger(__name__)
+
+SECRET_KEY = os.getenv("JWT_SECRET_KEY")
+if not SECRET_KEY:
+    # без ключа в конфиге токены живут до рестарта и не принимаются другими воркерами
+    logger.warning("JWT_SECRET_KEY не задан, используется случайный ключ процесса")
+    SECRET_KEY = secrets.token_urlsafe(32)
+# HS256 на SECRET_KEY, пока в JWT_KEYS_DIR нет асимметричных ключей
+keyring = KeyRing(hmac_key(SECRET_KEY))
+# 0 — без кэша проверенных токенов
+JWT_CACHE_MAX_SIZE = int(os.getenv("JWT_CACHE_MAX_SIZE", "100000"))
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+# роли и метка версии пользователя кладутся в токен, и get_current_user
+# обходится без запроса к базе
+STATELESS_ACCESS_TOKENS = os.getenv("STATELESS_ACCESS_TOKENS", "0") == "1"
 
-def create_access_token(sub: int, *, minutes: int = ACCESS_TOKEN_EXPIRE_MINUTES) -> str:
+def create_access_token(
+    sub: int,
+    *,
+    minutes: int = ACCESS_TOKEN_EXPIRE_MINUTES,
+    role_ids: Optional[Iterable[int]] = None,
+    stamp: Optional[int] = None,
+) -> str:
     now = datetime.utcnow()
     payload = {
         "sub": str(sub),
@@ -20,27 +54,155 @@ def create_access_token(sub: int, *, minutes: int = ACCESS_TOKEN_EXPIRE_MINUTES)
         "iat": now,
         "exp": now + timedelta(minutes=minutes),
     }
-    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+    if role_ids is not None:
+        payload["roles"] = list(role_ids)
+        payload["ver"] = stamp or 0
+    key = keyring.signing_key()
+    return jwt.encode(payload, key.signing, algorithm=key.algorithm, headers={"kid": key.kid})
 
-def verify_token(token: str) -> Optional[dict]:
+
+def issue_access_token(db: Session, user_id: int) -> str:
+    if not STATELESS_ACCESS_TOKENS:
+        return create_access_token(user_id)
+    # метку берём до чтения ролей: если роли поменяются между этими шагами,
+    # токен просто окажется устаревшим
+    stamp = change_stamp(user_id)
+    user = get_cached_user(db, user_id)
+    return create_access_token(user_id, role_ids=user.role_ids if user else (), stamp=stamp)
+
+
+async def issue_access_token_async(db, user_id: int) -> str:
+    if not STATELESS_ACCESS_TOKENS:
+        return create_access_token(user_id)
+    stamp = change_stamp(user_id)
+    user = await get_cached_user_async(db, user_id)
+    return create_access_token(user_id, role_ids=user.role_ids if user else (), stamp=stamp)
+
+class VerifiedTokenCache:
+    # sha256 токена -> проверенный payload; запись живёт до exp токена.
+    # Один и тот же токен приходит на каждый запрос клиента, и повторно
+    # подпись и claims уже не проверяются.
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data: "OrderedDict[bytes, Tuple[dict, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, digest: bytes) -> Optional[dict]:
+        with self._lock:
+            entry = self._data.get(digest)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[1] <= time.time():
+                del self._data[digest]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(digest)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, digest: bytes, payload: dict) -> None:
+        exp = payload.get("exp")
+        if self.max_size <= 0 or exp is None:
+            return
+        with self._lock:
+            self._data[digest] = (payload, float(exp))
+            self._data.move_to_end(digest)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+token_cache = VerifiedTokenCache(JWT_CACHE_MAX_SIZE)
+# удалённый из каталога ключ мог быть скомпрометирован: его токены не должны жить в кэше
+keyring.listeners.append(token_cache.clear)
+
+
+def decode_token(token: str) -> Optional[dict]:
     try:
-        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        key = keyring.verification_key(jwt.get_unverified_header(token).get("kid"))
+        if key is None:
+            return None
+        # алгоритм берётся из ключа, а не из заголовка токена
+        return jwt.decode(token, key.verifying, algorithms=[key.algorithm])
     except PyJWTError:
         return None
 
+
+def verify_token(token: str) -> Optional[dict]:
+    digest = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(digest)
+    if payload is not None:
+        return payload
+    payload = decode_token(token)
+    if payload is not None:
+        token_cache.put(digest, payload)
+    return payload
+
 bearer = HTTPBearer(auto_error=False)
 
-def get_current_user(
-    creds: HTTPAuthorizationCredentials = Depends(bearer),
-    db: Session = Depends(get_db),
-):
+def _principal_from_token(creds: Optional[HTTPAuthorizationCredentials]) -> Tuple[int, Optional[CachedUser]]:
     if not creds or (creds.scheme or "").lower() != "bearer":
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing bearer token")
     payload = verify_token(creds.credentials)
     if not payload or payload.get("type") != "access":
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
     user_id = int(payload.get("sub", 0))
-    user = db.query(User).filter(User.id == user_id).first()
+    if is_deactivated(user_id):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found or inactive")
+    if STATELESS_ACCESS_TOKENS and "roles" in payload:
+        return user_id, principal_from_claims(user_id, payload["roles"], payload.get("ver", 0), int(payload.get("iat", 0)) * 1000)
+    return user_id, None
+
+
+def _ensure_active(user: Optional[CachedUser]) -> CachedUser:
     if not user or not user.is_active:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found or inactive")
-    return user  
+    return user
+
+
+def get_current_user(
+    creds: HTTPAuthorizationCredentials = Depends(bearer),
+    db: Session = Depends(get_db),
+):
+    user_id, user = _principal_from_token(creds)
+    set_client(db, user_id)
+    if user is None:
+        user = get_cached_user(db, user_id)
+    user = _ensure_active(user)
+    audit.touch(user_id)
+    return user
+
+
+async def get_current_user_async(
+    creds: HTTPAuthorizationCredentials = Depends(bearer),
+    db = Depends(get_async_db),
+):
+    user_id, user = _principal_from_token(creds)
+    set_client(db, user_id)
+    if user is None:
+        user = await get_cached_user_async(db, user_id)
+    user = _ensure_active(user)
+    audit.touch(user_id)
+    return user
@@ -0,0 +1,41 @@
+"""Пропускная способность sync- и async-режима (DB_ASYNC=0/1) под высокой конкурентностью.
+
+База должна быть заполнена: python init_db.py
+
+    python -m benchmarks.bench_async --concurrency 400 --duration 15
+"""
+import argparse
+import asyncio
+
+from benchmarks.common import emit, login, run_load, server, summarize
+
+
+async def _bench(port: int, mode: str, concurrency: int, duration: float):
+    tokens = await login(port, "admin@example.com", "admin123")
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    results = []
+    for name, path in (("GET /objects", "/objects"), ("GET /objects/{id}", "/objects/1"), ("GET /admin/rules", "/admin/rules")):
+        latencies, errors, elapsed = await run_load(
+            "127.0.0.1", port, lambda i: ("GET", path, None, headers),
+            concurrency=concurrency, duration=duration,
+        )
+        results.append(summarize(name, latencies, elapsed, errors, mode=mode, concurrency=concurrency))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--out", default=None, help="дописать результаты в файл (JSON lines)")
+    args = parser.parse_args()
+
+    results = []
+    for mode, flag in (("sync", "0"), ("async", "1")):
+        with server({"DB_ASYNC": flag}) as port:
+            results += asyncio.run(_bench(port, mode, args.concurrency, args.duration))
+    emit(results, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Чтение объектов с учётом выдач (object_grants) на больших данных.
+
+Данные готовит datagen.py, например для 10M объектов и 100k пользователей:
+
+    python datagen.py --users 100000 --objects 10000000 --grants 2000000 --workers 8
+    python -m benchmarks.bench_grants --threads 8 --duration 10 --explain
+
+Замеры: страница GET /objects для пользователя с выдачами (objects_page),
+проверка доступа к чужому объекту через выдачу (object_shared) и список
+выдач объекта (object_grants). С --explain на Postgres печатается план
+запроса страницы: в нём не должно быть последовательного чтения objects.
+"""
+import argparse
+import random
+import threading
+
+from sqlalchemy import func, select, text
+
+from benchmarks.common import emit, revision, run_threads, summarize
+from business import check_object_read_allowed, objects_page_query, objects_scope
+from db import SessionLocal, engine
+from models import BusinessObject, ObjectGrants, User
+
+BENCHES = ("objects_page", "object_shared", "object_grants")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", default=",".join(BENCHES), help="какие замеры запускать, через запятую")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--sample", type=int, default=1000, help="сколько выдач участвует в замерах")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--explain", action="store_true")
+    parser.add_argument("--out", default=None, help="дописать результаты в файл (JSON lines)")
+    args = parser.parse_args()
+    names = [n.strip() for n in args.only.split(",") if n.strip()]
+    unknown = set(names) - set(BENCHES)
+    if unknown:
+        parser.error(f"неизвестные замеры: {', '.join(sorted(unknown))}")
+
+    db = SessionLocal()
+    try:
+        # выборка по случайным id, а не ORDER BY random() по всей таблице
+        max_id = db.scalar(select(func.max(ObjectGrants.id)))
+        if not max_id:
+            raise SystemExit("нет выдач: запустите datagen.py с --grants")
+        rng = random.Random(args.seed)
+        picks = sorted({rng.randint(1, max_id) for _ in range(args.sample)})
+        rows = db.execute(
+            select(ObjectGrants.object_id, ObjectGrants.user_id)
+            .where(ObjectGrants.id.in_(picks), ObjectGrants.user_id.is_not(None))
+        ).all()
+        if not rows:
+            raise SystemExit("в выборке нет выдач пользователям")
+        grants = [(object_id, user_id) for object_id, user_id in rows]
+        meta = {
+            "revision": revision(),
+            "dialect": engine.dialect.name,
+            "users": db.scalar(select(func.count()).select_from(User)),
+            "objects": db.scalar(select(func.count()).select_from(BusinessObject)),
+            "grants": db.scalar(select(func.count()).select_from(ObjectGrants)),
+        }
+        if args.explain and engine.dialect.name == "postgresql":
+            q = objects_page_query(["id", "title"], objects_scope(db, grants[0][1]), args.page_size)
+            sql = q.compile(engine, compile_kwargs={"literal_binds": True})
+            for line in db.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}")).scalars():
+                print(line)
+    finally:
+        db.close()
+
+    local = threading.local()
+
+    def session():
+        if not hasattr(local, "db"):
+            local.db = SessionLocal()
+        return local.db
+
+    def objects_page(i):
+        _, user_id = grants[i % len(grants)]
+        q = objects_page_query(["id", "title"], objects_scope(session(), user_id), args.page_size)
+        return session().execute(q).all()
+
+    def object_shared(i):
+        object_id, user_id = grants[i % len(grants)]
+        db = session()
+        obj = db.get(BusinessObject, object_id)
+        check_object_read_allowed(db, user_id, obj)
+        # объект в identity map не должен подменять чтение из базы в следующих итерациях
+        db.expunge(obj)
+
+    def object_grants(i):
+        object_id, _ = grants[i % len(grants)]
+        return session().execute(select(ObjectGrants.user_id, ObjectGrants.role_id).where(ObjectGrants.object_id == object_id)).all()
+
+    fns = {"objects_page": objects_page, "object_shared": object_shared, "object_grants": object_grants}
+    results = []
+    for name in names:
+        fn = fns[name]
+        # прогрев: кэши пользователей и матрица прав заполняются до замера
+        for i in range(min(len(grants), 200)):
+            fn(i)
+        latencies, errors, elapsed = run_threads(fn, threads=args.threads, duration=args.duration)
+        results.append(summarize(name, latencies, elapsed, errors, threads=args.threads, sample=len(grants)))
+
+    emit([{**r, **meta} for r in results], args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Задержка проверки пароля и логина при разной стоимости хэша.
+
+    python -m benchmarks.bench_hashing --costs 4,8,10,12 --iterations 20
+    python -m benchmarks.bench_hashing --costs 10,12 --http --concurrency 16
+
+Без --http меряется только hasher.verify. С --http для каждой стоимости
+поднимается uvicorn с PASSWORD_HASH_ROUNDS=<cost>, регистрируется
+свежий пользователь и нагружается /users/login (нужна база с ролями).
+"""
+import argparse
+import asyncio
+import uuid
+
+from benchmarks.common import HttpClient, emit, measure, run_load, server, summarize
+from hashing import make_hasher
+
+
+async def _bench_login(port: int, name: str, cost: int, concurrency: int, duration: float):
+    email = f"bench-{cost}-{uuid.uuid4().hex[:8]}@example.com"
+    client = HttpClient("127.0.0.1", port)
+    try:
+        status, body = await client.request("POST", "/users/register", {"name": "bench", "email": email, "password": "bench-pass"})
+    finally:
+        await client.close()
+    if status != 201:
+        raise RuntimeError(f"register failed: {status} {body!r}")
+    latencies, errors, elapsed = await run_load(
+        "127.0.0.1", port,
+        lambda i: ("POST", "/users/login", {"email": email, "password": "bench-pass"}, {}),
+        concurrency=concurrency, duration=duration,
+    )
+    return summarize("POST /users/login", latencies, elapsed, errors, hasher=name, cost=cost, concurrency=concurrency)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hasher", default="bcrypt", choices=["bcrypt", "pbkdf2_sha256"])
+    parser.add_argument("--costs", default="4,8,10,12", help="раунды bcrypt или итерации pbkdf2 через запятую")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--http", action="store_true")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    results = []
+    for cost in (int(c) for c in args.costs.split(",")):
+        hasher = make_hasher(args.hasher, rounds=cost, iterations=cost)
+        stored = hasher.hash(b"bench-pass")
+        latencies, elapsed = measure(lambda: hasher.verify(b"bench-pass", stored), args.iterations)
+        results.append(summarize("verify", latencies, elapsed, hasher=args.hasher, cost=cost))
+
+        if args.http:
+            # меряется сам хэш: лимит входов одного адреса здесь только мешает
+            env = {
+                "PASSWORD_HASHER": args.hasher, "PASSWORD_HASH_ROUNDS": str(cost), "PBKDF2_ITERATIONS": str(cost),
+                "LOGIN_RATE_LIMIT_ENABLED": "0",
+            }
+            with server(env) as port:
+                results.append(asyncio.run(_bench_login(port, args.hasher, cost, args.concurrency, args.duration)))
+    emit(results, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Горячие пути авторизации: токены, проверка прав, правила, логин, список объектов.
+
+С --reset база заполняется заново через benchmarks.seed (те же флаги
+--users/--roles/--elements/--objects/--seed). Без него используются уже
+засеянные данные. In-process замеры идут в --threads потоках, HTTP-замеры
+гоняют uvicorn с --concurrency соединениями. Каждая строка вывода — JSON с
+throughput и p50/p95/p99. В ней есть ревизия git и параметры прогона,
+чтобы сравнивать версии между собой.
+
+    PASSWORD_HASH_ROUNDS=4 python -m benchmarks.bench_hot_paths --reset --users 10000 --objects 100000
+    python -m benchmarks.bench_hot_paths --only verify_token,http_objects --out bench.jsonl
+"""
+import argparse
+import asyncio
+import random
+import threading
+
+from sqlalchemy import func, select
+
+from authen import create_access_token, decode_token, verify_token
+from admin import list_rules
+from benchmarks import seed as bench_seed
+from benchmarks.common import emit, login, revision, run_load, run_threads, server, summarize
+from business import check_read_allowed
+from db import SessionLocal, engine
+from models import BusinessObject, User
+
+BENCHES = ("create_access_token", "decode_token", "verify_token", "check_read_allowed", "list_rules", "http_login", "http_objects")
+
+
+def _bench_users(db, sample: int, rng: random.Random):
+    rows = db.execute(select(User.id, User.email).where(User.email.like("bench-%@example.com")).order_by(User.id)).all()
+    if not rows:
+        raise SystemExit("нет данных бенчмарка: запустите с --reset или python -m benchmarks.seed")
+    return [tuple(r) for r in rng.sample(rows, min(sample, len(rows)))]
+
+
+def _in_process(name: str, users, admin_id: int, args):
+    user_ids = [uid for uid, _ in users]
+    local = threading.local()
+
+    def session():
+        # Session не потокобезопасна: своя на каждый поток
+        if not hasattr(local, "db"):
+            local.db = SessionLocal()
+        return local.db
+
+    tokens = [create_access_token(str(uid), minutes=60) for uid in user_ids]
+    fns = {
+        "create_access_token": lambda i: create_access_token(str(user_ids[i % len(user_ids)]), minutes=15),
+        # decode_token — полная проверка подписи, verify_token — через кэш проверенных токенов
+        "decode_token": lambda i: decode_token(tokens[i % len(tokens)]),
+        "verify_token": lambda i: verify_token(tokens[i % len(tokens)]),
+        "check_read_allowed": lambda i: check_read_allowed(
+            session(), user_ids[i % len(user_ids)], "objects", user_ids[i % len(user_ids)]
+        ),
+        "list_rules": lambda i: list_rules(session(), admin_id),
+    }
+    fn = fns[name]
+    # прогрев: кэши пользователей и матрица прав заполняются до замера
+    for i in range(len(user_ids)):
+        fn(i)
+    latencies, errors, elapsed = run_threads(fn, threads=args.threads, duration=args.duration)
+    return summarize(name, latencies, elapsed, errors, threads=args.threads)
+
+
+async def _http(port: int, names, users, args):
+    emails = [email for _, email in users]
+    results = []
+    if "http_login" in names:
+        latencies, errors, elapsed = await run_load(
+            "127.0.0.1", port,
+            lambda i: ("POST", "/users/login", {"email": emails[i % len(emails)], "password": bench_seed.BENCH_PASSWORD}, {}),
+            concurrency=args.concurrency, duration=args.duration,
+        )
+        results.append(summarize("POST /users/login", latencies, elapsed, errors, concurrency=args.concurrency))
+    if "http_objects" in names:
+        headers = []
+        for email in emails:
+            tokens = await login(port, email, bench_seed.BENCH_PASSWORD)
+            headers.append({"Authorization": f"Bearer {tokens['access_token']}"})
+        latencies, errors, elapsed = await run_load(
+            "127.0.0.1", port,
+            lambda i: ("GET", f"/objects?limit={args.page_size}", None, headers[i % len(headers)]),
+            concurrency=args.concurrency, duration=args.duration,
+        )
+        results.append(summarize("GET /objects", latencies, elapsed, errors, concurrency=args.concurrency, limit=args.page_size))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    bench_seed.add_arguments(parser)
+    parser.add_argument("--only", default=",".join(BENCHES), help="какие замеры запускать, через запятую")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--sample-users", type=int, default=100, help="сколько пользователей участвует в замерах")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--out", default=None, help="дописать результаты в файл (JSON lines)")
+    args = parser.parse_args()
+    names = [n.strip() for n in args.only.split(",") if n.strip()]
+    unknown = set(names) - set(BENCHES)
+    if unknown:
+        parser.error(f"неизвестные замеры: {', '.join(sorted(unknown))}")
+
+    if args.reset:
+        print(bench_seed.seed_from_args(args))
+    db = SessionLocal()
+    try:
+        users = _bench_users(db, args.sample_users, random.Random(args.seed))
+        admin_id = db.scalar(select(User.id).where(User.email == "admin@example.com"))
+        # фактический объём данных, а не флаги: без --reset база могла быть засеяна иначе
+        meta = {
+            "revision": revision(),
+            "dialect": engine.dialect.name,
+            "users": db.scalar(select(func.count()).select_from(User)),
+            "objects": db.scalar(select(func.count()).select_from(BusinessObject)),
+        }
+    finally:
+        db.close()
+
+    results = [_in_process(n, users, admin_id, args) for n in names if not n.startswith("http_")]
+    http_names = [n for n in names if n.startswith("http_")]
+    if http_names:
+        # нагрузка идёт с одного адреса: лимит входов отключён
+        with server({"LOGIN_RATE_LIMIT_ENABLED": "0"}) as port:
+            results += asyncio.run(_http(port, http_names, users, args))
+
+    emit([{**r, **meta} for r in results], args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Перебор паролей против /users/login: CPU сервера с лимитом и без.
+
+    python -m benchmarks.bench_login_attack --duration 10 --concurrency 64
+    python -m benchmarks.bench_login_attack --modes on --attack-ips 4 --workers 2
+
+Для каждого режима поднимается uvicorn (LOGIN_RATE_LIMIT_ENABLED=1/0),
+регистрируются аккаунты-жертвы и легитимные пользователи (нужна база с
+ролями). Атака шлёт неверные пароли к жертвам и к несуществующим email
+с небольшого набора адресов в X-Forwarded-For; легитимные пользователи
+входят с собственных адресов раз в --legit-interval секунд. Печатается
+CPU сервера (на секунду замера и на запрос), ответы атаке по статусам
+и задержки легитимных входов. С лимитом CPU должен оставаться
+ограниченным, а легитимные входы — проходить.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+from benchmarks.common import HttpClient, cpu_seconds, emit, percentile, revision, run_load, server_process
+
+MODES = ("on", "off")
+
+
+async def _register(port: int, emails, password: str) -> None:
+    client = HttpClient("127.0.0.1", port)
+    try:
+        for email in emails:
+            status, body = await client.request("POST", "/users/register", {"name": "bench", "email": email, "password": password})
+            if status != 201:
+                raise RuntimeError(f"register failed: {status} {body!r}")
+    finally:
+        await client.close()
+
+
+async def _legit(port: int, users, password: str, interval: float, duration: float):
+    latencies, failures = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def user(n: int, email: str) -> None:
+        nonlocal failures
+        client = HttpClient("127.0.0.1", port)
+        headers = {"X-Forwarded-For": f"10.1.{n // 250}.{n % 250 + 1}"}
+        try:
+            # пользователи входят вразнобой, а не залпом
+            await asyncio.sleep(interval * n / len(users))
+            while time.perf_counter() < deadline:
+                t0 = time.perf_counter()
+                status, _ = await client.request("POST", "/users/login", {"email": email, "password": password}, headers)
+                if status == 200:
+                    latencies.append(time.perf_counter() - t0)
+                else:
+                    failures += 1
+                await asyncio.sleep(interval)
+        finally:
+            await client.close()
+
+    await asyncio.gather(*(user(n, email) for n, email in enumerate(users)))
+    return latencies, failures
+
+
+async def _run(port: int, pid: int, args, mode: str):
+    tag = uuid.uuid4().hex[:8]
+    victims = [f"victim-{tag}-{i}@example.com" for i in range(args.victims)]
+    users = [f"legit-{tag}-{i}@example.com" for i in range(args.legit_users)]
+    await _register(port, victims + users, "right-pass")
+    ips = [f"198.51.100.{i + 1}" for i in range(args.attack_ips)]
+
+    def attack(i: int):
+        # половина — к существующим аккаунтам (это bcrypt), половина — к несуществующим
+        email = victims[i % len(victims)] if i % 2 else f"nobody-{i}@example.com"
+        return "POST", "/users/login", {"email": email, "password": "wrong-pass"}, {"X-Forwarded-For": ips[i % len(ips)]}
+
+    statuses = {}
+    cpu_before = cpu_seconds(pid)
+    started = time.perf_counter()
+    (_, _, _), (legit_latencies, legit_failures) = await asyncio.gather(
+        run_load("127.0.0.1", port, attack, concurrency=args.concurrency, duration=args.duration, statuses=statuses),
+        _legit(port, users, "right-pass", args.legit_interval, args.duration),
+    )
+    elapsed = time.perf_counter() - started
+    cpu = cpu_seconds(pid) - cpu_before
+    legit = sorted(legit_latencies)
+    return {
+        "name": "login_attack",
+        "rate_limit": mode,
+        "elapsed_s": round(elapsed, 3),
+        "server_cpu_s": round(cpu, 3),
+        "server_cpu_per_s": round(cpu / elapsed, 3),
+        # атака идёт без пауз и занимает всё, что даёт сервер; сравнивать стоит CPU на запрос
+        "server_cpu_ms_per_request": round(cpu * 1000 / max(1, sum(statuses.values()) + len(legit) + legit_failures), 3),
+        "attack_requests": sum(statuses.values()),
+        "attack_statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "legit_ok": len(legit),
+        "legit_failed": legit_failures,
+        "legit_p50_ms": round(percentile(legit, 50) * 1000, 3),
+        "legit_p95_ms": round(percentile(legit, 95) * 1000, 3),
+        "concurrency": args.concurrency,
+        "attack_ips": args.attack_ips,
+        "workers": args.workers,
+        "revision": revision(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modes", default=",".join(MODES), help="on/off через запятую")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=64, help="параллельных соединений атаки")
+    parser.add_argument("--attack-ips", type=int, default=8)
+    parser.add_argument("--victims", type=int, default=50)
+    parser.add_argument("--legit-users", type=int, default=20)
+    parser.add_argument("--legit-interval", type=float, default=5.0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--out", default=None, help="дописать результаты в файл (JSON lines)")
+    args = parser.parse_args()
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"неизвестные режимы: {', '.join(sorted(unknown))}")
+
+    results = []
+    for mode in modes:
+        env = {"LOGIN_RATE_LIMIT_ENABLED": "1" if mode == "on" else "0"}
+        with server_process(env, workers=args.workers) as (port, proc):
+            results.append(asyncio.run(_run(port, proc.pid, args, mode)))
+    emit(results, args.out)
+
+
+if __name__ == "__main__":
+    main()
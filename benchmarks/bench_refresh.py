@@ -0,0 +1,70 @@
+"""Задержка обмена refresh-токена по мере роста таблицы refresh_tokens.
+
+Таблица ступенчато дозаполняется случайными записями (часть уже
+истекла) до каждого размера из --sizes, после чего меряется обмен
+свежевыданных токенов так же, как в /users/refresh: погасить старый
+и выдать новый. Меряется SQL-хранилище независимо от TOKEN_STORE.
+
+    python -m benchmarks.bench_refresh --sizes 100000,1000000,10000000
+"""
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from benchmarks.common import emit, measure, summarize
+from db import SessionLocal, engine
+from models import Base, RefreshToken, User
+from tokens import SqlTokenStore
+
+CHUNK = 10_000
+
+
+def _fill(db, user_id: int, count: int) -> None:
+    now = datetime.utcnow()
+    while count > 0:
+        n = min(CHUNK, count)
+        rows = [{
+            "user_id": user_id,
+            "token_hash": os.urandom(32),
+            "created_at": now,
+            # четверть записей уже истекла и ждёт чистки
+            "expires_at": now + timedelta(days=random.choice((-1, 7, 14, 14))),
+        } for _ in range(n)]
+        db.execute(insert(RefreshToken), rows)
+        db.commit()
+        count -= n
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    store = SqlTokenStore()
+    db = SessionLocal()
+    results = []
+    try:
+        user_id = db.scalar(select(func.min(User.id)))
+        if user_id is None:
+            raise SystemExit("нет пользователей: сначала python init_db.py")
+        for size in (int(s) for s in args.sizes.split(",")):
+            current = db.scalar(select(func.count()).select_from(RefreshToken))
+            if current < size:
+                _fill(db, user_id, size - current)
+            tokens = [store.issue(db, user_id) for _ in range(args.iterations)]
+            it = iter(tokens)
+            latencies, elapsed = measure(lambda: store.issue(db, store.take(db, next(it))), args.iterations)
+            results.append(summarize("refresh_token", latencies, elapsed, table_rows=max(size, current)))
+    finally:
+        db.close()
+    emit(results, args.out)
+
+
+if __name__ == "__main__":
+    main()
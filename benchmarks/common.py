@@ -0,0 +1,264 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, int(round(p / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+def summarize(name: str, latencies: List[float], elapsed: float, errors: int = 0, **extra) -> Dict:
+    values = sorted(latencies)
+    result = {
+        "name": name,
+        "requests": len(values),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(values) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+    }
+    result.update(extra)
+    return result
+
+
+def revision() -> str:
+    # к какой версии кода относятся цифры
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def emit(results: List[Dict], out: Optional[str] = None) -> None:
+    text = "\n".join(json.dumps(r, ensure_ascii=False) for r in results)
+    print(text)
+    if out:
+        with open(out, "a", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+def measure(fn: Callable[[], object], iterations: int) -> Tuple[List[float], float]:
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    return latencies, time.perf_counter() - started
+
+
+def run_threads(fn: Callable[[int], object], *, threads: int, duration: float) -> Tuple[List[float], int, float]:
+    # fn(i) в нескольких потоках до истечения duration; исключение — ошибка
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(n: int) -> None:
+        nonlocal errors
+        local: List[float] = []
+        failed = 0
+        i = 0
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            try:
+                fn(n * 1_000_000 + i)
+            except Exception:
+                failed += 1
+            else:
+                local.append(time.perf_counter() - t0)
+            i += 1
+        with lock:
+            latencies.extend(local)
+            errors += failed
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return latencies, errors, time.perf_counter() - started
+
+
+class HttpClient:
+    # минимальный HTTP/1.1 клиент с keep-alive: бенчмарку не нужны
+    # зависимости сверх requirements.txt, а потоки на клиенте сами
+    # становятся узким местом при высокой конкурентности
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def _connect(self) -> None:
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method: str, path: str, body=None, headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes]:
+        if self.writer is None:
+            await self._connect()
+        data = b"" if body is None else json.dumps(body).encode()
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", f"Content-Length: {len(data)}"]
+        if body is not None:
+            lines.append("Content-Type: application/json")
+        for k, v in (headers or {}).items():
+            lines.append(f"{k}: {v}")
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + data)
+        await self.writer.drain()
+
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        status_line, *header_lines = head.decode("latin-1").split("\r\n")
+        status = int(status_line.split(" ")[1])
+        resp_headers = {}
+        for line in header_lines:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                resp_headers[k.strip().lower()] = v.strip()
+        if resp_headers.get("transfer-encoding") == "chunked":
+            chunks = []
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).strip(), 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            payload = b"".join(chunks)
+        else:
+            payload = await self.reader.readexactly(int(resp_headers.get("content-length", "0")))
+        if resp_headers.get("connection") == "close":
+            await self.close()
+        return status, payload
+
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+async def run_load(
+    host: str,
+    port: int,
+    make_request: Callable[[int], Tuple[str, str, object, Dict[str, str]]],
+    *,
+    concurrency: int,
+    duration: float,
+    statuses: Optional[Dict[int, int]] = None,
+) -> Tuple[List[float], int, float]:
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(n: int) -> None:
+        nonlocal errors
+        client = HttpClient(host, port)
+        i = 0
+        try:
+            while time.perf_counter() < deadline:
+                method, path, body, headers = make_request(n * 1_000_000 + i)
+                i += 1
+                t0 = time.perf_counter()
+                try:
+                    status, _ = await client.request(method, path, body, headers)
+                except (OSError, asyncio.IncompleteReadError):
+                    errors += 1
+                    await client.close()
+                    continue
+                if statuses is not None:
+                    statuses[status] = statuses.get(status, 0) + 1
+                if status >= 400:
+                    errors += 1
+                else:
+                    latencies.append(time.perf_counter() - t0)
+        finally:
+            await client.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def server_process(env: Optional[Dict[str, str]] = None, port: Optional[int] = None, workers: int = 1) -> Iterator[Tuple[int, subprocess.Popen]]:
+    port = port or free_port()
+    proc_env = dict(os.environ)
+    proc_env.update(env or {})
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT,
+        env=proc_env,
+    )
+    try:
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+                break
+            except OSError:
+                if proc.poll() is not None:
+                    raise RuntimeError("uvicorn exited during startup")
+                time.sleep(0.2)
+        else:
+            raise RuntimeError("uvicorn did not start in 30s")
+        yield port, proc
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+@contextmanager
+def server(env: Optional[Dict[str, str]] = None, port: Optional[int] = None, workers: int = 1) -> Iterator[int]:
+    with server_process(env, port, workers) as (port, _):
+        yield port
+
+
+def cpu_seconds(pid: int) -> float:
+    # user+system процесса и всех его потомков (воркеры uvicorn); только Linux
+    total = 0.0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/stat") as f:
+                # имя процесса в скобках может содержать пробелы
+                fields = f.read().rsplit(")", 1)[1].split()
+            total += (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+            for tid in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{tid}/children") as f:
+                    pending += [int(c) for c in f.read().split()]
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+async def login(port: int, email: str, password: str) -> Dict:
+    client = HttpClient("127.0.0.1", port)
+    try:
+        status, body = await client.request("POST", "/users/login", {"email": email, "password": password})
+    finally:
+        await client.close()
+    if status != 200:
+        raise RuntimeError(f"login failed: {status} {body!r}")
+    return json.loads(body)
@@ -0,0 +1,118 @@
+"""Заполнение базы для бенчмарков поверх init_db.seed.
+
+Генерация детерминирована (--seed), поэтому прогоны разных версий
+сравнимы между собой. У всех пользователей пароль bench-pass и один
+общий хэш. Стоимость хэша берётся из PASSWORD_HASH_ROUNDS, так что для
+нагрузки на логин её стоит выставлять явно.
+
+    python -m benchmarks.seed --reset --users 10000 --roles 20 --elements 50 --objects 100000
+"""
+import argparse
+import random
+import time
+
+from sqlalchemy import func, insert, select
+
+import init_db
+from db import SessionLocal, engine
+from hashing import hasher
+from models import AccessRolesRules, Base, BusinessElements, BusinessObject, Roles, User, UserRoles
+from permissions import FLAGS
+
+CHUNK = 5000
+BENCH_PASSWORD = "bench-pass"
+
+
+def bench_email(i: int) -> str:
+    return f"bench-{i}@example.com"
+
+
+def _insert_chunks(db, model, rows) -> None:
+    for start in range(0, len(rows), CHUNK):
+        db.execute(insert(model), rows[start:start + CHUNK])
+    db.commit()
+
+
+def seed(users: int, roles: int, elements: int, rules_per_role: int, objects: int, rng: random.Random) -> dict:
+    db = SessionLocal()
+    try:
+        if db.scalar(select(Roles.id).where(Roles.name == "admin")) is None:
+            init_db.seed()
+        if db.scalar(select(Roles.id).where(Roles.name == "bench-role-0")) is not None:
+            raise SystemExit("данные бенчмарка уже есть: запустите с --reset")
+        user_role_id = db.scalar(select(Roles.id).where(Roles.name == "user"))
+        objects_id = db.scalar(select(BusinessElements.id).where(BusinessElements.code == "objects"))
+
+        _insert_chunks(db, Roles, [{"name": f"bench-role-{i}"} for i in range(roles)])
+        _insert_chunks(db, BusinessElements, [{"code": f"bench-element-{i}"} for i in range(elements)])
+        role_ids = list(db.scalars(select(Roles.id).where(Roles.name.like("bench-role-%")).order_by(Roles.id)))
+        element_ids = list(db.scalars(select(BusinessElements.id).where(BusinessElements.code.like("bench-element-%")).order_by(BusinessElements.id)))
+
+        rules = []
+        for role_id in role_ids:
+            for element_id in rng.sample(element_ids + [objects_id], min(rules_per_role, len(element_ids) + 1)):
+                rules.append({
+                    "role_id": role_id,
+                    "element_id": element_id,
+                    **{f"{name}_permission": rng.random() < 0.5 for name in FLAGS},
+                })
+        _insert_chunks(db, AccessRolesRules, rules)
+
+        password_hash = hasher.hash(BENCH_PASSWORD.encode())
+        _insert_chunks(db, User, [
+            {"name": f"Bench {i}", "email": bench_email(i), "password_hash": password_hash, "is_active": True}
+            for i in range(users)
+        ])
+        user_ids = list(db.scalars(select(User.id).where(User.email.like("bench-%@example.com")).order_by(User.id)))
+
+        # у каждого роль user (чтение своих объектов) и до двух случайных ролей сверху
+        links = []
+        for user_id in user_ids:
+            links.append({"user_id": user_id, "role_id": user_role_id})
+            for role_id in rng.sample(role_ids, min(rng.randint(0, 2), len(role_ids))):
+                links.append({"user_id": user_id, "role_id": role_id})
+        _insert_chunks(db, UserRoles, links)
+
+        _insert_chunks(db, BusinessObject, [
+            {"title": f"Object {i}", "description": "bench", "owner_id": rng.choice(user_ids)}
+            for i in range(objects)
+        ] if user_ids else [])
+
+        return {
+            "users": db.scalar(select(func.count()).select_from(User)),
+            "roles": db.scalar(select(func.count()).select_from(Roles)),
+            "elements": db.scalar(select(func.count()).select_from(BusinessElements)),
+            "rules": db.scalar(select(func.count()).select_from(AccessRolesRules)),
+            "objects": db.scalar(select(func.count()).select_from(BusinessObject)),
+        }
+    finally:
+        db.close()
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--roles", type=int, default=10)
+    parser.add_argument("--elements", type=int, default=20)
+    parser.add_argument("--rules-per-role", type=int, default=10)
+    parser.add_argument("--objects", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="удалить все таблицы перед заполнением")
+
+
+def seed_from_args(args) -> dict:
+    if args.reset:
+        Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    started = time.perf_counter()
+    counts = seed(args.users, args.roles, args.elements, args.rules_per_role, args.objects, random.Random(args.seed))
+    return {**counts, "elapsed_s": round(time.perf_counter() - started, 3)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    print(seed_from_args(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
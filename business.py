@@ -1,36 +1,58 @@
-from typing import List, Optional
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import delete, exists, or_, select, true, union_all
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status
 
-from models import UserRoles, BusinessElements, AccessRolesRules
+from models import BusinessObject, ObjectGrants, User
+from permissions import get_matrix, invalidate, READ, READ_ALL, CREATE, UPDATE, UPDATE_ALL, DELETE, DELETE_ALL
+from user_cache import get_cached_user
 
+OBJECTS_PAGE_MAX = int(os.getenv("OBJECTS_PAGE_MAX", "500"))
+OBJECT_FIELDS = ("id", "title", "description", "owner_id")
 
-def get_role_ids_for_user(db: Session, user_id: int) -> List[int]:
-    rows = db.query(UserRoles.role_id).filter(UserRoles.user_id == user_id).all()
-    return [r[0] for r in rows]
+# действие -> (бит для своих объектов, бит для всех)
+ACTIONS = {
+    "read": (READ, READ_ALL),
+    "create": (CREATE, CREATE),
+    "update": (UPDATE, UPDATE_ALL),
+    "delete": (DELETE, DELETE_ALL),
+}
 
 
-def get_element_id(db: Session, code: str) -> int:
-    elem = db.query(BusinessElements.id).filter(BusinessElements.code == code).first()
-    if not elem:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Неизвестный элемент '{code}'"
-        )
-    return elem[0]
+def unknown_element(element_code: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail=f"Неизвестный элемент '{element_code}'"
+    )
 
 
-def get_rules(db: Session, role_ids: List[int], element_id: int) -> List[AccessRolesRules]:
-    if not role_ids:
-        return []
-    return (
-        db.query(AccessRolesRules)
-        .filter(
-            AccessRolesRules.role_id.in_(role_ids),
-            AccessRolesRules.element_id == element_id
-        )
-        .all()
-    )
+def get_permission_mask(db: Session, user_id: int, element_code: str) -> Optional[int]:
+    matrix = get_matrix(db)
+    element_id = matrix.element_ids.get(element_code)
+    if element_id is None:
+        # элемент мог появиться в базе после загрузки матрицы
+        invalidate()
+        matrix = get_matrix(db)
+        element_id = matrix.element_ids.get(element_code)
+    if element_id is None:
+        raise unknown_element(element_code)
+    entry = get_cached_user(db, user_id)
+    if entry is None:
+        return None
+    return entry.mask_for(matrix, element_id)
+
+
+def ensure_read(mask: Optional[int], user_id: int, resource_owner_id: Optional[int]) -> None:
+    if mask is None:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Нет правил доступа")
+
+    if mask & READ_ALL:
+        return
+    if resource_owner_id is not None and mask & READ and resource_owner_id == user_id:
+        return
+
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Недостаточно прав")
 
 
 def check_read_allowed(
@@ -39,17 +61,207 @@ def check_read_allowed(
     element_code: str,
     resource_owner_id: Optional[int] = None,
 ) -> None:
-    role_ids = get_role_ids_for_user(db, user_id)
-    element_id = get_element_id(db, element_code)
-    rules = get_rules(db, role_ids, element_id)
+    mask = get_permission_mask(db, user_id, element_code)
+    ensure_read(mask, user_id, resource_owner_id)
 
-    if not rules:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Нет правил доступа")
 
-    for r in rules:
-        if r.read_all_permission:
-            return
-        if resource_owner_id is not None and r.read_permission and resource_owner_id == user_id:
-            return
+def is_allowed(mask: Optional[int], action: str, user_id: int, owner_id: Optional[int]) -> bool:
+    if mask is None:
+        return False
+    own_bit, all_bit = ACTIONS[action]
+    if mask & all_bit:
+        return True
+    return bool(mask & own_bit) and owner_id is not None and owner_id == user_id
 
-    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Недостаточно прав")
+
+def authorize_many(
+    db: Session,
+    user_id: int,
+    checks: Sequence[Tuple[str, str, Optional[int]]],
+) -> List[bool]:
+    # роли и матрица читаются один раз на весь набор проверок
+    # коды элементов приходят от клиента: неизвестный код — просто отказ, без
+    # перезагрузки матрицы. Новые элементы и так сбрасывают её через rules_changed
+    matrix = get_matrix(db)
+    entry = get_cached_user(db, user_id)
+    if entry is None or not entry.is_active:
+        return [False] * len(checks)
+
+    decisions = []
+    for element_code, action, owner_id in checks:
+        element_id = matrix.element_ids.get(element_code)
+        mask = entry.mask_for(matrix, element_id) if element_id is not None else None
+        decisions.append(is_allowed(mask, action, user_id, owner_id))
+    return decisions
+
+
+def grantee_roles(db: Session, user_id: int) -> List[int]:
+    # выдача на роль действует и на роли, которые от неё наследуют
+    entry = get_cached_user(db, user_id)
+    if entry is None:
+        return []
+    return sorted(get_matrix(db).expand_roles(entry.role_ids))
+
+
+def shared_ids(user_id: int, role_ids: Sequence[int]):
+    # объекты, выданные пользователю или его ролям: индексы (user_id, object_id)
+    # и (role_id, object_id), таблица объектов не сканируется
+    parts = [select(ObjectGrants.object_id).where(ObjectGrants.user_id == user_id)]
+    if role_ids:
+        parts.append(select(ObjectGrants.object_id).where(ObjectGrants.role_id.in_(role_ids)))
+    return parts
+
+
+def objects_filter(mask: Optional[int], user_id: int, role_ids: Sequence[int]):
+    if mask is not None and mask & READ_ALL:
+        return true()
+    parts = shared_ids(user_id, role_ids)
+    if mask is not None and mask & READ:
+        parts.insert(0, select(BusinessObject.id).where(BusinessObject.owner_id == user_id))
+    # свои и выданные — один IN по id: план строится от индексов владельца и
+    # выдач, а не от перебора объектов с OR на каждую строку
+    return BusinessObject.id.in_(union_all(*parts))
+
+
+def objects_scope(db: Session, user_id: int):
+    return objects_filter(get_permission_mask(db, user_id, "objects"), user_id, grantee_roles(db, user_id))
+
+
+def object_shared_query(object_id: int, user_id: int, role_ids: Sequence[int]):
+    # «кто видит объект X» — индекс по object_id
+    who = ObjectGrants.user_id == user_id
+    if role_ids:
+        who = or_(who, ObjectGrants.role_id.in_(role_ids))
+    return select(exists().where(ObjectGrants.object_id == object_id, who))
+
+
+def check_object_read_allowed(db: Session, user_id: int, obj: BusinessObject) -> None:
+    mask = get_permission_mask(db, user_id, "objects")
+    if is_allowed(mask, "read", user_id, obj.owner_id):
+        return
+    # в выдачи смотрим, только если правил ролей не хватило
+    if db.scalar(object_shared_query(obj.id, user_id, grantee_roles(db, user_id))):
+        return
+    ensure_read(mask, user_id, obj.owner_id)
+
+
+def get_object_or_404(db: Session, object_id: int) -> BusinessObject:
+    obj = db.query(BusinessObject).filter(BusinessObject.id == object_id).first()
+    if not obj:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Объект не найден")
+    return obj
+
+
+def ensure_can_share(db: Session, user_id: int, obj: BusinessObject) -> None:
+    # делиться объектом может тот, кто вправе его изменять
+    if not is_allowed(get_permission_mask(db, user_id, "objects"), "update", user_id, obj.owner_id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Недостаточно прав")
+
+
+def grant_to_dict(grant: ObjectGrants) -> Dict:
+    return {"id": grant.id, "object_id": grant.object_id, "user_id": grant.user_id, "role_id": grant.role_id}
+
+
+def list_grants(db: Session, user_id: int, object_id: int) -> List[Dict]:
+    obj = get_object_or_404(db, object_id)
+    ensure_can_share(db, user_id, obj)
+    grants = db.execute(select(ObjectGrants).where(ObjectGrants.object_id == object_id).order_by(ObjectGrants.id)).scalars()
+    return [grant_to_dict(g) for g in grants]
+
+
+def _grantee(db: Session, grantee_user_id: Optional[int], role_name: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    if role_name is not None:
+        role_id = get_matrix(db).role_ids.get(role_name)
+        if role_id is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Role '{role_name}' not found")
+        return None, role_id
+    if db.get(User, grantee_user_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Пользователь не найден")
+    return grantee_user_id, None
+
+
+def _grant_insert(dialect: str, object_id: int, to_user: Optional[int], to_role: Optional[int]):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=f"Выдачи не поддерживаются для {dialect}")
+    # два параллельных PUT одной выдачи: второй ничего не вставит, а не упадёт
+    target = ["user_id", "object_id"] if to_user is not None else ["role_id", "object_id"]
+    return insert(ObjectGrants).values(object_id=object_id, user_id=to_user, role_id=to_role).on_conflict_do_nothing(index_elements=target)
+
+
+def add_grant(db: Session, user_id: int, object_id: int, grantee_user_id: Optional[int], role_name: Optional[str]) -> Dict:
+    obj = get_object_or_404(db, object_id)
+    ensure_can_share(db, user_id, obj)
+    to_user, to_role = _grantee(db, grantee_user_id, role_name)
+    db.execute(_grant_insert(db.get_bind().dialect.name, object_id, to_user, to_role))
+    db.commit()
+    grant = db.execute(select(ObjectGrants).where(
+        ObjectGrants.object_id == object_id,
+        ObjectGrants.user_id == to_user if to_user is not None else ObjectGrants.role_id == to_role,
+    )).scalar_one()
+    return grant_to_dict(grant)
+
+
+def remove_grant(db: Session, user_id: int, object_id: int, grantee_user_id: Optional[int], role_name: Optional[str]) -> None:
+    obj = get_object_or_404(db, object_id)
+    ensure_can_share(db, user_id, obj)
+    to_user, to_role = _grantee(db, grantee_user_id, role_name)
+    db.execute(delete(ObjectGrants).where(
+        ObjectGrants.object_id == object_id,
+        ObjectGrants.user_id == to_user if to_user is not None else ObjectGrants.role_id == to_role,
+    ))
+    db.commit()
+
+
+def parse_object_fields(fields: Optional[str]) -> List[str]:
+    if not fields:
+        return list(OBJECT_FIELDS)
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [n for n in names if n not in OBJECT_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Неизвестные поля: {', '.join(unknown)}"
+        )
+    # id нужен как курсор следующей страницы
+    if "id" not in names:
+        names.insert(0, "id")
+    return names
+
+
+def objects_query(
+    fields: List[str],
+    acl,
+    after_id: Optional[int] = None,
+    title_prefix: Optional[str] = None,
+    owner_id: Optional[int] = None,
+):
+    # keyset по id: страница стоит одинаково на любой глубине, в отличие от OFFSET
+    q = select(*(getattr(BusinessObject, f) for f in fields)).where(acl).order_by(BusinessObject.id)
+    if after_id is not None:
+        q = q.where(BusinessObject.id > after_id)
+    if owner_id is not None:
+        q = q.where(BusinessObject.owner_id == owner_id)
+    if title_prefix:
+        q = q.where(BusinessObject.title.startswith(title_prefix, autoescape=True))
+    return q
+
+
+def objects_page_query(
+    fields: List[str],
+    acl,
+    limit: int,
+    after_id: Optional[int] = None,
+    title_prefix: Optional[str] = None,
+    owner_id: Optional[int] = None,
+):
+    return objects_query(fields, acl, after_id, title_prefix, owner_id).limit(limit + 1)
+
+
+def objects_page(rows, limit: int) -> Dict:
+    items = [dict(r._mapping) for r in rows[:limit]]
+    next_cursor = items[-1]["id"] if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,53 @@
+from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from business import ensure_read, unknown_element, is_allowed, objects_filter, object_shared_query
+from models import BusinessObject
+from permissions import get_matrix_async, invalidate
+from user_cache import get_cached_user_async
+
+
+async def get_permission_mask(db: AsyncSession, user_id: int, element_code: str) -> Optional[int]:
+    matrix = await get_matrix_async(db)
+    element_id = matrix.element_ids.get(element_code)
+    if element_id is None:
+        invalidate()
+        matrix = await get_matrix_async(db)
+        element_id = matrix.element_ids.get(element_code)
+    if element_id is None:
+        raise unknown_element(element_code)
+    entry = await get_cached_user_async(db, user_id)
+    if entry is None:
+        return None
+    return entry.mask_for(matrix, element_id)
+
+
+async def check_read_allowed(
+    db: AsyncSession,
+    user_id: int,
+    element_code: str,
+    resource_owner_id: Optional[int] = None,
+) -> None:
+    mask = await get_permission_mask(db, user_id, element_code)
+    ensure_read(mask, user_id, resource_owner_id)
+
+
+async def grantee_roles(db: AsyncSession, user_id: int) -> List[int]:
+    entry = await get_cached_user_async(db, user_id)
+    if entry is None:
+        return []
+    return sorted((await get_matrix_async(db)).expand_roles(entry.role_ids))
+
+
+async def objects_scope(db: AsyncSession, user_id: int):
+    mask = await get_permission_mask(db, user_id, "objects")
+    return objects_filter(mask, user_id, await grantee_roles(db, user_id))
+
+
+async def check_object_read_allowed(db: AsyncSession, user_id: int, obj: BusinessObject) -> None:
+    mask = await get_permission_mask(db, user_id, "objects")
+    if is_allowed(mask, "read", user_id, obj.owner_id):
+        return
+    if await db.scalar(object_shared_query(obj.id, user_id, await grantee_roles(db, user_id))):
+        return
+    ensure_read(mask, user_id, obj.owner_id)
@@ -0,0 +1,345 @@
+"""Генератор больших синтетических наборов данных для стендов.
+
+    python datagen.py --users 1000000 --objects 5000000 --workers 8
+
+Данные пишутся порциями по --chunk строк, на Postgres через COPY, иначе
+многострочными INSERT. Порцию пользователей пишет вместе с их ролями одна
+транзакция. Вместе с порцией в таблицу datagen_progress записывается
+отметка, поэтому повторный запуск пропускает готовые порции и дописывает
+недостающие, в том числе после увеличения --users/--objects. Содержимое
+порции зависит только от --seed и её номера, так что повтор после падения
+даёт те же строки.
+
+Пароль у всех пользователей один (--password), хэш считается один раз
+со стоимостью --hash-rounds. При первом логине хэш пересчитается под
+текущие PASSWORD_HASHER/PASSWORD_HASH_ROUNDS.
+"""
+import argparse
+import csv
+import io
+import json
+import random
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, create_engine, delete, func, insert, select
+from sqlalchemy.pool import NullPool
+
+import db
+from hashing import PASSWORD_HASHER, make_hasher
+from models import AccessRolesRules, Base, BusinessElements, BusinessObject, ObjectGrants, Roles, User, UserRoles
+from permissions import FLAGS
+
+progress = Table(
+    "datagen_progress",
+    MetaData(),
+    Column("stage", String(20), primary_key=True),
+    Column("chunk", Integer, primary_key=True),
+    Column("chunk_size", Integer, nullable=False),
+    # сколько пользователей/объектов порции уже записано; меньше chunk_size
+    # только у последней порции, её дописывает следующий запуск с большим объёмом
+    Column("written", Integer, nullable=False),
+    Column("rows", Integer, nullable=False),
+    Column("finished_at", DateTime, nullable=False),
+)
+
+# движок процесса-воркера; в главном процессе — db.engine
+_engine = None
+# параметры, одинаковые для всех порций, передаются воркеру один раз
+_ctx: Dict = {}
+
+
+def email_for(i: int) -> str:
+    return f"gen-{i}@example.com"
+
+
+def _rng(seed: int, stage: str, chunk: int, offset: int = 0) -> random.Random:
+    return random.Random(f"{seed}:{stage}:{chunk}:{offset}")
+
+
+def _worker_init(url: str, ctx: Dict) -> None:
+    global _engine
+    # соединения родителя после fork не трогаем, у воркера свои
+    db.engine.dispose(close=False)
+    _engine = create_engine(url, poolclass=NullPool)
+    _ctx.update(ctx)
+
+
+def _copy(conn, table: str, columns: Tuple[str, ...], rows: List[Tuple]) -> None:
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+    with conn.connection.dbapi_connection.cursor() as cur:
+        cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def _mark(conn, stage: str, chunk: int, written: int, rows: int) -> None:
+    where = (progress.c.stage == stage) & (progress.c.chunk == chunk)
+    prev = conn.execute(select(progress.c.rows).where(where)).scalar() or 0
+    conn.execute(delete(progress).where(where))
+    conn.execute(insert(progress).values(
+        stage=stage, chunk=chunk, chunk_size=_ctx["chunk"], written=written, rows=prev + rows, finished_at=datetime.utcnow()
+    ))
+
+
+def _bounds(task: Tuple[int, int], total: int) -> Tuple[int, int]:
+    chunk, offset = task
+    start = chunk * _ctx["chunk"]
+    return start + offset, min(start + _ctx["chunk"], total)
+
+
+def _users_chunk(task: Tuple[int, int]) -> int:
+    chunk, offset = task
+    start, end = _bounds(task, _ctx["users"])
+    rng = _rng(_ctx["seed"], "users", chunk, offset)
+    emails = [email_for(i) for i in range(start, end)]
+    role_ids = _ctx["role_ids"]
+    with _engine.begin() as conn:
+        if _ctx["copy"]:
+            _copy(conn, "users", ("name", "email", "password_hash", "is_active"), [
+                (f"Generated {i}", email, _ctx["password_hash"], "true") for i, email in zip(range(start, end), emails)
+            ])
+            ids = conn.execute(select(User.id).where(User.email.in_(emails)).order_by(User.id)).scalars().all()
+        else:
+            ids = conn.execute(insert(User).returning(User.id, sort_by_parameter_order=True), [
+                {"name": f"Generated {i}", "email": email, "password_hash": _ctx["password_hash"], "is_active": True}
+                for i, email in zip(range(start, end), emails)
+            ]).scalars().all()
+
+        links = []
+        for user_id in ids:
+            if _ctx["base_role_id"] is not None:
+                links.append((user_id, _ctx["base_role_id"]))
+            for role_id in rng.sample(role_ids, min(rng.randint(0, _ctx["max_roles"]), len(role_ids))):
+                links.append((user_id, role_id))
+        if _ctx["copy"]:
+            _copy(conn, "user_roles", ("user_id", "role_id"), links)
+        elif links:
+            conn.execute(insert(UserRoles), [{"user_id": u, "role_id": r} for u, r in links])
+        _mark(conn, "users", chunk, end - chunk * _ctx["chunk"], len(ids) + len(links))
+    return len(ids) + len(links)
+
+
+def _owner_picker(rng: random.Random):
+    lo, hi, ids = _ctx["owners"]
+    # id без дыр — хватает диапазона, иначе выбираем из списка
+    if ids is None:
+        return lambda: rng.randint(lo, hi)
+    return lambda: ids[rng.randrange(len(ids))]
+
+
+def _objects_chunk(task: Tuple[int, int]) -> int:
+    chunk, offset = task
+    start, end = _bounds(task, _ctx["objects"])
+    rng = _rng(_ctx["seed"], "objects", chunk, offset)
+    owner = _owner_picker(rng)
+    rows = [(f"Generated object {i}", f"synthetic #{i}", owner()) for i in range(start, end)]
+    with _engine.begin() as conn:
+        if _ctx["copy"]:
+            _copy(conn, "objects", ("title", "description", "owner_id"), rows)
+        else:
+            conn.execute(insert(BusinessObject), [{"title": t, "description": d, "owner_id": o} for t, d, o in rows])
+        _mark(conn, "objects", chunk, end - chunk * _ctx["chunk"], len(rows))
+    return len(rows)
+
+
+def _grants_chunk(task: Tuple[int, int]) -> int:
+    chunk, _ = task
+    start, end = _bounds(task, _ctx["grants"])
+    objects, users, role_ids = _ctx["grant_objects"], _ctx["grant_users"], _ctx["role_ids"]
+    n_objects = _size(objects)
+    rows = []
+    for i in range(start, end):
+        # i-я выдача: объекты по кругу, на каждом круге — другой пользователь,
+        # так что пары (пользователь, объект) не повторяются без всякого rng
+        n, lap = i % n_objects, i // n_objects
+        if lap == 0 and n % 50 == 0 and role_ids:
+            rows.append((_nth(objects, n), None, role_ids[(n // 50) % len(role_ids)]))
+        else:
+            rows.append((_nth(objects, n), _nth(users, n * 2654435761 + lap), None))
+    with _engine.begin() as conn:
+        if _ctx["copy"]:
+            _copy(conn, "object_grants", ("object_id", "user_id", "role_id"), rows)
+        else:
+            conn.execute(insert(ObjectGrants), [{"object_id": o, "user_id": u, "role_id": r} for o, u, r in rows])
+        _mark(conn, "grants", chunk, end - chunk * _ctx["chunk"], len(rows))
+    return len(rows)
+
+
+def _ensure_names(conn, model, column, names: List[str]) -> List[int]:
+    existing = set(conn.execute(select(column).where(column.in_(names))).scalars())
+    missing = [n for n in names if n not in existing]
+    if missing:
+        conn.execute(insert(model), [{column.key: n} for n in missing])
+    return list(conn.execute(select(model.id).where(column.in_(names)).order_by(model.id)).scalars())
+
+
+def _catalog(conn, args) -> Tuple[List[int], List[int], int]:
+    # роли, элементы и правила: их мало, пишутся одной транзакцией и добавляются только недостающие
+    role_ids = []
+    element_ids = []
+    for start in range(0, args.roles, args.chunk):
+        role_ids += _ensure_names(conn, Roles, Roles.name, [f"gen-role-{i}" for i in range(start, min(start + args.chunk, args.roles))])
+    for start in range(0, args.elements, args.chunk):
+        element_ids += _ensure_names(
+            conn, BusinessElements, BusinessElements.code,
+            [f"gen-element-{i}" for i in range(start, min(start + args.chunk, args.elements))]
+        )
+    rng = _rng(args.seed, "rules", 0)
+    existing = {
+        (role_id, element_id) for role_id, element_id in conn.execute(
+            select(AccessRolesRules.role_id, AccessRolesRules.element_id).where(AccessRolesRules.role_id.in_(role_ids))
+        )
+    } if role_ids else set()
+    rules = []
+    for role_id in role_ids:
+        for element_id in rng.sample(element_ids, min(args.rules_per_role, len(element_ids))):
+            flags = {f"{name}_permission": rng.random() < 0.5 for name in FLAGS}
+            if (role_id, element_id) not in existing:
+                rules.append({"role_id": role_id, "element_id": element_id, **flags})
+    for start in range(0, len(rules), args.chunk):
+        conn.execute(insert(AccessRolesRules), rules[start:start + args.chunk])
+    return role_ids, element_ids, len(rules)
+
+
+def _id_range(conn, column, what: str) -> Tuple[int, int, Optional[array]]:
+    lo, hi, count = conn.execute(select(func.min(column), func.max(column), func.count(column))).one()
+    if count == 0:
+        raise SystemExit(f"нет {what}")
+    if hi - lo + 1 == count:
+        return lo, hi, None
+    return lo, hi, array("q", conn.execute(select(column).order_by(column)).scalars())
+
+
+def _size(id_range) -> int:
+    lo, hi, ids = id_range
+    return hi - lo + 1 if ids is None else len(ids)
+
+
+def _nth(id_range, n: int) -> int:
+    lo, _, ids = id_range
+    return lo + n % _size(id_range) if ids is None else ids[n % len(ids)]
+
+
+def _pending(conn, stage: str, total: int, chunk: int) -> List[Tuple[int, int]]:
+    # (номер порции, сколько в ней уже записано)
+    done = conn.execute(
+        select(progress.c.chunk, progress.c.chunk_size, progress.c.written).where(progress.c.stage == stage)
+    ).all()
+    sizes = {size for _, size, _ in done}
+    if sizes and sizes != {chunk}:
+        raise SystemExit(f"{stage}: прошлый запуск шёл порциями по {sizes.pop()}, продолжайте с тем же --chunk")
+    written = {c: n for c, _, n in done}
+    tasks = []
+    for c in range((total + chunk - 1) // chunk):
+        expected = min(chunk, total - c * chunk)
+        if written.get(c, 0) < expected:
+            tasks.append((c, written.get(c, 0)))
+    return tasks
+
+
+def _run_stage(stage: str, fn, tasks: List[Tuple[int, int]], workers: int, url: str) -> Dict:
+    started = time.perf_counter()
+    rows = 0
+    if tasks:
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_worker_init, initargs=(url, dict(_ctx))) as pool:
+                for n in pool.map(fn, tasks):
+                    rows += n
+        else:
+            for task in tasks:
+                rows += fn(task)
+    elapsed = time.perf_counter() - started
+    return {
+        "stage": stage,
+        "chunks": len(tasks),
+        "rows": rows,
+        "elapsed_s": round(elapsed, 3),
+        "rows_per_s": round(rows / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def main() -> None:
+    global _engine
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--objects", type=int, default=1_000_000)
+    parser.add_argument("--grants", type=int, default=0, help="сколько выдач объектов пользователям и ролям")
+    parser.add_argument("--roles", type=int, default=50)
+    parser.add_argument("--elements", type=int, default=200)
+    parser.add_argument("--rules-per-role", type=int, default=40)
+    parser.add_argument("--max-roles", type=int, default=3, help="сколько случайных ролей сверх роли user")
+    parser.add_argument("--chunk", type=int, default=10_000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--hash-rounds", type=int, default=4, help="стоимость общего хэша пароля")
+    parser.add_argument("--method", choices=["auto", "copy", "insert"], default="auto")
+    args = parser.parse_args()
+
+    engine = db.engine
+    url = engine.url.render_as_string(hide_password=False)
+    dialect = engine.dialect.name
+    use_copy = args.method == "copy" or (args.method == "auto" and dialect == "postgresql" and engine.driver == "psycopg2")
+    if use_copy and engine.driver != "psycopg2":
+        raise SystemExit("COPY поддерживается только для postgresql+psycopg2")
+    workers = args.workers
+    if dialect == "sqlite" and workers > 1:
+        # у SQLite один писатель на файл, параллельные воркеры только ждали бы блокировку
+        workers = 1
+
+    Base.metadata.create_all(bind=engine)
+    progress.create(bind=engine, checkfirst=True)
+    started = time.perf_counter()
+    report = []
+
+    t0 = time.perf_counter()
+    with engine.begin() as conn:
+        role_ids, _, rules = _catalog(conn, args)
+        base_role_id = conn.execute(select(Roles.id).where(Roles.name == "user")).scalar()
+    elapsed = time.perf_counter() - t0
+    report.append({"stage": "catalog", "rows": rules, "elapsed_s": round(elapsed, 3), "rows_per_s": round(rules / elapsed, 1) if elapsed else 0.0})
+
+    hasher = make_hasher(PASSWORD_HASHER, rounds=args.hash_rounds)
+    _engine = engine
+    _ctx.update(
+        chunk=args.chunk, seed=args.seed, copy=use_copy, users=args.users, objects=args.objects, grants=args.grants,
+        max_roles=args.max_roles, role_ids=role_ids, base_role_id=base_role_id,
+        password_hash=hasher.hash(args.password.encode()),
+    )
+
+    with engine.connect() as conn:
+        pending = _pending(conn, "users", args.users, args.chunk)
+    engine.dispose()
+    report.append(_run_stage("users", _users_chunk, pending, workers, url))
+
+    with engine.connect() as conn:
+        pending = _pending(conn, "objects", args.objects, args.chunk)
+        _ctx["owners"] = _id_range(conn, User.id, "пользователей-владельцев объектов") if pending else None
+    engine.dispose()
+    report.append(_run_stage("objects", _objects_chunk, pending, workers, url))
+
+    with engine.connect() as conn:
+        pending = _pending(conn, "grants", args.grants, args.chunk)
+        if pending:
+            _ctx["grant_objects"] = _id_range(conn, BusinessObject.id, "объектов для выдач")
+            _ctx["grant_users"] = _id_range(conn, User.id, "пользователей для выдач")
+    engine.dispose()
+    report.append(_run_stage("grants", _grants_chunk, pending, workers, url))
+
+    total_rows = sum(r["rows"] for r in report)
+    total = time.perf_counter() - started
+    report.append({
+        "stage": "total", "rows": total_rows, "elapsed_s": round(total, 3),
+        "rows_per_s": round(total_rows / total, 1) if total else 0.0,
+        "method": "copy" if use_copy else "insert", "workers": workers,
+    })
+    for line in report:
+        print(json.dumps(line, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
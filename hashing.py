@@ -0,0 +1,247 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Tuple
+import bcrypt
+from fastapi import HTTPException, status
+
+# bcrypt отпускает GIL, поэтому пула потоков обычно хватает;
+# PASSWORD_HASH_EXECUTOR=process — отдельные процессы
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+# сколько задач может ждать свободного воркера, сверх этого — сразу 503
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", "32"))
+
+# bcrypt | pbkdf2_sha256; стоимость — log2 раундов bcrypt или число итераций
+# pbkdf2. Для тестов и сидов хватает PASSWORD_HASH_ROUNDS=4.
+PASSWORD_HASHER = os.getenv("PASSWORD_HASHER", "bcrypt")
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "12"))
+PBKDF2_ITERATIONS = int(os.getenv("PBKDF2_ITERATIONS", "600000"))
+
+
+class BcryptHasher:
+    name = "bcrypt"
+
+    def __init__(self, rounds: int):
+        self.rounds = rounds
+        self.cost = rounds
+
+    def identify(self, password_hash: str) -> bool:
+        return password_hash.startswith("$2")
+
+    def hash(self, password: bytes) -> str:
+        return bcrypt.hashpw(password, bcrypt.gensalt(self.rounds)).decode()
+
+    def verify(self, password: bytes, password_hash: str) -> bool:
+        try:
+            return bcrypt.checkpw(password, password_hash.encode("utf-8"))
+        except ValueError:
+            # испорченный или чужой хэш — просто неверный пароль, а не 500
+            return False
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        # $2b$12$<salt+hash>
+        parts = password_hash.split("$")
+        return len(parts) < 4 or parts[2] != f"{self.rounds:02d}"
+
+
+class Pbkdf2Hasher:
+    name = "pbkdf2_sha256"
+
+    def __init__(self, iterations: int):
+        self.iterations = iterations
+        self.cost = iterations
+
+    def identify(self, password_hash: str) -> bool:
+        return password_hash.startswith(self.name + "$")
+
+    def hash(self, password: bytes) -> str:
+        salt = os.urandom(16)
+        digest = hashlib.pbkdf2_hmac("sha256", password, salt, self.iterations)
+        return "$".join((
+            self.name,
+            str(self.iterations),
+            base64.b64encode(salt).decode(),
+            base64.b64encode(digest).decode(),
+        ))
+
+    def verify(self, password: bytes, password_hash: str) -> bool:
+        try:
+            _, iterations, salt, digest = password_hash.split("$")
+            expected = base64.b64decode(digest, validate=True)
+            actual = hashlib.pbkdf2_hmac("sha256", password, base64.b64decode(salt, validate=True), int(iterations))
+        except ValueError:
+            # как и у bcrypt: испорченный хэш — несовпадение пароля
+            return False
+        return hmac.compare_digest(actual, expected)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        parts = password_hash.split("$")
+        return len(parts) != 4 or parts[1] != str(self.iterations)
+
+
+def make_hasher(name: str, rounds: int = PASSWORD_HASH_ROUNDS, iterations: int = PBKDF2_ITERATIONS):
+    if name == "bcrypt":
+        return BcryptHasher(rounds)
+    if name == "pbkdf2_sha256":
+        return Pbkdf2Hasher(iterations)
+    raise ValueError(f"unknown password hasher '{name}'")
+
+
+hasher = make_hasher(PASSWORD_HASHER)
+# проверять умеем все форматы: смена алгоритма не ломает старые пароли
+_verifiers = (hasher, BcryptHasher(PASSWORD_HASH_ROUNDS), Pbkdf2Hasher(PBKDF2_ITERATIONS))
+
+
+def _verifier_for(password_hash: str):
+    for v in _verifiers:
+        if v.identify(password_hash):
+            return v
+    return None
+
+
+def needs_rehash(password_hash: str) -> bool:
+    return not hasher.identify(password_hash) or hasher.needs_rehash(password_hash)
+
+
+def _hashpw(password: bytes) -> Tuple[str, float]:
+    t0 = time.perf_counter()
+    hashed = hasher.hash(password)
+    return hashed, time.perf_counter() - t0
+
+
+def _checkpw(password: bytes, password_hash: str) -> Tuple[bool, float]:
+    t0 = time.perf_counter()
+    verifier = _verifier_for(password_hash)
+    ok = verifier is not None and verifier.verify(password, password_hash)
+    return ok, time.perf_counter() - t0
+
+
+class PoolSaturated(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Сервис перегружен, попробуйте позже",
+            headers={"Retry-After": "1"},
+        )
+
+
+class HashPool:
+    def __init__(self, kind: str, workers: int, queue_size: int):
+        self.kind = kind
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.failed = 0
+        self.cancelled = 0
+        # последние замеры: ожидание в очереди и само хэширование, секунды
+        self._waits = deque(maxlen=1024)
+        self._runs = deque(maxlen=1024)
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    if self.kind == "process":
+                        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    else:
+                        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def submit(self, fn, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self.rejected += 1
+            raise PoolSaturated()
+        with self._stats_lock:
+            self.submitted += 1
+            self.in_flight += 1
+        submitted_at = time.perf_counter()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda f: self._done(f, submitted_at))
+        return future
+
+    def _release(self) -> None:
+        with self._stats_lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _done(self, future: Future, submitted_at: float) -> None:
+        total = time.perf_counter() - submitted_at
+        try:
+            # отменённая задача (клиент отключился, wrap_future отменил её в очереди)
+            # бросила бы CancelledError из exception()
+            if future.cancelled():
+                with self._stats_lock:
+                    self.cancelled += 1
+            elif future.exception() is None:
+                run = future.result()[1]
+                with self._stats_lock:
+                    self._runs.append(run)
+                    self._waits.append(max(0.0, total - run))
+            else:
+                with self._stats_lock:
+                    self.failed += 1
+        finally:
+            self._release()
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            waits = sorted(self._waits)
+            runs = sorted(self._runs)
+
+        def pct(values, p):
+            return round(values[min(len(values) - 1, int(p / 100 * len(values)))] * 1000, 3) if values else 0.0
+
+        return {
+            "hasher": hasher.name,
+            "cost": hasher.cost,
+            "executor": self.kind,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "wait_p50_ms": pct(waits, 50),
+            "wait_p99_ms": pct(waits, 99),
+            "run_p50_ms": pct(runs, 50),
+            "run_p99_ms": pct(runs, 99),
+        }
+
+
+hash_pool = HashPool(PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_SIZE)
+
+
+def hash_password(password: str) -> str:
+    return hash_pool.submit(_hashpw, password.encode()).result()[0]
+
+
+def check_password(password: str, password_hash: str) -> bool:
+    return hash_pool.submit(_checkpw, password.encode(), password_hash).result()[0]
+
+
+async def hash_password_async(password: str) -> str:
+    return (await asyncio.wrap_future(hash_pool.submit(_hashpw, password.encode())))[0]
+
+
+async def check_password_async(password: str, password_hash: str) -> bool:
+    future = hash_pool.submit(_checkpw, password.encode(), password_hash)
+    return (await asyncio.wrap_future(future))[0]
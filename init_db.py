@@ -1,7 +1,7 @@
 from sqlalchemy.orm import Session
 from db import engine, SessionLocal
 from models import Base, User, Roles, UserRoles, BusinessElements, AccessRolesRules, BusinessObject
-import bcrypt
+from hashing import hasher
 
 
 def create_all():
@@ -20,13 +20,13 @@ def seed():
         admin_user = User(
             name="Admin",
             email="admin@example.com",
-            password_hash=bcrypt.hashpw(b"admin123", bcrypt.gensalt()).decode(),
+            password_hash=hasher.hash(b"admin123"),
             is_active=True,
         )
         simple_user = User(
             name="User",
             email="user@example.com",
-            password_hash=bcrypt.hashpw(b"user123", bcrypt.gensalt()).decode(),
+            password_hash=hasher.hash(b"user123"),
             is_active=True,
         )
         db.add_all([admin_user, simple_user])
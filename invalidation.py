@@ -0,0 +1,240 @@
+import json
+import logging
+import os
+import select as select_module
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.pool import NullPool
+from starlette.concurrency import run_in_threadpool
+
+from db import engine
+import permissions
+from user_cache import distrust_claims, invalidate_user, user_cache
+
+logger = logging.getLogger(__name__)
+
+# local — только текущий процесс; postgres — LISTEN/NOTIFY между всеми воркерами
+INVALIDATION_BUS = os.getenv("INVALIDATION_BUS", "local")
+INVALIDATION_CHANNEL = os.getenv("INVALIDATION_CHANNEL", "auth_invalidation")
+# как часто сверять глобальный счётчик версий на случай потерянных сообщений
+PERMISSION_VERSION_CHECK_SECONDS = float(os.getenv("PERMISSION_VERSION_CHECK_SECONDS", "5"))
+
+# свои сообщения воркер применяет до отправки и при получении пропускает
+ORIGIN = uuid.uuid4().hex
+
+
+def apply(event: Dict) -> None:
+    if event["kind"] == "rules":
+        permissions.invalidate()
+    elif event["kind"] == "user":
+        invalidate_user(event["id"], deactivated=event.get("deactivated", False))
+
+
+def full_reload() -> None:
+    # какие-то сообщения потеряны: неизвестно, что именно устарело, в том числе
+    # кто деактивирован — ранее выпущенные stateless-токены проверяются через базу
+    permissions.invalidate()
+    distrust_claims()
+    user_cache.clear()
+
+
+class LocalBus:
+    name = "local"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = 0
+        self.published = 0
+
+    def publish(self, event: Dict) -> int:
+        with self._lock:
+            self.version += 1
+            self.published += 1
+            version = self.version
+        apply(event)
+        return version
+
+    async def publish_async(self, event: Dict) -> int:
+        return self.publish(event)
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    def stats(self) -> Dict:
+        return {"bus": self.name, "version": self.version, "published": self.published}
+
+
+_ensure_row = text(
+    "INSERT INTO permission_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING"
+)
+_bump = text("UPDATE permission_version SET version = version + 1 WHERE id = 1 RETURNING version")
+_current = text("SELECT version FROM permission_version WHERE id = 1")
+
+
+class PostgresBus:
+    name = "postgres"
+
+    def __init__(self, eng=engine, channel: str = INVALIDATION_CHANNEL, check_interval: float = PERMISSION_VERSION_CHECK_SECONDS):
+        self.engine = eng
+        self.channel = channel
+        self.check_interval = check_interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._listen_engine = None
+        self._lock = threading.Lock()
+        # последняя версия, до которой кэши этого воркера актуальны
+        self.seen = 0
+        self.published = 0
+        self.received = 0
+        self.full_reloads = 0
+        self.reconnects = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    def _advance(self, version: int) -> bool:
+        # False — между seen и version есть версии, которых этот воркер не видел
+        with self._lock:
+            contiguous = version <= self.seen + 1
+            self.seen = max(self.seen, version)
+            return contiguous
+
+    def _reload(self, version: int) -> None:
+        with self._lock:
+            self.seen = max(self.seen, version)
+            self.full_reloads += 1
+        full_reload()
+
+    def publish(self, event: Dict) -> int:
+        apply(event)
+        # версия и NOTIFY в одной транзакции: уведомление уходит только после
+        # коммита, и получатели видят версии в порядке их выдачи
+        with self.engine.begin() as conn:
+            version = conn.execute(_bump).scalar()
+            payload = {**event, "v": version, "origin": ORIGIN, "ts": time.time()}
+            conn.execute(select(func.pg_notify(self.channel, json.dumps(payload))))
+        self.published += 1
+        # seen сдвинет слушатель, получив это же сообщение
+        return version
+
+    async def publish_async(self, event: Dict) -> int:
+        return await run_in_threadpool(self.publish, event)
+
+    def _handle(self, payload: str) -> None:
+        self.received += 1
+        event = json.loads(payload)
+        lag = (time.time() - event.get("ts", time.time())) * 1000
+        self.last_lag_ms = lag
+        self.max_lag_ms = max(self.max_lag_ms, lag)
+        if not self._advance(event["v"]):
+            self._reload(event["v"])
+        elif event.get("origin") != ORIGIN:
+            apply(event)
+
+    def _drain(self, conn) -> None:
+        conn.poll()
+        while conn.notifies:
+            self._handle(conn.notifies.pop(0).payload)
+
+    def _check_version(self, conn) -> None:
+        with conn.cursor() as cur:
+            cur.execute(str(_current))
+            row = cur.fetchone()
+        version = row[0] if row else 0
+        if version > self.seen:
+            # уведомление могло прийти, пока шёл запрос
+            self._drain(conn)
+        if version > self.seen:
+            self._reload(version)
+
+    def _listen(self) -> None:
+        # отдельное соединение вне пула: слушатель держит его постоянно
+        if self._listen_engine is None:
+            self._listen_engine = create_engine(self.engine.url, poolclass=NullPool)
+        raw = self._listen_engine.raw_connection()
+        try:
+            conn = raw.dbapi_connection
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f'LISTEN "{self.channel}"')
+            # до LISTEN сообщения могли пройти мимо: сверяемся со счётчиком
+            self._check_version(conn)
+            last_check = time.monotonic()
+            while not self._stop.is_set():
+                ready, _, _ = select_module.select([conn], [], [], min(self.check_interval, 1.0))
+                if ready:
+                    self._drain(conn)
+                if time.monotonic() - last_check >= self.check_interval:
+                    self._check_version(conn)
+                    last_check = time.monotonic()
+        finally:
+            raw.close()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except Exception:
+                logger.exception("invalidation listener failed, reconnecting")
+                self.reconnects += 1
+                self._stop.wait(1.0)
+
+    def start(self) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(_ensure_row)
+            self.seen = conn.execute(_current).scalar() or 0
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="invalidation-listener", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> Dict:
+        return {
+            "bus": self.name,
+            "channel": self.channel,
+            "version": self.seen,
+            "published": self.published,
+            "received": self.received,
+            "full_reloads": self.full_reloads,
+            "reconnects": self.reconnects,
+            "last_lag_ms": round(self.last_lag_ms, 3),
+            "max_lag_ms": round(self.max_lag_ms, 3),
+        }
+
+
+def make_bus(name: str):
+    if name == "local":
+        return LocalBus()
+    if name == "postgres":
+        return PostgresBus()
+    raise ValueError(f"unknown invalidation bus '{name}'")
+
+
+bus = make_bus(INVALIDATION_BUS)
+
+
+def rules_changed() -> None:
+    bus.publish({"kind": "rules"})
+
+
+async def rules_changed_async() -> None:
+    await bus.publish_async({"kind": "rules"})
+
+
+def user_changed(user_id: int, deactivated: bool = False) -> None:
+    bus.publish({"kind": "user", "id": user_id, "deactivated": deactivated})
+
+
+async def user_changed_async(user_id: int, deactivated: bool = False) -> None:
+    await bus.publish_async({"kind": "user", "id": user_id, "deactivated": deactivated})
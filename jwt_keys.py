@@ -0,0 +1,236 @@
+"""Ключи подписи access-токенов.
+
+    python jwt_keys.py generate --alg EdDSA    # новый ключ в JWT_KEYS_DIR
+    python jwt_keys.py list
+
+Без JWT_KEYS_DIR (или если в каталоге нет ключей) токены подписываются
+HS256 ключом JWT_SECRET_KEY, как раньше. В каталоге каждый файл
+<kid>.pem хранит закрытый ключ RSA (RS256) или Ed25519 (EdDSA).
+Проверяются токены всеми ключами каталога, а публичные части отдаются в
+/.well-known/jwks.json. Подписывает самый новый ключ, который уже
+JWKS_MAX_AGE_SECONDS лежит в каталоге: к этому моменту все, кто
+закэшировал JWKS, его уже видят. JWT_ACTIVE_KID задаёт ключ явно.
+Старый ключ удаляют после того, как истекут выданные им токены.
+Когда истекут и токены HS256, JWT_ACCEPT_HS256=0 перестаёт принимать
+токены без kid и подписанные JWT_SECRET_KEY.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+import jwt
+from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+
+logger = logging.getLogger(__name__)
+
+JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR", "")
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID", "")
+# как часто перечитывать каталог ключей: ротация без рестарта
+JWT_KEYS_RELOAD_SECONDS = float(os.getenv("JWT_KEYS_RELOAD_SECONDS", "30"))
+JWKS_MAX_AGE_SECONDS = int(os.getenv("JWKS_MAX_AGE_SECONDS", "300"))
+# 0 — после перехода на RS256/EdDSA общий секрет больше не выпускает рабочих токенов
+JWT_ACCEPT_HS256 = os.getenv("JWT_ACCEPT_HS256", "1") == "1"
+
+
+class SigningKey:
+    __slots__ = ("kid", "algorithm", "signing", "verifying", "created_at")
+
+    def __init__(self, kid: str, algorithm: str, signing, verifying, created_at: float):
+        self.kid = kid
+        self.algorithm = algorithm
+        # объекты ключей разобраны заранее, jwt.encode/decode их не парсит
+        self.signing = signing
+        self.verifying = verifying
+        self.created_at = created_at
+
+    def public_jwk(self) -> Optional[Dict]:
+        if self.algorithm == "RS256":
+            jwk = RSAAlgorithm.to_jwk(self.verifying, as_dict=True)
+        elif self.algorithm == "EdDSA":
+            jwk = OKPAlgorithm.to_jwk(self.verifying, as_dict=True)
+        else:
+            # симметричный ключ не публикуется
+            return None
+        return {**jwk, "kid": self.kid, "alg": self.algorithm, "use": "sig"}
+
+
+def hmac_key(secret: str) -> SigningKey:
+    key = jwt.PyJWK(
+        {"kty": "oct", "k": base64.urlsafe_b64encode(secret.encode()).rstrip(b"=").decode()},
+        algorithm="HS256",
+    )
+    kid = "hs-" + hashlib.sha256(secret.encode()).hexdigest()[:12]
+    return SigningKey(kid, "HS256", key, key, 0.0)
+
+
+def load_pem(kid: str, data: bytes, created_at: float) -> SigningKey:
+    from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+    from cryptography.hazmat.primitives.serialization import load_pem_private_key
+
+    private = load_pem_private_key(data, password=None)
+    if isinstance(private, rsa.RSAPrivateKey):
+        algorithm = "RS256"
+    elif isinstance(private, ed25519.Ed25519PrivateKey):
+        algorithm = "EdDSA"
+    else:
+        raise ValueError(f"{kid}: поддерживаются только ключи RSA и Ed25519")
+    return SigningKey(kid, algorithm, private, private.public_key(), created_at)
+
+
+class KeyRing:
+    def __init__(
+        self,
+        hmac: SigningKey,
+        keys_dir: str = JWT_KEYS_DIR,
+        active_kid: str = JWT_ACTIVE_KID,
+        accept_hmac: bool = JWT_ACCEPT_HS256,
+    ):
+        self.hmac = hmac
+        self.keys_dir = keys_dir
+        self.active_kid = active_kid
+        self.accept_hmac = accept_hmac
+        self._lock = threading.Lock()
+        self._keys: Dict[str, SigningKey] = {hmac.kid: hmac}
+        self._active = hmac
+        self._jwks: Tuple[bytes, str] = (b'{"keys": []}', "")
+        self._checked_at = 0.0
+        self._dir_state: Optional[Tuple] = None
+        # вызываются, когда набор ключей изменился (например, сбросить кэш проверенных токенов)
+        self.listeners: List[Callable[[], None]] = []
+        self.reloads = 0
+        self._reload()
+
+    def _scan(self) -> List[Tuple[str, float]]:
+        if not self.keys_dir or not os.path.isdir(self.keys_dir):
+            return []
+        files = []
+        for name in os.listdir(self.keys_dir):
+            if name.endswith(".pem"):
+                files.append((name[:-4], os.path.getmtime(os.path.join(self.keys_dir, name))))
+        return sorted(files, key=lambda f: f[1])
+
+    def _reload(self) -> None:
+        files = self._scan()
+        state = tuple(files)
+        if state == self._dir_state:
+            # набор файлов тот же, но отложенный ключ мог дозреть до подписи
+            self._active = self._pick_active(self._keys)
+            return
+        keys = {self.hmac.kid: self.hmac}
+        for kid, mtime in files:
+            try:
+                with open(os.path.join(self.keys_dir, kid + ".pem"), "rb") as f:
+                    keys[kid] = load_pem(kid, f.read(), mtime)
+            except (OSError, ValueError):
+                logger.exception("не удалось загрузить ключ %s", kid)
+        public = [k.public_jwk() for k in keys.values()]
+        body = json.dumps({"keys": [jwk for jwk in public if jwk]}, sort_keys=True).encode()
+        removed = set(self._keys) - set(keys)
+        with self._lock:
+            self._keys = keys
+            self._active = self._pick_active(keys)
+            self._jwks = (body, '"' + hashlib.sha256(body).hexdigest()[:16] + '"')
+            self._dir_state = state
+            self.reloads += 1
+        if not self.accept_hmac and self._active is self.hmac:
+            logger.warning("JWT_ACCEPT_HS256=0, но асимметричных ключей нет: выданные токены не пройдут проверку")
+        if removed:
+            for listener in self.listeners:
+                listener()
+
+    def _pick_active(self, keys: Dict[str, SigningKey]) -> SigningKey:
+        if self.active_kid:
+            if self.active_kid in keys:
+                return keys[self.active_kid]
+            logger.warning("JWT_ACTIVE_KID=%s не найден в %s", self.active_kid, self.keys_dir)
+        asymmetric = sorted((k for k in keys.values() if k.algorithm != "HS256"), key=lambda k: k.created_at)
+        if not asymmetric:
+            return self.hmac
+        # новый ключ начинает подписывать, только когда его JWKS уже разошёлся по кэшам
+        published = [k for k in asymmetric if time.time() - k.created_at >= JWKS_MAX_AGE_SECONDS]
+        return (published or asymmetric)[-1]
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at >= JWT_KEYS_RELOAD_SECONDS:
+            self._checked_at = now
+            self._reload()
+
+    def signing_key(self) -> SigningKey:
+        self._maybe_reload()
+        return self._active
+
+    def verification_key(self, kid: Optional[str]) -> Optional[SigningKey]:
+        self._maybe_reload()
+        # токены без kid выпущены до ротации ключей и подписаны HS256
+        key = self._keys.get(kid) if kid else self.hmac
+        if key is not None and key.algorithm == "HS256" and not self.accept_hmac:
+            return None
+        return key
+
+    def jwks(self) -> Tuple[bytes, str]:
+        self._maybe_reload()
+        return self._jwks
+
+    def stats(self) -> Dict:
+        return {
+            "active_kid": self._active.kid,
+            "algorithm": self._active.algorithm,
+            "kids": sorted(self._keys),
+            "accept_hs256": self.accept_hmac,
+            "reloads": self.reloads,
+        }
+
+
+def generate(keys_dir: str, algorithm: str) -> str:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+
+    if algorithm == "RS256":
+        private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    elif algorithm == "EdDSA":
+        private = ed25519.Ed25519PrivateKey.generate()
+    else:
+        raise ValueError(f"unknown algorithm '{algorithm}'")
+    data = private.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    kid = datetime.utcnow().strftime("%Y%m%d%H%M%S") + "-" + secrets.token_hex(3)
+    os.makedirs(keys_dir, exist_ok=True)
+    fd = os.open(os.path.join(keys_dir, kid + ".pem"), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return kid
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    gen = sub.add_parser("generate")
+    gen.add_argument("--alg", choices=["RS256", "EdDSA"], default="EdDSA")
+    gen.add_argument("--dir", default=JWT_KEYS_DIR)
+    ls = sub.add_parser("list")
+    ls.add_argument("--dir", default=JWT_KEYS_DIR)
+    args = parser.parse_args()
+    if not args.dir:
+        parser.error("нужен --dir или JWT_KEYS_DIR")
+
+    if args.command == "generate":
+        print(generate(args.dir, args.alg))
+        return
+    ring = KeyRing(hmac_key(secrets.token_urlsafe(32)), args.dir)
+    for kid, key in sorted(ring._keys.items(), key=lambda kv: kv[1].created_at):
+        if key.algorithm != "HS256":
+            mark = "*" if key is ring.signing_key() else " "
+            print(f"{mark} {kid}  {key.algorithm}  {datetime.utcfromtimestamp(key.created_at).isoformat()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,61 @@
-from fastapi import FastAPI
-from db import engine
+from fastapi import APIRouter, FastAPI
+from db import engine, DB_ASYNC
 from models import Base
 from app_user import router as user_router
 from app_admin import router as admin_router
 from app_business import router as objects_router
+from app_authz import router as authz_router
+from app_metrics import router as metrics_router
+from app_keys import router as keys_router
+from tokens import token_sweeper, TOKEN_SWEEPER_ENABLED
+from invalidation import bus as invalidation_bus
+from audit import audit_log, AUDIT_ENABLED
+from profiling import install as install_profiling, PROFILING_ENABLED
 
 app = FastAPI(title="Auth/RBAC Demo")
+if PROFILING_ENABLED:
+    install_profiling(app)
+
+
+def with_async_routes(router: APIRouter, async_router: APIRouter) -> APIRouter:
+    # асинхронный маршрут занимает место синхронного с тем же путём и методом,
+    # порядок маршрутов сохраняется; остальные эндпоинты остаются синхронными
+    replacements = {(r.path, frozenset(r.methods)): r for r in async_router.routes}
+    merged = APIRouter()
+    for route in router.routes:
+        merged.routes.append(replacements.pop((route.path, frozenset(route.methods)), route))
+    merged.routes.extend(replacements.values())
+    return merged
+
+
+if DB_ASYNC:
+    import app_async
+
+    user_router = with_async_routes(user_router, app_async.user_router)
+    admin_router = with_async_routes(admin_router, app_async.admin_router)
+    objects_router = with_async_routes(objects_router, app_async.objects_router)
 
 
 @app.on_event("startup")
 def on_startup():
     Base.metadata.create_all(bind=engine)
+    invalidation_bus.start()
+    if AUDIT_ENABLED:
+        audit_log.start()
+    if TOKEN_SWEEPER_ENABLED:
+        token_sweeper.start()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    token_sweeper.stop()
+    invalidation_bus.stop()
+    # буфер аудита дописывается в базу до выхода
+    audit_log.stop()
 
 app.include_router(user_router)
 app.include_router(admin_router)
 app.include_router(objects_router)
+app.include_router(authz_router)
+app.include_router(metrics_router)
+app.include_router(keys_router)
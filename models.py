@@ -4,10 +4,14 @@ from sqlalchemy import (
     Integer,
     String,
     Boolean,
+    BigInteger,
     DateTime,
     ForeignKey,
     UniqueConstraint,
-    Text
+    CheckConstraint,
+    Index,
+    Text,
+    LargeBinary
 )
 from sqlalchemy.orm import DeclarativeBase
 
@@ -29,10 +33,10 @@ class RefreshToken(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
-    token = Column(String(255), nullable=False, unique=True)
+    # sha256 самого токена; отозванные токены удаляются сразу
+    token_hash = Column(LargeBinary(32), nullable=False, unique=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    expires_at = Column(DateTime, nullable=False)
-    revoked = Column(Boolean, nullable=False, server_default="false")
+    expires_at = Column(DateTime, nullable=False, index=True)
 
 
 class Roles(Base):
@@ -41,6 +45,14 @@ class Roles(Base):
     name = Column(String(50), unique=True, nullable=False, index=True)
 
 
+class RoleParents(Base):
+    __tablename__ = "role_parents"
+
+    # роль наследует правила всех родителей; у роли может быть несколько родителей
+    role_id = Column(Integer, ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True)
+    parent_id = Column(Integer, ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True, index=True)
+
+
 class BusinessElements(Base):
     __tablename__ = "business_elements"
 
@@ -48,6 +60,14 @@ class BusinessElements(Base):
     code = Column(String(50), unique=True, nullable=False, index=True)
 
 
+class ElementGroups(Base):
+    __tablename__ = "element_groups"
+
+    # правило на группу действует на все её элементы; группа — тоже элемент
+    element_id = Column(Integer, ForeignKey("business_elements.id", ondelete="CASCADE"), primary_key=True)
+    group_id = Column(Integer, ForeignKey("business_elements.id", ondelete="CASCADE"), primary_key=True, index=True)
+
+
 class BusinessObject(Base):
     __tablename__ = "objects"
 
@@ -56,6 +76,28 @@ class BusinessObject(Base):
     description = Column(Text, nullable=True)
     owner_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), index=True, nullable=True)
 
+    __table_args__ = (
+        # LIKE 'prefix%' в Postgres использует btree только с text_pattern_ops
+        Index("ix_objects_title_pattern", "title", postgresql_ops={"title": "text_pattern_ops"}),
+    )
+
+
+class ObjectGrants(Base):
+    __tablename__ = "object_grants"
+    __table_args__ = (
+        # выдача адресована либо пользователю, либо роли
+        CheckConstraint("(user_id IS NULL) <> (role_id IS NULL)", name="ck_object_grants_grantee"),
+        # «какие объекты видит пользователь/роль»: object_id в индексе, хватает index-only scan
+        Index("uq_object_grants_user", "user_id", "object_id", unique=True),
+        Index("uq_object_grants_role", "role_id", "object_id", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # «кто видит объект X»
+    object_id = Column(Integer, ForeignKey("objects.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True)
+    role_id = Column(Integer, ForeignKey("roles.id", ondelete="CASCADE"), nullable=True)
+
 
 class UserRoles(Base):
     __tablename__ = "user_roles"
@@ -81,3 +123,36 @@ class AccessRolesRules(Base):
     update_all_permission = Column(Boolean, nullable=False, server_default="false")
     delete_permission = Column(Boolean, nullable=False, server_default="false")
     delete_all_permission = Column(Boolean, nullable=False, server_default="false")
+
+
+class PermissionVersion(Base):
+    __tablename__ = "permission_version"
+
+    # одна строка: растёт при каждом изменении правил или пользователя, по ней
+    # воркер замечает пропущенные сообщения об инвалидации
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False, server_default="0")
+
+
+class AuditEvent(Base):
+    __tablename__ = "audit_events"
+    __table_args__ = (
+        Index("ix_audit_events_user_created", "user_id", "created_at"),
+    )
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    created_at = Column(DateTime, nullable=False, index=True)
+    # login | login_failed | refresh | refresh_failed | logout | logout_all
+    event = Column(String(20), nullable=False)
+    # без внешнего ключа: журнал переживает удаление пользователя и не проверяет FK на каждой вставке
+    user_id = Column(Integer, nullable=True)
+    # для неудачного входа, когда пользователя может не быть
+    email = Column(String(100), nullable=True)
+    ip = Column(String(45), nullable=True)
+
+
+class UserLastSeen(Base):
+    __tablename__ = "user_last_seen"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    last_seen_at = Column(DateTime, nullable=False)
@@ -0,0 +1,199 @@
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import Roles, RoleParents, BusinessElements, ElementGroups, AccessRolesRules
+
+# флаги правила доступа упакованы в битовую маску
+READ = 1 << 0
+READ_ALL = 1 << 1
+CREATE = 1 << 2
+UPDATE = 1 << 3
+UPDATE_ALL = 1 << 4
+DELETE = 1 << 5
+DELETE_ALL = 1 << 6
+
+# правило на элемент с этим кодом действует на все элементы
+WILDCARD = "*"
+
+FLAGS: Dict[str, int] = {
+    "read": READ,
+    "read_all": READ_ALL,
+    "create": CREATE,
+    "update": UPDATE,
+    "update_all": UPDATE_ALL,
+    "delete": DELETE,
+    "delete_all": DELETE_ALL,
+}
+
+
+def rule_to_mask(rule) -> int:
+    mask = 0
+    for name, bit in FLAGS.items():
+        if getattr(rule, f"{name}_permission"):
+            mask |= bit
+    return mask
+
+
+def _adjacency(edges: Iterable[Tuple[int, int]], reverse: bool = False) -> Dict[int, List[int]]:
+    adj: Dict[int, List[int]] = defaultdict(list)
+    for child, parent in edges:
+        if reverse:
+            adj[parent].append(child)
+        else:
+            adj[child].append(parent)
+    return adj
+
+
+def _walk(adj: Dict[int, List[int]], node: int) -> Set[int]:
+    # сам node и всё достижимое из него; цикл в данных не зацикливает обход
+    seen = {node}
+    stack = [node]
+    while stack:
+        for nxt in adj.get(stack.pop(), ()):
+            if nxt not in seen:
+                seen.add(nxt)
+                stack.append(nxt)
+    return seen
+
+
+def ancestors(edges: Iterable[Tuple[int, int]], node: int) -> Set[int]:
+    # рёбра (потомок, родитель): роль -> родительская роль, элемент -> группа
+    return _walk(_adjacency(edges), node)
+
+
+class PermissionMatrix:
+    __slots__ = ("version", "role_ids", "element_ids", "masks", "role_ancestors")
+
+    def __init__(
+        self,
+        version: int,
+        role_ids: Dict[str, int],
+        element_ids: Dict[str, int],
+        masks: Dict[Tuple[int, int], int],
+        role_ancestors: Optional[Dict[int, Set[int]]] = None,
+    ):
+        self.version = version
+        self.role_ids = role_ids
+        self.element_ids = element_ids
+        self.masks = masks
+        # только роли, у которых есть родители
+        self.role_ancestors = role_ancestors or {}
+
+    def expand_roles(self, role_ids: Iterable[int]) -> Set[int]:
+        # роли пользователя вместе со всеми унаследованными
+        result = set()
+        for role_id in role_ids:
+            result |= self.role_ancestors.get(role_id, {role_id})
+        return result
+
+    def mask(self, role_ids: Iterable[int], element_id: int) -> Optional[int]:
+        # None — у ролей пользователя нет ни одного правила на элемент
+        result = None
+        for role_id in role_ids:
+            m = self.masks.get((role_id, element_id))
+            if m is not None:
+                result = m if result is None else result | m
+        return result
+
+
+_lock = threading.Lock()
+_version = 0
+_matrix: Optional[PermissionMatrix] = None
+
+
+# матрица грузится раз на версию и живёт до следующей инвалидации, поэтому
+# читаем её с primary: с отстающей реплики можно закэшировать старые правила
+_roles_q = select(Roles.id, Roles.name).execution_options(use_primary=True)
+_elements_q = select(BusinessElements.id, BusinessElements.code).execution_options(use_primary=True)
+_rules_q = select(AccessRolesRules).execution_options(use_primary=True)
+
+
+_parents_q = select(RoleParents.role_id, RoleParents.parent_id).execution_options(use_primary=True)
+_groups_q = select(ElementGroups.element_id, ElementGroups.group_id).execution_options(use_primary=True)
+
+
+def _build(version: int, roles, elements, rules, parents, groups) -> PermissionMatrix:
+    role_ids = {name: id_ for id_, name in roles}
+    element_ids = {code: id_ for id_, code in elements}
+    # наследование ролей и группы элементов раскрываются здесь, один раз на
+    # версию: в матрице лежат итоговые маски, и проверка остаётся одним
+    # поиском в словаре при любой глубине иерархии
+    heirs = _adjacency(parents, reverse=True)
+    up = _adjacency(parents)
+    members = _adjacency(groups, reverse=True)
+    wildcard_id = element_ids.get(WILDCARD)
+    masks: Dict[Tuple[int, int], int] = {}
+    for rule in rules:
+        mask = rule_to_mask(rule)
+        if rule.element_id == wildcard_id:
+            targets = element_ids.values()
+        else:
+            targets = _walk(members, rule.element_id)
+        for role_id in _walk(heirs, rule.role_id):
+            for element_id in targets:
+                key = (role_id, element_id)
+                masks[key] = masks.get(key, 0) | mask
+    return PermissionMatrix(version, role_ids, element_ids, masks, {r: _walk(up, r) for r in up})
+
+
+def _load(db: Session, version: int) -> PermissionMatrix:
+    return _build(
+        version,
+        db.execute(_roles_q).all(),
+        db.execute(_elements_q).all(),
+        db.execute(_rules_q).scalars().all(),
+        db.execute(_parents_q).all(),
+        db.execute(_groups_q).all(),
+    )
+
+
+async def _load_async(db, version: int) -> PermissionMatrix:
+    return _build(
+        version,
+        (await db.execute(_roles_q)).all(),
+        (await db.execute(_elements_q)).all(),
+        (await db.execute(_rules_q)).scalars().all(),
+        (await db.execute(_parents_q)).all(),
+        (await db.execute(_groups_q)).all(),
+    )
+
+
+def get_matrix(db: Session) -> PermissionMatrix:
+    global _matrix
+    matrix = _matrix
+    if matrix is not None and matrix.version == _version:
+        return matrix
+    with _lock:
+        if _matrix is None or _matrix.version != _version:
+            # версию фиксируем до чтения: если правила поменяются во время
+            # загрузки, следующий вызов увидит новую версию и перечитает
+            _matrix = _load(db, _version)
+        return _matrix
+
+
+async def get_matrix_async(db) -> PermissionMatrix:
+    global _matrix
+    matrix = _matrix
+    if matrix is not None and matrix.version == _version:
+        return matrix
+    # держать threading-лок через await нельзя: параллельные загрузки
+    # возможны, сохраняется только самая свежая
+    version = _version
+    matrix = await _load_async(db, version)
+    with _lock:
+        if _matrix is None or _matrix.version < version:
+            _matrix = matrix
+    return matrix
+
+
+def invalidate() -> None:
+    global _version
+    with _lock:
+        _version += 1
+
+
+def current_version() -> int:
+    return _version
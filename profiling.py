@@ -0,0 +1,170 @@
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# по умолчанию выключено: слушатели курсоров и учёт на каждый запрос нужны
+# для замеров и тестов, а не в проде
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+# 1 — превышение бюджета запросов роняет запрос исключением (для тестов),
+# иначе только предупреждение в лог и счётчик
+QUERY_BUDGET_ENFORCE = os.getenv("QUERY_BUDGET_ENFORCE", "0") == "1"
+
+# верхние границы корзин гистограммы задержек, мс
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+def query_budget(max_queries: int):
+    # сколько SQL-запросов может выполнить маршрут, включая зависимости
+    # и стриминг ответа; проверяет ProfilingMiddleware
+    def decorate(fn):
+        fn.query_budget = max_queries
+        return fn
+    return decorate
+
+
+class RequestProfile:
+    __slots__ = ("queries", "sql_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+
+
+# профиль текущего запроса; sync-обработчики в пуле потоков видят копию
+# контекста, но объект в ней тот же, поэтому счётчики доходят до middleware
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        context._profile_t0 = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    t0 = getattr(context, "_profile_t0", None)
+    if profile is not None and t0 is not None:
+        profile.queries += 1
+        profile.sql_time += time.perf_counter() - t0
+
+
+class RouteStats:
+    __slots__ = ("count", "latency_sum", "latency_max", "buckets", "queries", "queries_max", "sql_time", "budget", "over_budget")
+
+    def __init__(self, budget: Optional[int]):
+        self.count = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.queries = 0
+        self.queries_max = 0
+        self.sql_time = 0.0
+        self.budget = budget
+        self.over_budget = 0
+
+    def to_dict(self) -> Dict:
+        bounds = [str(b) for b in LATENCY_BUCKETS_MS] + ["+Inf"]
+        return {
+            "count": self.count,
+            "latency_avg_ms": round(self.latency_sum / self.count * 1000, 3) if self.count else 0.0,
+            "latency_max_ms": round(self.latency_max * 1000, 3),
+            "latency_buckets_ms": dict(zip(bounds, self.buckets)),
+            "queries_total": self.queries,
+            "queries_avg": round(self.queries / self.count, 2) if self.count else 0.0,
+            "queries_max": self.queries_max,
+            "sql_time_ms": round(self.sql_time * 1000, 3),
+            "query_budget": self.budget,
+            "over_budget": self.over_budget,
+        }
+
+
+class Profiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[str, RouteStats] = {}
+
+    def record(self, key: str, budget: Optional[int], latency: float, profile: RequestProfile) -> bool:
+        over = budget is not None and profile.queries > budget
+        bucket = len(LATENCY_BUCKETS_MS)
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if latency * 1000 <= bound:
+                bucket = i
+                break
+        with self._lock:
+            stats = self._routes.get(key)
+            if stats is None:
+                stats = self._routes[key] = RouteStats(budget)
+            stats.count += 1
+            stats.latency_sum += latency
+            stats.latency_max = max(stats.latency_max, latency)
+            stats.buckets[bucket] += 1
+            stats.queries += profile.queries
+            stats.queries_max = max(stats.queries_max, profile.queries)
+            stats.sql_time += profile.sql_time
+            if over:
+                stats.over_budget += 1
+        return over
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {key: s.to_dict() for key, s in sorted(self._routes.items())}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._routes.clear()
+
+
+profiler = Profiler()
+
+
+class ProfilingMiddleware:
+    # чистый ASGI, а не BaseHTTPMiddleware: не буферизует стриминговые ответы,
+    # и время считается до отправки последнего куска тела
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        profile = RequestProfile()
+        token = _current.set(profile)
+        t0 = time.perf_counter()
+        failed = False
+        try:
+            await self.app(scope, receive, send)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            _current.reset(token)
+            latency = time.perf_counter() - t0
+            # роутер дописывает найденный маршрут в scope; без маршрута (404) не считаем
+            route = scope.get("route")
+            path = getattr(route, "path", None)
+            if path is not None:
+                budget = getattr(getattr(route, "endpoint", None), "query_budget", None)
+                key = f"{scope['method']} {path}"
+                if profiler.record(key, budget, latency, profile):
+                    message = f"{key}: {profile.queries} SQL-запросов при бюджете {budget}"
+                    # если обработчик уже упал, его исключение важнее: не подменяем его
+                    if QUERY_BUDGET_ENFORCE and not failed:
+                        raise QueryBudgetExceeded(message)
+                    logger.warning(message)
+
+
+def install(app) -> None:
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    app.add_middleware(ProfilingMiddleware)
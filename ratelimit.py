@@ -0,0 +1,344 @@
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+from fastapi import HTTPException, status
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+LOGIN_RATE_LIMIT_ENABLED = os.getenv("LOGIN_RATE_LIMIT_ENABLED", "1") == "1"
+# memory — сегменты в памяти процесса; sqlite — общий файл для воркеров одной машины
+LOGIN_RATE_BACKEND = os.getenv("LOGIN_RATE_BACKEND", "memory")
+LOGIN_RATE_SHARDS = int(os.getenv("LOGIN_RATE_SHARDS", "64"))
+LOGIN_RATE_PATH = os.getenv("LOGIN_RATE_PATH", "ratelimit.db")
+# сколько ключей держит memory-бэкенд; сверх этого вытесняются самые старые
+# незаблокированные, а если весь сегмент заблокирован — новые ключи получают 429
+LOGIN_RATE_MAX_KEYS = int(os.getenv("LOGIN_RATE_MAX_KEYS", "200000"))
+LOGIN_IP_BURST = float(os.getenv("LOGIN_IP_BURST", "20"))
+LOGIN_IP_PER_MINUTE = float(os.getenv("LOGIN_IP_PER_MINUTE", "60"))
+LOGIN_EMAIL_BURST = float(os.getenv("LOGIN_EMAIL_BURST", "5"))
+LOGIN_EMAIL_PER_MINUTE = float(os.getenv("LOGIN_EMAIL_PER_MINUTE", "10"))
+# после стольких неудач подряд ключ блокируется, каждая следующая неудача удваивает срок
+LOGIN_LOCKOUT_THRESHOLD = int(os.getenv("LOGIN_LOCKOUT_THRESHOLD", "5"))
+LOGIN_IP_LOCKOUT_THRESHOLD = int(os.getenv("LOGIN_IP_LOCKOUT_THRESHOLD", "50"))
+LOGIN_LOCKOUT_BASE_SECONDS = float(os.getenv("LOGIN_LOCKOUT_BASE_SECONDS", "30"))
+LOGIN_LOCKOUT_MAX_SECONDS = float(os.getenv("LOGIN_LOCKOUT_MAX_SECONDS", "900"))
+# неудачи старше окна забываются
+LOGIN_FAILURE_WINDOW_SECONDS = float(os.getenv("LOGIN_FAILURE_WINDOW_SECONDS", "900"))
+
+# состояние ключа: [токены, время пополнения, неудачи, заблокирован до, время последней неудачи]
+TOKENS, UPDATED, FAILURES, LOCKED_UNTIL, LAST_FAILURE = range(5)
+
+
+def _fresh(capacity: float, now: float) -> List[float]:
+    return [capacity, now, 0, 0.0, 0.0]
+
+
+def _take(states: Sequence[List[float]], limits: Sequence[Tuple[float, float]], now: float) -> Tuple[float, bool]:
+    # всё или ничего: токен списывается со всех ключей, только если хватает везде.
+    # Возвращает, через сколько секунд повторить (0 — пропустить), и признак блокировки
+    wait = max((s[LOCKED_UNTIL] - now for s in states), default=0.0)
+    if wait > 0:
+        return wait, True
+    for s, (capacity, rate) in zip(states, limits):
+        s[TOKENS] = min(capacity, s[TOKENS] + (now - s[UPDATED]) * rate)
+        s[UPDATED] = now
+        if s[TOKENS] < 1:
+            wait = max(wait, (1 - s[TOKENS]) / rate if rate > 0 else LOGIN_LOCKOUT_MAX_SECONDS)
+    if wait > 0:
+        return wait, False
+    for s in states:
+        s[TOKENS] -= 1
+    return 0.0, False
+
+
+def _fail(s: List[float], threshold: int, now: float) -> float:
+    if now - s[LAST_FAILURE] > LOGIN_FAILURE_WINDOW_SECONDS:
+        s[FAILURES] = 0
+    s[FAILURES] += 1
+    s[LAST_FAILURE] = now
+    if s[FAILURES] < threshold:
+        return 0.0
+    lock = min(LOGIN_LOCKOUT_MAX_SECONDS, LOGIN_LOCKOUT_BASE_SECONDS * 2 ** (s[FAILURES] - threshold))
+    s[LOCKED_UNTIL] = now + lock
+    return lock
+
+
+class MemoryLimiterBackend:
+    # ключи разложены по сегментам со своими блокировками, чтобы параллельные
+    # логины не стояли в одной очереди
+    name = "memory"
+    blocking = False
+
+    def __init__(self, shards: int = LOGIN_RATE_SHARDS, max_keys: int = LOGIN_RATE_MAX_KEYS):
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+        self.max_per_shard = max(1, max_keys // shards)
+        self.evictions = 0
+        self.overflows = 0
+
+    def _index(self, key: str) -> int:
+        return hash(key) % len(self._shards)
+
+    def _state(self, data: Dict, key: str, capacity: float, now: float) -> Optional[List[float]]:
+        s = data.get(key)
+        if s is None:
+            if len(data) >= self.max_per_shard:
+                self._evict(data, now)
+                if len(data) >= self.max_per_shard:
+                    # в сегменте одни блокировки: новый ключ не заводим
+                    self.overflows += 1
+                    return None
+            s = data[key] = _fresh(capacity, now)
+        return s
+
+    def _evict(self, data: Dict, now: float) -> None:
+        # заблокированные ключи не вытесняются никогда: иначе перебор с множества
+        # адресов или email снимал бы блокировку жертвы. Сначала ключи без
+        # свежих неудач, потом остальные по порядку вставки (сортировка устойчивая).
+        # Освобождаем десятую часть, чтобы не перебирать сегмент на каждом запросе
+        target = self.max_per_shard * 9 // 10
+        stale = now - LOGIN_FAILURE_WINDOW_SECONDS
+        unlocked = [k for k, s in data.items() if s[LOCKED_UNTIL] <= now]
+        unlocked.sort(key=lambda k: data[k][FAILURES] > 0 and data[k][LAST_FAILURE] >= stale)
+        for key in unlocked:
+            if len(data) <= target:
+                break
+            del data[key]
+            self.evictions += 1
+
+    def acquire(self, keys: Sequence[Tuple[str, float, float]], now: float) -> Tuple[float, bool]:
+        # сегменты блокируются по возрастанию номера — без взаимных блокировок
+        indexes = sorted({self._index(key) for key, _, _ in keys})
+        for i in indexes:
+            self._shards[i][1].acquire()
+        try:
+            states = [self._state(self._shards[self._index(key)][0], key, capacity, now) for key, capacity, _ in keys]
+            if None in states:
+                # ключ некуда записать — отказываем, а не пропускаем без учёта
+                return LOGIN_LOCKOUT_BASE_SECONDS, True
+            return _take(states, [(capacity, rate) for _, capacity, rate in keys], now)
+        finally:
+            for i in reversed(indexes):
+                self._shards[i][1].release()
+
+    def fail(self, key: str, capacity: float, threshold: int, now: float) -> float:
+        data, lock = self._shards[self._index(key)]
+        with lock:
+            s = self._state(data, key, capacity, now)
+            return _fail(s, threshold, now) if s is not None else 0.0
+
+    def reset(self, key: str) -> None:
+        data, lock = self._shards[self._index(key)]
+        with lock:
+            s = data.get(key)
+            if s is not None:
+                s[FAILURES] = 0
+                s[LOCKED_UNTIL] = 0.0
+
+    def stats(self) -> Dict:
+        return {
+            "keys": sum(len(data) for data, _ in self._shards),
+            "evictions": self.evictions,
+            "overflows": self.overflows,
+        }
+
+
+class SqliteLimiterBackend:
+    # общий файл SQLite в режиме WAL: лимиты действуют на все воркеры машины
+    name = "sqlite"
+    blocking = True
+
+    def __init__(self, path: str = LOGIN_RATE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._calls = 0
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS login_limits (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL,
+                failures INTEGER NOT NULL,
+                locked_until REAL NOT NULL,
+                last_failure REAL NOT NULL
+            ) WITHOUT ROWID
+            """
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _load(self, conn, key: str, capacity: float, now: float) -> List[float]:
+        row = conn.execute(
+            "SELECT tokens, updated, failures, locked_until, last_failure FROM login_limits WHERE key = ?", (key,)
+        ).fetchone()
+        return list(row) if row else _fresh(capacity, now)
+
+    def _save(self, conn, key: str, s: List[float]) -> None:
+        conn.execute("INSERT OR REPLACE INTO login_limits VALUES (?, ?, ?, ?, ?, ?)", (key, *s))
+
+    def acquire(self, keys: Sequence[Tuple[str, float, float]], now: float) -> Tuple[float, bool]:
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            states = [self._load(conn, key, capacity, now) for key, capacity, _ in keys]
+            result = _take(states, [(capacity, rate) for _, capacity, rate in keys], now)
+            for (key, _, _), s in zip(keys, states):
+                self._save(conn, key, s)
+        self._calls += 1
+        if self._calls % 10_000 == 0:
+            self._sweep(now)
+        return result
+
+    def _sweep(self, now: float) -> None:
+        # старые ключи без блокировки: их ведро давно полное
+        self._conn().execute(
+            "DELETE FROM login_limits WHERE locked_until <= ? AND last_failure < ? AND updated < ?",
+            (now, now - LOGIN_FAILURE_WINDOW_SECONDS, now - 3600),
+        )
+
+    def fail(self, key: str, capacity: float, threshold: int, now: float) -> float:
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            s = self._load(conn, key, capacity, now)
+            lock = _fail(s, threshold, now)
+            self._save(conn, key, s)
+        return lock
+
+    def reset(self, key: str) -> None:
+        self._conn().execute("UPDATE login_limits SET failures = 0, locked_until = 0 WHERE key = ?", (key,))
+
+    def stats(self) -> Dict:
+        return {"keys": self._conn().execute("SELECT count(*) FROM login_limits").fetchone()[0]}
+
+
+def make_limiter_backend(name: str):
+    if name == "memory":
+        return MemoryLimiterBackend()
+    if name == "sqlite":
+        return SqliteLimiterBackend()
+    raise ValueError(f"unknown login rate limiter backend '{name}'")
+
+
+class LoginLimiter:
+    def __init__(self, backend):
+        self.backend = backend
+        self.allowed = 0
+        self.limited = 0
+        self.locked = 0
+        self.failures = 0
+        self.lockouts = 0
+
+    def _keys(self, ip: Optional[str], email: str):
+        keys = [("email:" + email.lower(), LOGIN_EMAIL_BURST, LOGIN_EMAIL_PER_MINUTE / 60)]
+        if ip:
+            keys.append(("ip:" + ip, LOGIN_IP_BURST, LOGIN_IP_PER_MINUTE / 60))
+        return keys
+
+    def check(self, ip: Optional[str], email: str) -> float:
+        # до базы и bcrypt: 0 — пропустить, иначе через сколько секунд повторить
+        wait, locked = self.backend.acquire(self._keys(ip, email), time.time())
+        if wait <= 0:
+            self.allowed += 1
+        elif locked:
+            self.locked += 1
+        else:
+            self.limited += 1
+        return wait
+
+    def failed(self, ip: Optional[str], email: str) -> None:
+        now = time.time()
+        self.failures += 1
+        if self.backend.fail("email:" + email.lower(), LOGIN_EMAIL_BURST, LOGIN_LOCKOUT_THRESHOLD, now):
+            self.lockouts += 1
+        if ip and self.backend.fail("ip:" + ip, LOGIN_IP_BURST, LOGIN_IP_LOCKOUT_THRESHOLD, now):
+            self.lockouts += 1
+
+    def succeeded(self, ip: Optional[str], email: str) -> None:
+        # успешный вход снимает счётчик неудач аккаунта; IP копит дальше —
+        # атака перебором не должна обнуляться одним своим логином
+        self.backend.reset("email:" + email.lower())
+
+    async def check_async(self, ip: Optional[str], email: str) -> float:
+        if self.backend.blocking:
+            return await run_in_threadpool(self.check, ip, email)
+        return self.check(ip, email)
+
+    async def failed_async(self, ip: Optional[str], email: str) -> None:
+        if self.backend.blocking:
+            return await run_in_threadpool(self.failed, ip, email)
+        self.failed(ip, email)
+
+    async def succeeded_async(self, ip: Optional[str], email: str) -> None:
+        if self.backend.blocking:
+            return await run_in_threadpool(self.succeeded, ip, email)
+        self.succeeded(ip, email)
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": LOGIN_RATE_LIMIT_ENABLED,
+            "backend": self.backend.name,
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "locked": self.locked,
+            "failures": self.failures,
+            "lockouts": self.lockouts,
+            **self.backend.stats(),
+        }
+
+
+login_limiter = LoginLimiter(make_limiter_backend(LOGIN_RATE_BACKEND))
+
+
+def _too_many(wait: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Слишком много попыток входа, повторите позже",
+        headers={"Retry-After": str(max(1, math.ceil(wait)))},
+    )
+
+
+def check_login(ip: Optional[str], email: str) -> None:
+    if LOGIN_RATE_LIMIT_ENABLED:
+        wait = login_limiter.check(ip, email)
+        if wait > 0:
+            raise _too_many(wait)
+
+
+async def check_login_async(ip: Optional[str], email: str) -> None:
+    if LOGIN_RATE_LIMIT_ENABLED:
+        wait = await login_limiter.check_async(ip, email)
+        if wait > 0:
+            raise _too_many(wait)
+
+
+def login_failed(ip: Optional[str], email: str) -> None:
+    if LOGIN_RATE_LIMIT_ENABLED:
+        login_limiter.failed(ip, email)
+
+
+async def login_failed_async(ip: Optional[str], email: str) -> None:
+    if LOGIN_RATE_LIMIT_ENABLED:
+        await login_limiter.failed_async(ip, email)
+
+
+def login_succeeded(ip: Optional[str], email: str) -> None:
+    if LOGIN_RATE_LIMIT_ENABLED:
+        login_limiter.succeeded(ip, email)
+
+
+async def login_succeeded_async(ip: Optional[str], email: str) -> None:
+    if LOGIN_RATE_LIMIT_ENABLED:
+        await login_limiter.succeeded_async(ip, email)
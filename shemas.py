@@ -1,5 +1,5 @@
-from typing import Optional
-from pydantic import BaseModel, EmailStr
+from typing import List, Literal, Optional
+from pydantic import BaseModel, EmailStr, Field, model_validator
 
 
 class UserCreate(BaseModel):
@@ -41,3 +41,36 @@ class UpsertRuleIn(BaseModel):
     role: str
     element: str
     flags: RuleFlagsIn
+
+
+class UpsertRoleIn(BaseModel):
+    name: str = Field(min_length=1, max_length=50)
+    # None — родителей не менять, [] — убрать всех
+    parents: Optional[List[str]] = None
+
+
+class UpsertElementIn(BaseModel):
+    # "*" — элемент-шаблон: его правила действуют на все элементы
+    code: str = Field(min_length=1, max_length=50)
+    groups: Optional[List[str]] = None
+
+
+class AuthorizeCheckIn(BaseModel):
+    element: str
+    action: Literal["read", "create", "update", "delete"]
+    owner_id: Optional[int] = None
+
+
+class AuthorizeManyIn(BaseModel):
+    checks: List[AuthorizeCheckIn] = Field(max_length=1000)
+
+
+class ObjectGrantIn(BaseModel):
+    user_id: Optional[int] = None
+    role: Optional[str] = None
+
+    @model_validator(mode="after")
+    def one_grantee(self):
+        if (self.user_id is None) == (self.role is None):
+            raise ValueError("нужно указать ровно одно из полей user_id и role")
+        return self
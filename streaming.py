@@ -0,0 +1,30 @@
+import json
+import os
+from typing import Callable, Iterator
+from fastapi.responses import StreamingResponse
+
+from db import SessionLocal
+
+# строк на одну выборку серверного курсора и на один кусок ответа
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+
+
+def _row_mapping(row) -> dict:
+    return dict(row._mapping)
+
+
+def ndjson_rows(query, row_to_dict: Callable = _row_mapping) -> Iterator[bytes]:
+    # своя сессия: генератор живёт дольше зависимости get_db
+    db = SessionLocal()
+    try:
+        result = db.execute(query.execution_options(stream_results=True, yield_per=EXPORT_CHUNK_SIZE))
+        for rows in result.partitions():
+            yield "".join(
+                json.dumps(row_to_dict(r), ensure_ascii=False, default=str) + "\n" for r in rows
+            ).encode()
+    finally:
+        db.close()
+
+
+def ndjson_response(query, row_to_dict: Callable = _row_mapping) -> StreamingResponse:
+    return StreamingResponse(ndjson_rows(query, row_to_dict), media_type="application/x-ndjson")
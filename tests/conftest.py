@@ -0,0 +1,59 @@
+import os
+import tempfile
+
+# настройки читаются при импорте модулей, поэтому задаются до них:
+# своя база SQLite, быстрый bcrypt и строгие бюджеты запросов
+_tmp = tempfile.mkdtemp(prefix="auth-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/app.db"
+os.environ["DB_ASYNC"] = "0"
+os.environ.setdefault("PASSWORD_HASH_ROUNDS", "4")
+os.environ["PROFILING_ENABLED"] = "1"
+os.environ["QUERY_BUDGET_ENFORCE"] = "1"
+os.environ.setdefault("TOKEN_STORE_PATH", f"{_tmp}/tokens.db")
+# лимит входов включён, но не мешает тестам логиниться много раз
+os.environ.setdefault("LOGIN_EMAIL_BURST", "1000")
+os.environ.setdefault("LOGIN_IP_BURST", "1000")
+os.environ.setdefault("LOGIN_RATE_PATH", f"{_tmp}/ratelimit.db")
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from models import Base
+
+
+@pytest.fixture(scope="session")
+def client():
+    import init_db
+    from main import app
+
+    # SQLite не понимает server_default 'true'/'false' как булевы значения
+    for table in Base.metadata.tables.values():
+        for column in table.columns:
+            default = column.server_default
+            if default is not None and getattr(default, "arg", None) in ("true", "false"):
+                default.arg = text("1" if default.arg == "true" else "0")
+    init_db.create_all()
+    init_db.seed()
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def login(client):
+    def do(email, password):
+        r = client.post("/users/login", json={"email": email, "password": password})
+        assert r.status_code == 200, r.text
+        return r.json()
+    return do
+
+
+@pytest.fixture
+def db(client):
+    from db import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
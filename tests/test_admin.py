@@ -0,0 +1,37 @@
+def _auth(tokens):
+    return {"Authorization": "Bearer " + tokens["access_token"]}
+
+
+def test_bulk_upsert_groups_by_flags(client, login):
+    admin = _auth(login("admin@example.com", "admin123"))
+    for code in ("bulk-a", "bulk-b"):
+        assert client.put("/admin/elements", headers=admin, json={"code": code}).status_code == 200
+    r = client.put("/admin/rules", headers=admin, json={"role": "user", "element": "bulk-a", "flags": {"read": True, "create": True}})
+    assert r.status_code == 200, r.text
+
+    items = [
+        # существующая строка: меняется только переданный флаг
+        {"role": "user", "element": "bulk-a", "flags": {"update": True}},
+        # новая строка с другим набором колонок — отдельная группа INSERT
+        {"role": "user", "element": "bulk-b", "flags": {"read": True, "read_all": True}},
+        {"role": "ghost", "element": "bulk-a", "flags": {"read": True}},
+        {"role": "user", "element": "missing", "flags": {"read": True}},
+        # повтор пары сливается с предыдущим, последний флаг побеждает
+        {"role": "user", "element": "bulk-b", "flags": {"read_all": False}},
+    ]
+    r = client.put("/admin/rules:bulk", headers=admin, json=items)
+    assert r.status_code == 200, r.text
+    results = r.json()["items"]
+    assert [x["status"] for x in results] == ["ok", "ok", "error", "error", "ok"]
+
+    a = results[0]["rule"]
+    assert (a["read"], a["create"], a["update"], a["read_all"]) == (True, True, True, False)
+    b = results[1]["rule"]
+    assert b == results[4]["rule"]
+    assert (b["read"], b["read_all"], b["create"]) == (True, False, False)
+
+
+def test_bulk_upsert_requires_rules_update(client, login):
+    user = _auth(login("user@example.com", "user123"))
+    r = client.put("/admin/rules:bulk", headers=user, json=[{"role": "user", "element": "objects", "flags": {"read_all": True}}])
+    assert r.status_code == 403
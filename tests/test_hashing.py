@@ -0,0 +1,72 @@
+import asyncio
+import threading
+
+import pytest
+
+from hashing import BcryptHasher, HashPool, Pbkdf2Hasher, PoolSaturated
+
+
+def _blocked(gate: threading.Event):
+    gate.wait(5)
+    return None, 0.0
+
+
+def test_cancelled_queued_job_releases_slot():
+    pool = HashPool("thread", workers=1, queue_size=1)
+    gate = threading.Event()
+    running = pool.submit(_blocked, gate)
+    queued = pool.submit(_blocked, gate)
+    with pytest.raises(PoolSaturated):
+        pool.submit(_blocked, gate)
+
+    assert queued.cancel()
+    assert pool.in_flight == 1
+    assert pool.cancelled == 1
+
+    # освободившееся место снова доступно
+    again = pool.submit(_blocked, gate)
+    gate.set()
+    running.result(timeout=5)
+    again.result(timeout=5)
+    assert pool.in_flight == 0
+
+
+def test_client_disconnect_in_async_handler_releases_slot():
+    pool = HashPool("thread", workers=1, queue_size=1)
+    gate = threading.Event()
+    running = pool.submit(_blocked, gate)
+
+    async def handler():
+        task = asyncio.ensure_future(asyncio.wrap_future(pool.submit(_blocked, gate)))
+        await asyncio.sleep(0)
+        # так Starlette отменяет обработчик, когда клиент отключился
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(handler())
+    assert pool.in_flight == 1
+    gate.set()
+    running.result(timeout=5)
+    assert pool.in_flight == 0
+    assert pool._slots.acquire(blocking=False) and pool._slots.acquire(blocking=False)
+
+
+@pytest.mark.parametrize("hasher, bad", [
+    (BcryptHasher(4), "$2b$garbage"),
+    (Pbkdf2Hasher(1000), "pbkdf2_sha256$1000$only-three"),
+    (Pbkdf2Hasher(1000), "pbkdf2_sha256$many$c2FsdA==$ZGlnZXN0"),
+    (Pbkdf2Hasher(1000), "pbkdf2_sha256$1000$not base64!$ZGlnZXN0"),
+])
+def test_malformed_hash_is_a_mismatch(hasher, bad):
+    assert hasher.verify(b"secret", bad) is False
+    # не должен бросать исключение
+    hasher.needs_rehash(bad)
+
+
+def test_pbkdf2_roundtrip():
+    hasher = Pbkdf2Hasher(1000)
+    stored = hasher.hash(b"secret")
+    assert hasher.verify(b"secret", stored)
+    assert not hasher.verify(b"wrong", stored)
+    assert not hasher.needs_rehash(stored)
@@ -0,0 +1,82 @@
+import json
+import time
+
+import permissions
+from invalidation import ORIGIN, PostgresBus
+from user_cache import CachedUser, principal_from_claims, user_cache
+
+
+def _event(version, origin="other-worker", **event):
+    return json.dumps({"kind": "rules", **event, "v": version, "origin": origin, "ts": time.time()})
+
+
+def _cached(user_id):
+    user_cache.put(CachedUser(user_id, True, (1,), time.monotonic() + 60))
+
+
+def test_contiguous_versions_apply_events():
+    bus = PostgresBus(eng=None)
+    bus.seen = 5
+    _cached(42)
+    _cached(43)
+    bus._handle(_event(6, kind="user", id=42))
+    assert user_cache.get(42) is None and user_cache.get(43) is not None
+    # своё сообщение уже применено при отправке
+    version = permissions.current_version()
+    bus._handle(_event(7, origin=ORIGIN))
+    assert permissions.current_version() == version
+    assert bus.seen == 7 and bus.full_reloads == 0
+
+
+def test_gap_triggers_full_reload():
+    bus = PostgresBus(eng=None)
+    bus.seen = 5
+    _cached(43)
+    issued_ms = int(time.time() * 1000) - 1000
+    version = permissions.current_version()
+    # версии 6 и 7 потеряны
+    bus._handle(_event(8, kind="user", id=42))
+    assert bus.full_reloads == 1 and bus.seen == 8
+    assert permissions.current_version() > version
+    assert user_cache.get(43) is None
+    # роли из токенов, выпущенных до сброса, больше не принимаются
+    assert principal_from_claims(43, [1], 0, issued_ms) is None
+
+
+class _Cursor:
+    def __init__(self, version):
+        self.version = version
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        pass
+
+    def fetchone(self):
+        return (self.version,)
+
+
+class _Conn:
+    # соединение psycopg2 в режиме LISTEN: счётчик версий и очередь уведомлений
+    def __init__(self, version):
+        self.version = version
+        self.notifies = []
+
+    def cursor(self):
+        return _Cursor(self.version)
+
+    def poll(self):
+        pass
+
+
+def test_version_check_catches_lost_messages():
+    bus = PostgresBus(eng=None)
+    bus.seen = 3
+    bus._check_version(_Conn(3))
+    assert bus.full_reloads == 0
+    bus._check_version(_Conn(5))
+    assert bus.full_reloads == 1 and bus.seen == 5
@@ -0,0 +1,40 @@
+import jwt
+import pytest
+
+from jwt_keys import KeyRing, generate, hmac_key
+
+
+def _decode(ring, token):
+    key = ring.verification_key(jwt.get_unverified_header(token).get("kid"))
+    if key is None:
+        return None
+    return jwt.decode(token, key.verifying, algorithms=[key.algorithm])
+
+
+@pytest.fixture
+def tokens(tmp_path):
+    hmac = hmac_key("s" * 32)
+    kid = generate(str(tmp_path), "EdDSA")
+    ring = KeyRing(hmac, str(tmp_path), accept_hmac=True)
+    eddsa = ring.verification_key(kid)
+    return {
+        "dir": str(tmp_path),
+        "hmac": hmac,
+        "no_kid": jwt.encode({"sub": "1"}, hmac.signing, algorithm="HS256"),
+        "hs256": jwt.encode({"sub": "1"}, hmac.signing, algorithm="HS256", headers={"kid": hmac.kid}),
+        "eddsa": jwt.encode({"sub": "1"}, eddsa.signing, algorithm="EdDSA", headers={"kid": kid}),
+    }
+
+
+def test_hs256_accepted_by_default(tokens):
+    ring = KeyRing(tokens["hmac"], tokens["dir"], accept_hmac=True)
+    for name in ("no_kid", "hs256", "eddsa"):
+        assert _decode(ring, tokens[name]) == {"sub": "1"}
+
+
+def test_hs256_rejected_when_disabled(tokens):
+    ring = KeyRing(tokens["hmac"], tokens["dir"], accept_hmac=False)
+    assert _decode(ring, tokens["no_kid"]) is None
+    assert _decode(ring, tokens["hs256"]) is None
+    assert _decode(ring, tokens["eddsa"]) == {"sub": "1"}
+    assert ring.signing_key().algorithm == "EdDSA"
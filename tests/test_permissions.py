@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+import permissions
+from permissions import CREATE, FLAGS, READ, READ_ALL, UPDATE, _build, get_matrix, invalidate
+
+
+def rule(role_id, element_id, *flags):
+    return SimpleNamespace(
+        role_id=role_id,
+        element_id=element_id,
+        **{f"{name}_permission": name in flags for name in FLAGS},
+    )
+
+
+ROLES = [(1, "admin"), (2, "user")]
+ELEMENTS = [(10, "objects"), (11, "rules")]
+
+
+def test_masks_merge_across_roles():
+    matrix = _build(1, ROLES, ELEMENTS, [rule(1, 10, "read", "read_all"), rule(2, 10, "read", "create")], [], [])
+    assert matrix.mask([2], 10) == READ | CREATE
+    assert matrix.mask([1, 2], 10) == READ | READ_ALL | CREATE
+    # нет правил на элемент — None, а не 0
+    assert matrix.mask([2], 11) is None
+    assert matrix.mask([], 10) is None
+
+
+def test_role_inheritance():
+    # 3 -> 2 -> 1: правила родителей действуют на наследников, но не наоборот
+    roles = ROLES + [(3, "editor")]
+    matrix = _build(1, roles, ELEMENTS, [rule(1, 10, "read"), rule(3, 10, "update")], [(2, 1), (3, 2)], [])
+    assert matrix.mask([3], 10) == READ | UPDATE
+    assert matrix.mask([2], 10) == READ
+    assert matrix.mask([1], 10) == READ
+    assert matrix.expand_roles([3]) == {1, 2, 3}
+    assert matrix.expand_roles([1]) == {1}
+
+
+def test_element_groups():
+    # правило на группу действует на её элементы и вложенные группы
+    elements = ELEMENTS + [(20, "content"), (21, "docs")]
+    groups = [(10, 20), (21, 20), (11, 21)]
+    matrix = _build(1, ROLES, elements, [rule(2, 20, "read"), rule(2, 10, "create")], [], groups)
+    assert matrix.mask([2], 10) == READ | CREATE
+    assert matrix.mask([2], 11) == READ
+    assert matrix.mask([2], 21) == READ
+
+
+def test_wildcard_and_cycles():
+    elements = ELEMENTS + [(99, "*")]
+    # цикл в данных не зацикливает построение
+    matrix = _build(1, ROLES, elements, [rule(1, 99, "read", "read_all")], [(1, 2), (2, 1)], [])
+    for element_id in (10, 11, 99):
+        assert matrix.mask([1], element_id) == READ | READ_ALL
+        assert matrix.mask([2], element_id) == READ | READ_ALL
+
+
+def test_inheritance_cycle_rejected(client, login):
+    admin = {"Authorization": "Bearer " + login("admin@example.com", "admin123")["access_token"]}
+    assert client.put("/admin/roles", headers=admin, json={"name": "cycle-a"}).status_code == 200
+    r = client.put("/admin/roles", headers=admin, json={"name": "cycle-b", "parents": ["cycle-a"]})
+    assert r.status_code == 200 and r.json()["parents"] == ["cycle-a"]
+    r = client.put("/admin/roles", headers=admin, json={"name": "cycle-a", "parents": ["cycle-b"]})
+    assert r.status_code == 422
+    r = client.put("/admin/roles", headers=admin, json={"name": "cycle-a", "parents": ["cycle-a"]})
+    assert r.status_code == 422
+
+    assert client.put("/admin/elements", headers=admin, json={"code": "group-a"}).status_code == 200
+    assert client.put("/admin/elements", headers=admin, json={"code": "group-b", "groups": ["group-a"]}).status_code == 200
+    r = client.put("/admin/elements", headers=admin, json={"code": "group-a", "groups": ["group-b"]})
+    assert r.status_code == 422
+
+
+def test_invalidate_bumps_version(db):
+    before = get_matrix(db)
+    assert get_matrix(db) is before
+    invalidate()
+    after = get_matrix(db)
+    assert after is not before
+    assert after.version == before.version + 1 == permissions.current_version()
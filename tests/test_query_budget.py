@@ -0,0 +1,62 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import profiling
+from profiling import ProfilingMiddleware, QueryBudgetExceeded, query_budget
+from user_cache import user_cache
+
+
+def _auth(tokens):
+    return {"Authorization": "Bearer " + tokens["access_token"]}
+
+
+def test_hot_paths_fit_budgets(client, login):
+    # QUERY_BUDGET_ENFORCE=1: превышение бюджета роняет запрос исключением
+    user_cache.clear()
+    tokens = login("user@example.com", "user123")
+    for _ in range(2):
+        r = client.get("/objects", headers=_auth(tokens))
+        assert r.status_code == 200, r.text
+        user_cache.clear()
+
+    r = client.post("/users/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert r.status_code == 200, r.text
+    tokens = r.json()
+
+    r = client.post("/users/logout", json={"refresh_token": tokens["refresh_token"]}, headers=_auth(tokens))
+    assert r.status_code == 200, r.text
+
+    routes = client.get("/metrics/routes", headers=_auth(login("admin@example.com", "admin123"))).json()
+    for key in ("GET /objects", "POST /users/login", "POST /users/refresh", "POST /users/logout"):
+        assert routes[key]["over_budget"] == 0
+        assert routes[key]["queries_max"] <= routes[key]["query_budget"]
+
+
+def _app():
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware)
+
+    @app.get("/heavy")
+    @query_budget(1)
+    def heavy():
+        profiling._current.get().queries += 5
+        return {"ok": True}
+
+    @app.get("/broken")
+    @query_budget(1)
+    def broken():
+        profiling._current.get().queries += 5
+        raise LookupError("настоящая ошибка")
+
+    return app
+
+
+def test_over_budget_raises():
+    with pytest.raises(QueryBudgetExceeded):
+        TestClient(_app()).get("/heavy")
+
+
+def test_handler_error_is_not_replaced():
+    with pytest.raises(LookupError):
+        TestClient(_app()).get("/broken")
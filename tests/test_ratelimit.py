@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+from ratelimit import (
+    LOCKED_UNTIL,
+    LOGIN_LOCKOUT_THRESHOLD,
+    LoginLimiter,
+    MemoryLimiterBackend,
+    SqliteLimiterBackend,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def limiter(request, tmp_path):
+    if request.param == "memory":
+        return LoginLimiter(MemoryLimiterBackend(shards=4, max_keys=1000))
+    return LoginLimiter(SqliteLimiterBackend(str(tmp_path / "limits.db")))
+
+
+def test_lockout_after_failures(limiter):
+    for _ in range(LOGIN_LOCKOUT_THRESHOLD):
+        assert limiter.check("10.0.0.1", "victim@example.com") == 0
+        limiter.failed("10.0.0.1", "victim@example.com")
+    assert limiter.check("10.0.0.2", "victim@example.com") > 0
+    assert limiter.locked == 1 and limiter.lockouts == 1
+    # другой аккаунт с того же адреса не заблокирован
+    assert limiter.check("10.0.0.1", "other@example.com") == 0
+
+    limiter.succeeded("10.0.0.2", "victim@example.com")
+    assert limiter.check("10.0.0.2", "victim@example.com") == 0
+
+
+def _lock(backend, key, now):
+    for _ in range(LOGIN_LOCKOUT_THRESHOLD):
+        backend.fail(key, 5, LOGIN_LOCKOUT_THRESHOLD, now)
+
+
+def test_eviction_keeps_lockouts():
+    backend = MemoryLimiterBackend(shards=1, max_keys=10)
+    now = time.time()
+    _lock(backend, "email:victim", now)
+    # атака заполняет сегмент неудачами по множеству ключей
+    for i in range(100):
+        backend.fail(f"email:spam-{i}", 5, LOGIN_LOCKOUT_THRESHOLD, now)
+    data = backend._shards[0][0]
+    assert len(data) <= 10 and backend.evictions > 0
+    assert data["email:victim"][LOCKED_UNTIL] > now
+    wait, locked = backend.acquire([("email:victim", 5, 1)], now)
+    assert wait > 0 and locked
+
+
+def test_full_shard_of_lockouts_fails_closed():
+    backend = MemoryLimiterBackend(shards=1, max_keys=3)
+    now = time.time()
+    for i in range(3):
+        _lock(backend, f"email:locked-{i}", now)
+    wait, locked = backend.acquire([("email:new", 5, 1)], now)
+    assert wait > 0 and locked
+    assert backend.overflows == 1
+    assert "email:new" not in backend._shards[0][0]
+    assert all(f"email:locked-{i}" in backend._shards[0][0] for i in range(3))
@@ -0,0 +1,44 @@
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import sessionmaker
+
+from db import ReplicaSet, RoutingSession
+
+
+def _sessions(tmp_path):
+    primary = create_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    engines = [create_engine(f"sqlite:///{tmp_path / f'r{i}.db'}") for i in (1, 2)]
+    replicas = ReplicaSet(engines, "round_robin")
+    return sessionmaker(bind=primary, class_=RoutingSession, replicas=replicas), primary, engines
+
+
+def test_session_reads_from_one_replica(tmp_path):
+    Session, primary, engines = _sessions(tmp_path)
+    db = Session()
+    try:
+        binds = {db.get_bind(clause=select(1)) for _ in range(3)}
+        assert len(binds) == 1 and binds <= set(engines)
+        for _ in range(3):
+            db.execute(select(1))
+        # одно соединение на сессию, а не по одному на каждую реплику
+        assert sum(e.pool.checkedout() for e in engines) == 1
+    finally:
+        db.close()
+
+    # следующая сессия может попасть на другую реплику
+    other = Session()
+    try:
+        assert other.get_bind(clause=select(1)) is not next(iter(binds))
+    finally:
+        other.close()
+
+
+def test_primary_routing(tmp_path):
+    Session, primary, engines = _sessions(tmp_path)
+    db = Session()
+    try:
+        assert db.get_bind(clause=select(1).execution_options(use_primary=True)) is primary
+        assert db.get_bind(clause=text("SELECT 1")) is primary
+        db.info["primary"] = True
+        assert db.get_bind(clause=select(1)) is primary
+    finally:
+        db.close()
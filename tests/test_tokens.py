@@ -0,0 +1,37 @@
+import pytest
+
+from tokens import MemoryTokenStore, SqliteTokenStore, SqlTokenStore
+
+
+@pytest.fixture(params=["sql", "memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sql":
+        return SqlTokenStore()
+    if request.param == "memory":
+        return MemoryTokenStore(shards=4)
+    return SqliteTokenStore(str(tmp_path / "tokens.db"))
+
+
+def test_refresh_token_is_single_use(store, db):
+    token = store.issue(db, 1)
+    assert store.take(db, token) == 1
+    db.commit()
+    # повторное предъявление уже погашенного токена
+    assert store.take(db, token) is None
+    assert store.take(db, "not-a-token") is None
+
+
+def test_revoke(store, db):
+    mine, other = store.issue(db, 1), store.issue(db, 2)
+    # чужой токен по user_id не отзывается
+    store.revoke(db, other, 1)
+    store.revoke(db, mine, 1)
+    db.commit()
+    assert store.take(db, mine) is None
+    assert store.take(db, other) == 2
+    db.commit()
+
+    tokens = [store.issue(db, 1) for _ in range(3)]
+    store.revoke_all(db, 1)
+    db.commit()
+    assert all(store.take(db, t) is None for t in tokens)
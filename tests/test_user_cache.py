@@ -0,0 +1,53 @@
+import time
+from types import SimpleNamespace
+
+from user_cache import CachedUser, UserCache
+
+
+def _entry(user_id, ttl=60.0):
+    return CachedUser(user_id, True, (1,), time.monotonic() + ttl)
+
+
+def test_ttl_expires_entries():
+    cache = UserCache(max_size=10, ttl=60)
+    cache.put(_entry(1, ttl=-1))
+    assert cache.get(1) is None
+    assert cache.expirations == 1 and cache.misses == 1
+
+    cache.put(_entry(2))
+    assert cache.get(2) is not None and cache.hits == 1
+
+
+def test_lru_eviction():
+    cache = UserCache(max_size=2, ttl=60)
+    cache.put(_entry(1))
+    cache.put(_entry(2))
+    cache.get(1)
+    cache.put(_entry(3))
+    assert cache.get(2) is None
+    assert cache.get(1) is not None and cache.get(3) is not None
+    assert cache.evictions == 1
+
+
+def test_put_after_invalidation_is_dropped():
+    cache = UserCache(max_size=10, ttl=60)
+    # запись прочитана из базы до инвалидации и не должна попасть в кэш
+    epoch = cache.epoch
+    cache.invalidate(1)
+    cache.put(_entry(1), epoch)
+    assert cache.get(1) is None
+
+    epoch = cache.epoch
+    cache.put(_entry(1), epoch)
+    assert cache.get(1) is not None
+    cache.clear()
+    assert cache.get(1) is None and cache.epoch == epoch + 1
+
+
+def test_mask_recomputed_for_new_matrix_version():
+    entry = _entry(1)
+    old = SimpleNamespace(version=1, mask=lambda roles, element_id: 1)
+    new = SimpleNamespace(version=2, mask=lambda roles, element_id: 3)
+    assert entry.mask_for(old, 10) == 1
+    assert entry.mask_for(new, 10) == 3
+    assert entry.mask_for(new, 10) == 3
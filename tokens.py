@@ -0,0 +1,396 @@
+import hashlib
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from db import SessionLocal
+from models import RefreshToken
+
+logger = logging.getLogger(__name__)
+
+REFRESH_TTL_DAYS = int(os.getenv("REFRESH_TTL_DAYS", "14"))
+# 0 — не запускать фоновую чистку (например, если её делает отдельный процесс)
+TOKEN_SWEEPER_ENABLED = os.getenv("TOKEN_SWEEPER_ENABLED", "1") == "1"
+TOKEN_SWEEP_INTERVAL_SECONDS = float(os.getenv("TOKEN_SWEEP_INTERVAL_SECONDS", "300"))
+TOKEN_SWEEP_BATCH = int(os.getenv("TOKEN_SWEEP_BATCH", "5000"))
+# где живут refresh-токены: sql (основная база) | memory (память процесса) | sqlite (отдельный файл)
+TOKEN_STORE = os.getenv("TOKEN_STORE", "sql")
+TOKEN_STORE_SHARDS = int(os.getenv("TOKEN_STORE_SHARDS", "64"))
+TOKEN_STORE_PATH = os.getenv("TOKEN_STORE_PATH", "tokens.db")
+
+
+# В базе лежит только sha256 токена: индекс фиксированного размера,
+# а утёкший дамп таблицы не даёт рабочих токенов.
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
+def _new_token(user_id: int) -> Tuple[str, object]:
+    token = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    stmt = insert(RefreshToken).values(
+        user_id=user_id,
+        token_hash=token_digest(token),
+        created_at=now,
+        expires_at=now + timedelta(days=REFRESH_TTL_DAYS),
+    )
+    return token, stmt
+
+
+def _take_stmt(token: str):
+    # удаление с RETURNING атомарно: из двух параллельных refresh одним
+    # токеном строку получит только один
+    return (
+        delete(RefreshToken)
+        .where(RefreshToken.token_hash == token_digest(token), RefreshToken.expires_at > datetime.utcnow())
+        .returning(RefreshToken.user_id)
+    )
+
+
+def _revoke_stmt(token: str, user_id: int):
+    return delete(RefreshToken).where(RefreshToken.token_hash == token_digest(token), RefreshToken.user_id == user_id)
+
+
+def _revoke_all_stmt(user_id: int):
+    return delete(RefreshToken).where(RefreshToken.user_id == user_id)
+
+
+def sweep_expired(db: Session, batch: int = TOKEN_SWEEP_BATCH) -> int:
+    # удаляем порциями с коммитом после каждой, чтобы не держать
+    # долгих блокировок и не раздувать одну транзакцию
+    total = 0
+    while True:
+        ids = select(RefreshToken.id).where(RefreshToken.expires_at <= datetime.utcnow()).limit(batch)
+        deleted = db.execute(delete(RefreshToken).where(RefreshToken.id.in_(ids))).rowcount
+        db.commit()
+        total += deleted
+        if deleted < batch:
+            return total
+
+
+class SqlTokenStore:
+    # токены в основной базе, в той же сессии, что и запрос
+    name = "sql"
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+
+    def issue(self, db: Session, user_id: int) -> str:
+        token, stmt = _new_token(user_id)
+        db.execute(stmt)
+        db.commit()
+        return token
+
+    def take(self, db: Session, token: str) -> Optional[int]:
+        # строка удаляется в транзакции запроса, коммит — вместе с выдачей
+        # нового токена или отзывом всех токенов пользователя
+        user_id = db.execute(_take_stmt(token)).scalar()
+        if user_id is None:
+            db.rollback()
+        return user_id
+
+    def revoke(self, db: Session, token: str, user_id: int) -> None:
+        db.execute(_revoke_stmt(token, user_id))
+        db.commit()
+
+    def revoke_all(self, db: Session, user_id: int) -> None:
+        db.execute(_revoke_all_stmt(user_id))
+        db.commit()
+
+    async def issue_async(self, db, user_id: int) -> str:
+        token, stmt = _new_token(user_id)
+        await db.execute(stmt)
+        await db.commit()
+        return token
+
+    async def take_async(self, db, token: str) -> Optional[int]:
+        user_id = (await db.execute(_take_stmt(token))).scalar()
+        if user_id is None:
+            await db.rollback()
+        return user_id
+
+    async def revoke_async(self, db, token: str, user_id: int) -> None:
+        await db.execute(_revoke_stmt(token, user_id))
+        await db.commit()
+
+    async def revoke_all_async(self, db, user_id: int) -> None:
+        await db.execute(_revoke_all_stmt(user_id))
+        await db.commit()
+
+    def sweep(self, batch: int = TOKEN_SWEEP_BATCH) -> int:
+        db = self.session_factory()
+        try:
+            return sweep_expired(db, batch)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def stats(self) -> Dict:
+        return {"backend": self.name}
+
+
+class MemoryTokenStore:
+    # токены в памяти процесса: переживают только до рестарта и не видны
+    # другим воркерам. Шарды по дайджесту — чтобы логины не стояли в одной блокировке.
+    name = "memory"
+
+    def __init__(self, shards: int = TOKEN_STORE_SHARDS):
+        self._shards = [({}, {}, threading.Lock()) for _ in range(shards)]
+
+    def _shard(self, digest: bytes):
+        return self._shards[int.from_bytes(digest[:4], "little") % len(self._shards)]
+
+    def issue(self, db, user_id: int) -> str:
+        token = secrets.token_urlsafe(32)
+        digest = token_digest(token)
+        expires_at = time.time() + REFRESH_TTL_DAYS * 86400
+        tokens, by_user, lock = self._shard(digest)
+        with lock:
+            tokens[digest] = (user_id, expires_at)
+            by_user.setdefault(user_id, set()).add(digest)
+        return token
+
+    def _pop(self, tokens: Dict, by_user: Dict, digest: bytes):
+        entry = tokens.pop(digest, None)
+        if entry is not None:
+            owned = by_user.get(entry[0])
+            if owned is not None:
+                owned.discard(digest)
+                if not owned:
+                    del by_user[entry[0]]
+        return entry
+
+    def take(self, db, token: str) -> Optional[int]:
+        digest = token_digest(token)
+        tokens, by_user, lock = self._shard(digest)
+        with lock:
+            entry = self._pop(tokens, by_user, digest)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[0]
+
+    def revoke(self, db, token: str, user_id: int) -> None:
+        digest = token_digest(token)
+        tokens, by_user, lock = self._shard(digest)
+        with lock:
+            entry = tokens.get(digest)
+            if entry is not None and entry[0] == user_id:
+                self._pop(tokens, by_user, digest)
+
+    def revoke_all(self, db, user_id: int) -> None:
+        for tokens, by_user, lock in self._shards:
+            with lock:
+                for digest in by_user.pop(user_id, ()):
+                    tokens.pop(digest, None)
+
+    # операции не блокируют надолго, так что в event loop их можно звать напрямую
+    async def issue_async(self, db, user_id: int) -> str:
+        return self.issue(db, user_id)
+
+    async def take_async(self, db, token: str) -> Optional[int]:
+        return self.take(db, token)
+
+    async def revoke_async(self, db, token: str, user_id: int) -> None:
+        self.revoke(db, token, user_id)
+
+    async def revoke_all_async(self, db, user_id: int) -> None:
+        self.revoke_all(db, user_id)
+
+    def sweep(self, batch: int = TOKEN_SWEEP_BATCH) -> int:
+        total = 0
+        for tokens, by_user, lock in self._shards:
+            now = time.time()
+            with lock:
+                expired = [d for d, (_, expires_at) in tokens.items() if expires_at <= now]
+                for digest in expired:
+                    self._pop(tokens, by_user, digest)
+            total += len(expired)
+        return total
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.name,
+            "shards": len(self._shards),
+            "tokens": sum(len(tokens) for tokens, _, _ in self._shards),
+        }
+
+
+class SqliteTokenStore:
+    # отдельный файл SQLite в режиме WAL: запись токенов не трогает основную
+    # базу. Файл общий для всех воркеров на одной машине.
+    name = "sqlite"
+
+    def __init__(self, path: str = TOKEN_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS refresh_tokens (
+                token_hash BLOB PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                expires_at REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS ix_refresh_tokens_user_id ON refresh_tokens (user_id);
+            CREATE INDEX IF NOT EXISTS ix_refresh_tokens_expires_at ON refresh_tokens (expires_at);
+            """
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # соединение sqlite3 нельзя делить между потоками
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            # в WAL режим NORMAL не теряет целостность, только последние
+            # транзакции при падении ОС
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _insert(self, conn: sqlite3.Connection, user_id: int) -> str:
+        token = secrets.token_urlsafe(32)
+        conn.execute(
+            "INSERT INTO refresh_tokens (token_hash, user_id, expires_at) VALUES (?, ?, ?)",
+            (token_digest(token), user_id, time.time() + REFRESH_TTL_DAYS * 86400),
+        )
+        return token
+
+    def issue(self, db, user_id: int) -> str:
+        return self._insert(self._conn(), user_id)
+
+    def take(self, db, token: str) -> Optional[int]:
+        row = self._conn().execute(
+            "DELETE FROM refresh_tokens WHERE token_hash = ? AND expires_at > ? RETURNING user_id",
+            (token_digest(token), time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def revoke(self, db, token: str, user_id: int) -> None:
+        self._conn().execute(
+            "DELETE FROM refresh_tokens WHERE token_hash = ? AND user_id = ?",
+            (token_digest(token), user_id),
+        )
+
+    def revoke_all(self, db, user_id: int) -> None:
+        self._conn().execute("DELETE FROM refresh_tokens WHERE user_id = ?", (user_id,))
+
+    # sqlite3 блокирует поток, поэтому из async-маршрутов — через пул потоков
+    async def issue_async(self, db, user_id: int) -> str:
+        return await run_in_threadpool(self.issue, db, user_id)
+
+    async def take_async(self, db, token: str) -> Optional[int]:
+        return await run_in_threadpool(self.take, db, token)
+
+    async def revoke_async(self, db, token: str, user_id: int) -> None:
+        await run_in_threadpool(self.revoke, db, token, user_id)
+
+    async def revoke_all_async(self, db, user_id: int) -> None:
+        await run_in_threadpool(self.revoke_all, db, user_id)
+
+    def sweep(self, batch: int = TOKEN_SWEEP_BATCH) -> int:
+        conn = self._conn()
+        total = 0
+        while True:
+            deleted = conn.execute(
+                "DELETE FROM refresh_tokens WHERE token_hash IN "
+                "(SELECT token_hash FROM refresh_tokens WHERE expires_at <= ? LIMIT ?)",
+                (time.time(), batch),
+            ).rowcount
+            total += deleted
+            if deleted < batch:
+                return total
+
+    def stats(self) -> Dict:
+        return {"backend": self.name, "path": self.path}
+
+
+def make_token_store(name: str):
+    if name == "sql":
+        return SqlTokenStore()
+    if name == "memory":
+        return MemoryTokenStore()
+    if name == "sqlite":
+        return SqliteTokenStore()
+    raise ValueError(f"unknown token store '{name}'")
+
+
+token_store = make_token_store(TOKEN_STORE)
+
+
+def issue_refresh_token(db: Session, user_id: int) -> str:
+    return token_store.issue(db, user_id)
+
+
+def take_refresh_token(db: Session, token: str) -> Optional[int]:
+    # погасить токен, не выдавая новый: сначала нужно убедиться, что пользователь активен
+    return token_store.take(db, token)
+
+
+def revoke_refresh_token(db: Session, token: str, user_id: int) -> None:
+    token_store.revoke(db, token, user_id)
+
+
+def revoke_all_refresh_tokens(db: Session, user_id: int) -> None:
+    token_store.revoke_all(db, user_id)
+
+
+async def issue_refresh_token_async(db, user_id: int) -> str:
+    return await token_store.issue_async(db, user_id)
+
+
+async def take_refresh_token_async(db, token: str) -> Optional[int]:
+    return await token_store.take_async(db, token)
+
+
+async def revoke_refresh_token_async(db, token: str, user_id: int) -> None:
+    await token_store.revoke_async(db, token, user_id)
+
+
+async def revoke_all_refresh_tokens_async(db, user_id: int) -> None:
+    await token_store.revoke_all_async(db, user_id)
+
+
+class TokenSweeper:
+    def __init__(self, store, interval: float = TOKEN_SWEEP_INTERVAL_SECONDS):
+        self.store = store
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.runs = 0
+        self.deleted = 0
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="token-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.deleted += self.store.sweep()
+                self.runs += 1
+            except Exception:
+                logger.exception("refresh token sweep failed")
+
+    def stats(self) -> dict:
+        return {"runs": self.runs, "deleted": self.deleted, "interval_seconds": self.interval}
+
+
+token_sweeper = TokenSweeper(token_store)
@@ -0,0 +1,220 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import User, UserRoles
+
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", "100000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+# должно быть не меньше времени жизни access-токена
+USER_CHANGES_RETENTION_SECONDS = float(os.getenv("USER_CHANGES_RETENTION_SECONDS", "3600"))
+
+
+class CachedUser:
+    __slots__ = ("id", "is_active", "role_ids", "masks", "expires_at")
+
+    def __init__(self, id: int, is_active: bool, role_ids: Tuple[int, ...], expires_at: float):
+        self.id = id
+        self.is_active = is_active
+        self.role_ids = role_ids
+        # element_id -> (версия матрицы, итоговая маска по всем ролям), считается лениво.
+        # Версия хранится с каждой маской: запись из потока со старой матрицей
+        # не выдаётся за актуальную, и блокировка не нужна
+        self.masks: Dict[int, Tuple[int, Optional[int]]] = {}
+        self.expires_at = expires_at
+
+    def mask_for(self, matrix, element_id: int) -> Optional[int]:
+        cached = self.masks.get(element_id)
+        if cached is not None and cached[0] == matrix.version:
+            return cached[1]
+        mask = matrix.mask(self.role_ids, element_id)
+        self.masks[element_id] = (matrix.version, mask)
+        return mask
+
+
+class UserCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[int, CachedUser]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        # растёт при каждой инвалидации: запись, прочитанная из базы до неё,
+        # в кэш уже не попадёт
+        self.epoch = 0
+
+    def get(self, user_id: int) -> Optional[CachedUser]:
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= time.monotonic():
+                del self._data[user_id]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(user_id)
+            self.hits += 1
+            return entry
+
+    def put(self, entry: CachedUser, epoch: Optional[int] = None) -> None:
+        with self._lock:
+            if epoch is not None and epoch != self.epoch:
+                return
+            self._data[entry.id] = entry
+            self._data.move_to_end(entry.id)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self.epoch += 1
+            if self._data.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self.epoch += 1
+            self.invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "tracked_changes": len(_changed_at),
+            "deactivated": len(_deactivated),
+        }
+
+
+user_cache = UserCache(USER_CACHE_MAX_SIZE, USER_CACHE_TTL_SECONDS)
+
+
+def _user_query(user_id: int):
+    # как и матрица прав, только с primary: запись живёт в кэше до TTL, и
+    # отстающая реплика вернула бы роли и is_active до изменения
+    return (
+        select(User.is_active, UserRoles.role_id)
+        .outerjoin(UserRoles, UserRoles.user_id == User.id)
+        .where(User.id == user_id)
+        .execution_options(use_primary=True)
+    )
+
+
+def _build(user_id: int, rows) -> Optional[CachedUser]:
+    if not rows:
+        return None
+    role_ids = tuple(sorted(r.role_id for r in rows if r.role_id is not None))
+    return CachedUser(user_id, bool(rows[0].is_active), role_ids, time.monotonic() + user_cache.ttl)
+
+
+def load_user(db: Session, user_id: int) -> Optional[CachedUser]:
+    return _build(user_id, db.execute(_user_query(user_id)).all())
+
+
+async def load_user_async(db, user_id: int) -> Optional[CachedUser]:
+    return _build(user_id, (await db.execute(_user_query(user_id))).all())
+
+
+def get_cached_user(db: Session, user_id: int) -> Optional[CachedUser]:
+    entry = user_cache.get(user_id)
+    if entry is None:
+        epoch = user_cache.epoch
+        entry = load_user(db, user_id)
+        if entry is not None:
+            user_cache.put(entry, epoch)
+    return entry
+
+
+async def get_cached_user_async(db, user_id: int) -> Optional[CachedUser]:
+    entry = user_cache.get(user_id)
+    if entry is None:
+        epoch = user_cache.epoch
+        entry = await load_user_async(db, user_id)
+        if entry is not None:
+            user_cache.put(entry, epoch)
+    return entry
+
+
+# Метки последних изменений пользователей (мс) и список деактивированных.
+# Stateless access-токен несёт метку на момент выпуска: если пользователь
+# менялся позже, токен считается устаревшим и идёт через базу.
+# Старые записи можно забывать: токены, выпущенные до них, уже истекли.
+_changes_lock = threading.Lock()
+_changed_at: Dict[int, int] = {}
+_deactivated: Dict[int, int] = {}
+_last_prune = 0.0
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+# Метки и список деактивированных есть только в памяти процесса: после старта
+# и после полного сброса кэшей (потерянные сообщения об изменениях) они неполны.
+# Роли из токенов, выпущенных раньше, не принимаются — такие токены идут через базу.
+_claims_trusted_since = _now_ms()
+
+
+def distrust_claims() -> None:
+    global _claims_trusted_since
+    _claims_trusted_since = _now_ms()
+
+
+def _prune(now_ms: int) -> None:
+    global _last_prune
+    if now_ms - _last_prune < 60_000:
+        return
+    _last_prune = now_ms
+    border = now_ms - int(USER_CHANGES_RETENTION_SECONDS * 1000)
+    for d in (_changed_at, _deactivated):
+        for uid in [uid for uid, ts in d.items() if ts < border]:
+            del d[uid]
+
+
+def change_stamp(user_id: int) -> int:
+    return _changed_at.get(user_id, 0)
+
+
+def is_deactivated(user_id: int) -> bool:
+    return user_id in _deactivated
+
+
+def principal_from_claims(user_id: int, role_ids, stamp: int, issued_at_ms: int) -> Optional[CachedUser]:
+    # iat с точностью до секунды: токен той же секунды тоже проверяем через базу
+    if issued_at_ms <= _claims_trusted_since or change_stamp(user_id) > stamp:
+        return None
+    epoch = user_cache.epoch
+    entry = user_cache.get(user_id)
+    if entry is None:
+        entry = CachedUser(user_id, True, tuple(role_ids), time.monotonic() + user_cache.ttl)
+        user_cache.put(entry, epoch)
+    return entry
+
+
+def invalidate_user(user_id: int, deactivated: bool = False) -> None:
+    now_ms = _now_ms()
+    with _changes_lock:
+        _changed_at[user_id] = now_ms
+        if deactivated:
+            _deactivated[user_id] = now_ms
+        _prune(now_ms)
+    user_cache.invalidate(user_id)
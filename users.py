@@ -1,8 +1,10 @@
 from sqlalchemy.orm import Session
 from typing import Optional
-import bcrypt
 from models import User, UserRoles, Roles
 from shemas import UserCreate, UserOut, UserLogin, UserUpdate
+from invalidation import user_changed
+from tokens import revoke_all_refresh_tokens
+from hashing import hash_password, check_password, needs_rehash, PoolSaturated
 
 
 def create_user(db: Session, user: UserCreate) -> Optional[UserOut]:
@@ -11,7 +13,7 @@ def create_user(db: Session, user: UserCreate) -> Optional[UserOut]:
     if existing_user:
         return None
 
-    password_hash = bcrypt.hashpw(user.password.encode(), bcrypt.gensalt()).decode()
+    password_hash = hash_password(user.password)
 
     new_user = User(name=user.name, password_hash=password_hash, email=email_norm)
     db.add(new_user)
@@ -27,6 +29,7 @@ def create_user(db: Session, user: UserCreate) -> Optional[UserOut]:
         if not exists:
             db.add(UserRoles(user_id=new_user.id, role_id=default_role.id))
             db.commit()
+            user_changed(new_user.id)
     return UserOut(
         id=new_user.id,
         name=new_user.name,
@@ -45,11 +48,17 @@ def authenticate_user(db: Session, user: UserLogin) -> Optional[UserOut]:
     if not existing_user.is_active:
         return None
 
-    if not bcrypt.checkpw(
-        user.password.encode(), existing_user.password_hash.encode("utf-8")
-    ):
+    if not check_password(user.password, existing_user.password_hash):
         return None
 
+    if needs_rehash(existing_user.password_hash):
+        # параметры хэша устарели — пересчитываем, пока пароль известен
+        try:
+            existing_user.password_hash = hash_password(user.password)
+            db.commit()
+        except PoolSaturated:
+            pass
+
     return UserOut(
         id=existing_user.id,
         name=existing_user.name,
@@ -77,11 +86,10 @@ def update_user(db: Session, user_id: int, data: UserUpdate) -> Optional[UserOut
         user.email = new_email
 
     if data.password is not None:
-        user.password_hash = bcrypt.hashpw(
-            data.password.encode(), bcrypt.gensalt()
-        ).decode()
+        user.password_hash = hash_password(data.password)
 
     db.commit()
+    user_changed(user_id)
     db.refresh(user)
 
     return UserOut(id=user.id, name=user.name, email=user.email, is_active=user.is_active)
@@ -94,7 +102,10 @@ def delete_user(db: Session, user_id: int) -> Optional[UserOut]:
         return None
 
     user.is_active = False
+    # удалённый пользователь выходит со всех устройств
+    revoke_all_refresh_tokens(db, user_id)
     db.commit()
+    user_changed(user_id, deactivated=True)
 
     return UserOut(
         id=user.id,
@@ -0,0 +1,114 @@
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import User, UserRoles, Roles
+from shemas import UserCreate, UserOut, UserLogin, UserUpdate
+from invalidation import user_changed_async
+from tokens import revoke_all_refresh_tokens_async
+from hashing import hash_password_async, check_password_async, needs_rehash, PoolSaturated
+
+
+async def create_user(db: AsyncSession, user: UserCreate) -> Optional[UserOut]:
+    email_norm = user.email.lower()
+    existing_user = await db.scalar(select(User.id).where(User.email == email_norm))
+    if existing_user:
+        return None
+
+    password_hash = await hash_password_async(user.password)
+
+    new_user = User(name=user.name, password_hash=password_hash, email=email_norm)
+    db.add(new_user)
+    await db.commit()
+    await db.refresh(new_user)
+
+    default_role = await db.scalar(select(Roles).where(Roles.name == "user"))
+    if default_role:
+        exists = await db.scalar(select(UserRoles).where(
+            UserRoles.user_id == new_user.id,
+            UserRoles.role_id == default_role.id
+        ))
+        if not exists:
+            db.add(UserRoles(user_id=new_user.id, role_id=default_role.id))
+            await db.commit()
+            await user_changed_async(new_user.id)
+    return UserOut(
+        id=new_user.id,
+        name=new_user.name,
+        email=new_user.email,
+        is_active=new_user.is_active,
+    )
+
+
+async def authenticate_user(db: AsyncSession, user: UserLogin) -> Optional[UserOut]:
+    email_norm = user.email.lower()
+    existing_user = await db.scalar(select(User).where(User.email == email_norm))
+
+    if existing_user is None:
+        return None
+
+    if not existing_user.is_active:
+        return None
+
+    if not await check_password_async(user.password, existing_user.password_hash):
+        return None
+
+    if needs_rehash(existing_user.password_hash):
+        try:
+            existing_user.password_hash = await hash_password_async(user.password)
+            await db.commit()
+        except PoolSaturated:
+            pass
+
+    return UserOut(
+        id=existing_user.id,
+        name=existing_user.name,
+        email=existing_user.email,
+        is_active=existing_user.is_active,
+    )
+
+
+async def update_user(db: AsyncSession, user_id: int, data: UserUpdate) -> Optional[UserOut]:
+    user = await db.scalar(select(User).where(User.id == user_id))
+    if not user:
+        return None
+
+    if data.name is not None:
+        user.name = data.name
+
+    if data.email is not None:
+        new_email = data.email.lower()
+        exists = await db.scalar(select(User.id).where(
+            User.email == new_email, User.id != user_id
+        ))
+        if exists:
+            raise ValueError("email_already_exists")
+        user.email = new_email
+
+    if data.password is not None:
+        user.password_hash = await hash_password_async(data.password)
+
+    await db.commit()
+    await user_changed_async(user_id)
+    await db.refresh(user)
+
+    return UserOut(id=user.id, name=user.name, email=user.email, is_active=user.is_active)
+
+
+async def delete_user(db: AsyncSession, user_id: int) -> Optional[UserOut]:
+    user = await db.scalar(select(User).where(User.id == user_id))
+    if not user:
+        return None
+
+    user.is_active = False
+    # удалённый пользователь выходит со всех устройств
+    await revoke_all_refresh_tokens_async(db, user_id)
+    await db.commit()
+    await user_changed_async(user_id, deactivated=True)
+
+    return UserOut(
+        id=user.id,
+        name=user.name,
+        email=user.email,
+        is_active=user.is_active,
+    )